@@ -0,0 +1,64 @@
+import functools
+import os
+import tempfile
+
+import aerosandbox as asb
+import numpy as np
+
+### On-disk store of precomputed airfoil data, shared read-only (memory-mapped) by every worker process.
+# Each airfoil has a <name>.npy file: an Nx2 array of its coordinates.
+# Run `python airfoils.py` to (re)build the store; anything missing is also built on first use.
+AIRFOIL_STORE_DIRECTORY = os.environ.get(
+    "AIRFOIL_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "airfoil_data"),
+)
+AIRFOIL_NAMES = ["naca0008", "e216"]
+
+
+def _path(filename):
+    return os.path.join(AIRFOIL_STORE_DIRECTORY, filename)
+
+
+def _save_atomically(filename, array):
+    # Several workers may build the same missing entry at once; readers must never see a partial file.
+    os.makedirs(AIRFOIL_STORE_DIRECTORY, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=AIRFOIL_STORE_DIRECTORY, suffix=".npy", delete=False
+    ) as f:
+        np.save(f, array)
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, _path(filename))
+
+
+def _load(filename, build):
+    try:
+        return np.load(_path(filename), mmap_mode="r")
+    except FileNotFoundError:
+        pass
+    _save_atomically(filename, build())
+    return np.load(_path(filename), mmap_mode="r")
+
+
+@functools.lru_cache(maxsize=None)
+def get_airfoil(name) -> asb.Airfoil:
+    """
+    Returns the named airfoil, built from the store's memory-mapped coordinates on first use.
+    """
+    coordinates = _load(
+        f"{name}.npy",
+        build=lambda: asb.Airfoil(name=name).coordinates,
+    )
+    return asb.Airfoil(name=name, coordinates=coordinates)
+
+
+def precompute(names=AIRFOIL_NAMES):
+    get_airfoil.cache_clear()
+    for name in names:
+        if os.path.exists(_path(f"{name}.npy")):
+            os.remove(_path(f"{name}.npy"))
+        get_airfoil(name)
+        print(f"Stored {name} in {AIRFOIL_STORE_DIRECTORY}")
+
+
+if __name__ == "__main__":
+    precompute()
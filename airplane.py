@@ -1,14 +1,54 @@
 import aerosandbox as asb
 import numpy as np
 import copy
+import functools
+import numbers
 
-naca0008 = asb.Airfoil(name="naca0008")
-e216 = asb.Airfoil(name="e216")
+from airfoils import get_airfoil
+
+### Boom layouts, as fractions of the half-span. The original Solar1 layouts are kept for 1 to 3 booms; any other
+# count puts each boom under the centroid of an equal share of an elliptic lift distribution, which those three
+# match to within 0.03.
+BOOM_LOCATIONS = {1: [0.0], 2: [-0.40, 0.40], 3: [-0.57, 0.0, 0.57]}
+HSTAB_SPAN = 2.867  # m; booms closer than this would have overlapping tails
 
 
 def make_airplane(
     n_booms=1,
     wing_span=43,
+    hstab_twist_angle=-4,
+    fuse_resolution=10,
+) -> asb.Airplane:
+    """
+    Builds the Solar1 airplane. `hstab_twist_angle` is the horizontal stabilizer's incidence, in degrees, and
+    `fuse_resolution` is the number of fuselage stations along the nose and along the taper (see `build_fuse`).
+
+    Numeric inputs are memoized: repeat calls with the same inputs return the same Airplane object, so callers must
+    treat it as read-only (copy it before modifying). Symbolic inputs (e.g. Opti variables) always build a fresh
+    airplane.
+    """
+    if all(
+        isinstance(value, numbers.Real)
+        for value in [n_booms, wing_span, hstab_twist_angle]
+    ):
+        return _make_airplane_cached(
+            n_booms, wing_span, hstab_twist_angle, fuse_resolution
+        )
+    return _build_airplane(n_booms, wing_span, hstab_twist_angle, fuse_resolution)
+
+
+@functools.lru_cache(maxsize=64)
+def _make_airplane_cached(
+    n_booms, wing_span, hstab_twist_angle, fuse_resolution
+) -> asb.Airplane:
+    return _build_airplane(n_booms, wing_span, hstab_twist_angle, fuse_resolution)
+
+
+def _build_airplane(
+    n_booms,
+    wing_span,
+    hstab_twist_angle=-4,
+    fuse_resolution=10,
 ) -> asb.Airplane:
 
     # boom length
@@ -20,14 +60,17 @@ def make_airplane(
     wing_x_quarter_chord = -0.1
 
     # hstab
-    hstab_span = 2.867
+    hstab_span = HSTAB_SPAN
     hstab_chord = 1.085
-    hstab_twist_angle = -4
 
     # vstab
     vstab_span = 2.397
     vstab_chord = 1.134
 
+    # airfoils, loaded from the shared airfoil store on first use
+    naca0008 = get_airfoil("naca0008")
+    e216 = get_airfoil("e216")
+
     wing = asb.Wing(
         name="Main Wing",
         # x_le=-0.05 * wing_root_chord,  # Coordinates of the wing's leading edge # TODO make this a free parameter?
@@ -63,7 +106,7 @@ def make_airplane(
                 # Coordinates of the XSec's leading edge, relative to the wing's leading edge.
                 xyz_le=[0, 0, 0],
                 chord=hstab_chord,
-                twist=hstab_twist_angle,  # degrees # TODO fix
+                twist=hstab_twist_angle,  # degrees
                 airfoil=naca0008,  # Airfoils are blended between a given XSec and the next one.
                 control_surface_type="symmetric",
                 # Flap # Control surfaces are applied between a given XSec and the next one.
@@ -73,7 +116,7 @@ def make_airplane(
             asb.WingXSec(  # Tip
                 xyz_le=[0, hstab_span / 2, 0],
                 chord=hstab_chord,
-                twist=hstab_twist_angle,  # TODO fix
+                twist=hstab_twist_angle,
                 airfoil=naca0008,
             ),
         ],
@@ -121,67 +164,25 @@ def make_airplane(
         boom_diameter=0.2,
         wing_x_quarter_chord=wing_x_quarter_chord,
         wing_root_chord=wing_root_chord,
+        resolution=fuse_resolution,
     )
 
     # Assemble the airplane
-    fuses = []
-    hstabs = []
-    vstabs = []
-    if n_booms == 1:
-        fuses.append(fuse)
-        hstabs.append(hstab)
-        vstabs.append(vstab)
-    elif n_booms == 2:
-        boom_location = 0.40  # as a fraction of the half-span
-        left_coordinates = [0, -wing_span / 2 * boom_location, 0]
-        right_coordinates = [0, wing_span / 2 * boom_location, 0]
-
-        left_fuse_clone = copy.deepcopy(fuse)
-        right_fuse_clone = copy.deepcopy(fuse)
-        left_fuse = left_fuse_clone.translate(left_coordinates)
-        right_fuse = right_fuse_clone.translate(right_coordinates)
-        fuses.extend([left_fuse, right_fuse])
-
-        left_hstab_clone = copy.deepcopy(hstab)
-        right_hstab_clone = copy.deepcopy(hstab)
-        left_hstab = left_hstab_clone.translate(left_coordinates)
-        right_hstab = right_hstab_clone.translate(right_coordinates)
-        hstabs.extend([left_hstab, right_hstab])
-
-        left_vstab_clone = copy.deepcopy(vstab)
-        right_vstab_clone = copy.deepcopy(vstab)
-        left_vstab = left_vstab_clone.translate(left_coordinates)
-        right_vstab = right_vstab_clone.translate(right_coordinates)
-        vstabs.extend([left_vstab, right_vstab])
-
-    elif n_booms == 3:
-        boom_location = 0.57  # as a fraction of the half-span
-        left_coordinates = [0, -wing_span / 2 * boom_location, 0]
-        right_coordinates = [0, wing_span / 2 * boom_location, 0]
-
-        left_fuse_clone = copy.deepcopy(fuse)
-        center_fuse = copy.deepcopy(fuse)
-        right_fuse_clone = copy.deepcopy(fuse)
-        left_fuse = left_fuse_clone.translate(left_coordinates)
-        right_fuse = right_fuse_clone.translate(right_coordinates)
-        fuses.extend([left_fuse, center_fuse, right_fuse])
-
-        left_hstab_clone = copy.deepcopy(hstab)
-        center_hstab = copy.deepcopy(hstab)
-        right_hstab_clone = copy.deepcopy(hstab)
-        left_hstab = left_hstab_clone.translate(left_coordinates)
-        right_hstab = right_hstab_clone.translate(right_coordinates)
-        hstabs.extend([left_hstab, center_hstab, right_hstab])
-
-        left_vstab_clone = copy.deepcopy(vstab)
-        center_vstab = copy.deepcopy(vstab)
-        right_vstab_clone = copy.deepcopy(vstab)
-        left_vstab = left_vstab_clone.translate(left_coordinates)
-        right_vstab = right_vstab_clone.translate(right_coordinates)
-        vstabs.extend([left_vstab, center_vstab, right_vstab])
+    locations = boom_locations(n_booms, wing_span)
 
-    else:
-        raise ValueError("Bad value of n_booms!")
+    # Each boom is a translated instance of the same fuselage/hstab/vstab. `translate()` only copies the xsec
+    # list, so the instances share everything else (airfoils, etc.) and the centered boom is the template itself.
+    def place(component, boom_location):
+        if boom_location == 0:
+            return component
+        offset = [0, wing_span / 2 * boom_location, 0]
+        if isinstance(component, asb.Fuselage) and isinstance(wing_span, numbers.Real):
+            return translate_fuse(component, offset)
+        return component.translate(offset)
+
+    fuses = [place(fuse, loc) for loc in locations]
+    hstabs = [place(hstab, loc) for loc in locations]
+    vstabs = [place(vstab, loc) for loc in locations]
 
     airplane = asb.Airplane(
         name="Solar1",
@@ -193,9 +194,103 @@ def make_airplane(
         fuselages=fuses,
     )
 
+    # The same layout as templates and offsets, so that meshing and drawing can work on each distinct component
+    # once (see `instances`)
+    if isinstance(wing_span, numbers.Real):
+        offsets = np.array([[0, wing_span / 2 * loc, 0] for loc in locations])
+        airplane.instances = {
+            "wings": [(wing, np.zeros((1, 3))), (hstab, offsets), (vstab, offsets)],
+            "fuselages": [(fuse, offsets)],
+        }
+
     return airplane
 
 
+def boom_locations(n_booms, wing_span=None) -> list:
+    """
+    Returns where each of `n_booms` booms goes, as a fraction of the half-span, from left to right. The layout is
+    exactly symmetric about the centerline. Raises a ValueError if `n_booms` is not a positive integer, or if, at a
+    numeric `wing_span`, the tails of neighboring booms would overlap.
+    """
+    if not (
+        isinstance(n_booms, numbers.Real) and n_booms == int(n_booms) and n_booms >= 1
+    ):
+        raise ValueError(f"Bad value of n_booms: {n_booms}")
+    n_booms = int(n_booms)
+
+    if n_booms in BOOM_LOCATIONS:
+        locations = BOOM_LOCATIONS[n_booms]
+    else:
+        # With y = sin(theta), the elliptic lift from the left tip to y is (2 theta + sin(2 theta)) / (2 pi) of the
+        # total; split it into equal shares and take the centroid of each
+        theta = np.linspace(-np.pi / 2, np.pi / 2, 10001)
+        edges = np.sin(
+            np.interp(
+                np.linspace(0, 1, n_booms + 1),
+                (2 * theta + np.sin(2 * theta)) / (2 * np.pi) + 0.5,
+                theta,
+            )
+        )
+        centroids = 2 * n_booms * -np.diff((1 - edges**2) ** 1.5) / (3 * np.pi)
+        locations = ((centroids - centroids[::-1]) / 2).tolist()  # Exactly symmetric
+
+    if isinstance(wing_span, numbers.Real) and n_booms > 1:
+        spacing = wing_span / 2 * np.min(np.diff(locations))
+        if spacing < HSTAB_SPAN:
+            raise ValueError(
+                f"Bad value of n_booms: {n_booms} booms are {spacing:.2f} m apart on a "
+                f"{wing_span} m span, closer than their {HSTAB_SPAN} m tails are wide."
+            )
+    return locations
+
+
+def min_wing_span(n_booms) -> float:
+    """
+    The smallest wing span [m] at which the tails of `n_booms` booms do not overlap (see `boom_locations`).
+    """
+    locations = boom_locations(n_booms)
+    if len(locations) < 2:
+        return 0.0
+    return float(2 * HSTAB_SPAN / np.min(np.diff(locations)))
+
+
+def instances(airplane, components="wings") -> list:
+    """
+    Returns the airplane's "wings" or "fuselages" as (template, offsets) pairs: each distinct component, and the
+    (n, 3) translations at which it is placed, in the same order as the airplane lists them. Airplanes that were not
+    built by make_airplane (or whose components were changed since) get one instance of each component.
+
+    An instance of a symmetric template is whole: both its halves, about its offset. The airplane's own translated
+    copies of a symmetric wing are mirrored about the centerline instead, so each copy's mirror half lands on the
+    opposite boom; with symmetric boom layouts, both cover exactly the same surfaces.
+    """
+    expanded = getattr(airplane, components)
+    pairs = getattr(airplane, "instances", {}).get(components)
+    if pairs is None or sum(len(offsets) for _, offsets in pairs) != len(expanded):
+        return [(component, np.zeros((1, 3))) for component in expanded]
+    return pairs
+
+
+def translate_fuse(fuse, xyz):
+    """
+    Same as `fuse.translate(xyz)` for a numeric `xyz`, with all stations offset in one NumPy operation.
+    """
+    centers = np.stack([xsec.xyz_c for xsec in fuse.xsecs]) + np.asarray(xyz, dtype=float)
+    new_fuse = copy.copy(fuse)
+    new_fuse.xsecs = [
+        _replace(xsec, xyz_c=xyz_c) for xsec, xyz_c in zip(fuse.xsecs, centers)
+    ]
+    return new_fuse
+
+
+def _replace(xsec, **attributes):
+    # A shallow copy with some attributes replaced: copy.copy() without its generic dispatch, which would otherwise
+    # dominate at hundreds of stations
+    new_xsec = object.__new__(type(xsec))
+    new_xsec.__dict__.update(xsec.__dict__, **attributes)
+    return new_xsec
+
+
 def build_fuse(
     boom_length,
     nose_length,
@@ -203,69 +298,53 @@ def build_fuse(
     boom_diameter,
     wing_x_quarter_chord,
     wing_root_chord,
+    resolution=10,
 ):
+    """
+    Builds one boom's fuselage: a rounded nose, a blended taper down to the boom diameter, and a straight tail boom.
+    `resolution` is the number of stations along the nose and along the taper (each); all stations are computed
+    at once in NumPy.
+    """
     blend = lambda x: (1 - np.cos(np.pi * x)) / 2
-    fuse_x_c = []
-    fuse_z_c = []
-    fuse_radius = []
-    fuse_resolution = 10
-    # Nose geometry
-    fuse_nose_theta = np.linspace(0, np.pi / 2, fuse_resolution)
-    fuse_x_c.extend(
-        [
-            (wing_x_quarter_chord - wing_root_chord / 4) - nose_length * np.cos(theta)
-            for theta in fuse_nose_theta
-        ]
-    )
-    fuse_z_c.extend([-fuse_diameter / 2] * fuse_resolution)
-    fuse_radius.extend([fuse_diameter / 2 * np.sin(theta) for theta in fuse_nose_theta])
-    # Taper
-    fuse_taper_x_nondim = np.linspace(0, 1, fuse_resolution)
-    fuse_x_c.extend(
-        [
-            0.0 * boom_length + (0.6 - 0.0) * boom_length * x_nd
-            for x_nd in fuse_taper_x_nondim
-        ]
-    )
-    fuse_z_c.extend(
+    nose_theta = np.linspace(0, np.pi / 2, resolution)
+    taper_x_nondim = np.linspace(0, 1, resolution)
+    straight_x_nondim = np.linspace(0, 1, 4)[1:]
+
+    fuse_x_c = np.concatenate(
         [
-            -fuse_diameter / 2 * blend(1 - x_nd) - boom_diameter / 2 * blend(x_nd)
-            for x_nd in fuse_taper_x_nondim
+            (wing_x_quarter_chord - wing_root_chord / 4) - nose_length * np.cos(nose_theta),
+            0.6 * boom_length * taper_x_nondim,
+            0.6 * boom_length + (1 - 0.6) * boom_length * straight_x_nondim,
         ]
     )
-    fuse_radius.extend(
+    fuse_z_c = np.concatenate(
         [
-            fuse_diameter / 2 * blend(1 - x_nd) + boom_diameter / 2 * blend(x_nd)
-            for x_nd in fuse_taper_x_nondim
+            np.full(resolution, -fuse_diameter / 2),
+            -fuse_diameter / 2 * blend(1 - taper_x_nondim)
+            - boom_diameter / 2 * blend(taper_x_nondim),
+            np.full(len(straight_x_nondim), -boom_diameter / 2),
         ]
     )
-    # Tail
-    # fuse_tail_x_nondim = np.linspace(0, 1, fuse_resolution)[1:]
-    # fuse_x_c.extend([
-    #     0.9 * boom_length + (1 - 0.9) * boom_length * x_nd for x_nd in fuse_taper_x_nondim
-    # ])
-    # fuse_z_c.extend([
-    #     -boom_diameter / 2 * blend(1 - x_nd) for x_nd in fuse_taper_x_nondim
-    # ])
-    # fuse_radius.extend([
-    #     boom_diameter / 2 * blend(1 - x_nd) for x_nd in fuse_taper_x_nondim
-    # ])
-    fuse_straight_resolution = 4
-    fuse_x_c.extend(
+    fuse_radius = np.concatenate(
         [
-            0.6 * boom_length + (1 - 0.6) * boom_length * x_nd
-            for x_nd in np.linspace(0, 1, fuse_straight_resolution)[1:]
+            fuse_diameter / 2 * np.sin(nose_theta),
+            fuse_diameter / 2 * blend(1 - taper_x_nondim)
+            + boom_diameter / 2 * blend(taper_x_nondim),
+            np.full(len(straight_x_nondim), boom_diameter / 2),
         ]
     )
-    fuse_z_c.extend([-boom_diameter / 2] * (fuse_straight_resolution - 1))
-    fuse_radius.extend([boom_diameter / 2] * (fuse_straight_resolution - 1))
-
-    fuse = asb.Fuselage(
-        name="Fuselage",
-        xsecs=[
-            asb.FuselageXSec(xyz_c=[fuse_x_c[i], 0, fuse_z_c[i]], radius=fuse_radius[i])
-            for i in range(len(fuse_x_c))
-        ],
-    )
+
+    # Every station is a copy of one constructed FuselageXSec with its own center and size, much as
+    # FuselageXSec.translate() makes copies; the constructor's input handling would dominate at hundreds of stations.
+    template = asb.FuselageXSec(xyz_c=[0, 0, 0], radius=0)
+    xsecs = [
+        _replace(template, xyz_c=xyz_c, width=diameter, height=diameter)
+        for xyz_c, diameter in zip(
+            np.stack([fuse_x_c, np.zeros_like(fuse_x_c), fuse_z_c], axis=1),
+            (2 * fuse_radius).tolist(),
+        )
+    ]
+
+    fuse = asb.Fuselage(name="Fuselage", xsecs=xsecs)
 
     return fuse
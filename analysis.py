@@ -0,0 +1,216 @@
+import aerosandbox as asb
+import numpy as np
+
+from vlm import FactoredVortexLatticeMethod
+
+
+def make_op_point(
+    ms_velocity,
+    angle_of_attack,
+    angle_of_sideslip,
+    altitude=0,
+):
+    return asb.OperatingPoint(
+        atmosphere=asb.Atmosphere(altitude=altitude),  # altitude, m
+        velocity=ms_velocity,  # airspeed, m/s
+        alpha=angle_of_attack,  # angle of attack, deg
+        beta=angle_of_sideslip,  # sideslip angle, deg
+        p=0,  # x-axis rotation rate, rad/sec
+        q=0,  # y-axis rotation rate, rad/sec
+        r=0,  # z-axis rotation rate, rad/sec
+    )
+
+
+### Panel counts per wing section at fidelity 1, the solvers' defaults; other fidelities scale these.
+PANEL_RESOLUTION = {
+    "vlm": {"spanwise_resolution": 10, "chordwise_resolution": 10},
+    "ll": {"spanwise_resolution": 4},
+}
+FIDELITY_LEVELS = [0.25, 0.5, 1, 2]  # Preview first, then refine in this order
+
+
+def panel_resolution(method, fidelity=1):
+    """
+    Returns the panel-count arguments for `method` ("vlm" or "ll") at the given fidelity.
+    """
+    return {
+        name: max(1, round(count * fidelity))
+        for name, count in PANEL_RESOLUTION[method].items()
+    }
+
+
+def reference_point(my_airplane):
+    # Moments are taken about the main wing's 35%-chord aerodynamic center
+    return [my_airplane.wings[0].aerodynamic_center(chord_fraction=0.35)[0], 0, 0]
+
+
+# Analysis type: Vortex Lattice Method
+def analyse_vlm(
+    my_airplane,
+    ms_velocity,
+    angle_of_attack,
+    angle_of_sideslip,
+    fidelity=1,
+    altitude=0,
+    report_assembled=lambda analysis: None,
+):
+
+    op_point = make_op_point(ms_velocity, angle_of_attack, angle_of_sideslip, altitude)
+
+    # The influence matrix only depends on the geometry, so a repeat geometry (any alpha) skips straight to the
+    # back-substitution; see vlm.py
+    analysis = FactoredVortexLatticeMethod(
+        airplane=my_airplane,
+        op_point=op_point,
+        xyz_ref=reference_point(my_airplane),
+        **panel_resolution("vlm", fidelity),
+    )
+    analysis.factor()
+    report_assembled(analysis)  # Meshed, and the influence matrix assembled and factored; the solve is next
+    result = analysis.run()
+
+    return (analysis, result)
+
+
+# Analysis type: LiftingLine
+def analyse_ll(
+    my_airplane,
+    ms_velocity,
+    angle_of_attack,
+    angle_of_sideslip,
+    fidelity=1,
+    altitude=0,
+):
+
+    op_point = make_op_point(ms_velocity, angle_of_attack, angle_of_sideslip, altitude)
+
+    analysis = asb.LiftingLine(
+        airplane=my_airplane,
+        op_point=op_point,
+        xyz_ref=reference_point(my_airplane),
+        **panel_resolution("ll", fidelity),
+    )
+    result = analysis.run()
+
+    return (analysis, result)
+
+
+def summarize_performance(result):
+    """
+    Extracts CL, CD, and L/D from an analysis result as plain floats. Returns None if the solution is not finite
+    (e.g., a stalled flight condition).
+    """
+    performance = {
+        "CL": float(result["CL"]),
+        "CD": float(result["CD"]),
+        "L/D": float(result["CL"] / result["CD"]),
+    }
+    if not np.all(np.isfinite(list(performance.values()))):
+        return None
+    return performance
+
+
+def panel_outputs(analysis) -> dict:
+    """
+    Returns the per-panel arrays of a solved LL or VLM analysis: where each panel's bound vortex is, its strength,
+    the force on the panel [N, geometry axes], and which of the airplane's wings it is on; along with the lift
+    direction [geometry axes] and dynamic pressure [Pa] of the operating point, which loads.py needs to reduce them.
+
+    LL does not keep per-panel forces, so they are computed here by Kutta-Joukowski, rho * Gamma * (V x l), from the
+    local velocity at each bound vortex (without the airfoils' profile drag), in one vectorized pass.
+    """
+    vortex_strengths = np.ravel(analysis.vortex_strengths)
+    if hasattr(analysis, "forces_geometry"):
+        forces_geometry = analysis.forces_geometry
+    else:
+        forces_geometry = (
+            analysis.op_point.atmosphere.density()
+            * vortex_strengths[:, None]
+            * np.cross(
+                analysis.get_velocity_at_points(analysis.vortex_centers),
+                analysis.vortex_bound_leg,
+            )
+        )
+
+    # Both solvers mesh the wings in order, each into (sections x spanwise resolution) strips of chordwise panels,
+    # mirrored if the wing is symmetric
+    panels_per_wing = [
+        (len(wing.xsecs) - 1)
+        * (2 if wing.symmetric else 1)
+        * analysis.spanwise_resolution
+        * getattr(analysis, "chordwise_resolution", 1)
+        for wing in analysis.airplane.wings
+    ]
+    outputs = {
+        "vortex_centers": analysis.vortex_centers,
+        "vortex_bound_leg": analysis.vortex_bound_leg,
+        "areas": analysis.areas,
+        "vortex_strengths": vortex_strengths,
+        "forces_geometry": forces_geometry,
+        "lift_direction": np.array(
+            analysis.op_point.convert_axes(
+                0, 0, -1, from_axes="wind", to_axes="geometry"
+            ),
+            dtype=float,
+        ),
+        "dynamic_pressure": np.array(analysis.op_point.dynamic_pressure(), dtype=float),
+    }
+    if sum(panels_per_wing) == len(vortex_strengths):
+        outputs["wing_indices"] = np.repeat(
+            np.arange(len(panels_per_wing)), panels_per_wing
+        )
+    return outputs
+
+
+def analyse_progressively(
+    analyse,
+    my_airplane,
+    ms_velocity,
+    angle_of_attack,
+    angle_of_sideslip,
+    fidelity=1,
+    rtol=0.01,
+    report_refinement=lambda refinement: None,
+):
+    """
+    Runs `analyse` (analyse_ll or analyse_vlm) at each of the FIDELITY_LEVELS up to `fidelity`, coarsest first,
+    and stops as soon as CL and CD both change by less than `rtol` from one level to the next.
+
+    `report_refinement(refinement)` is called after every level, so that the coarse levels can be shown as a
+    preview while the finer ones run. Returns (analysis, result, refinement) of the last level run, where
+    refinement is a list of dicts of "Fidelity", "Panels", "CL", "CD", "L/D", and "Converged", one per level run.
+    A level whose solution is not finite (NaN entries) ends the refinement.
+    """
+    levels = [level for level in FIDELITY_LEVELS if level < fidelity] + [fidelity]
+    refinement = []
+    for level in levels:
+        analysis, result = analyse(
+            my_airplane=my_airplane,
+            ms_velocity=ms_velocity,
+            angle_of_attack=angle_of_attack,
+            angle_of_sideslip=angle_of_sideslip,
+            fidelity=level,
+        )
+        performance = summarize_performance(result)
+        converged = (
+            performance is not None
+            and len(refinement) > 0
+            and all(
+                abs(performance[key] - refinement[-1][key])
+                <= rtol * abs(refinement[-1][key])
+                for key in ["CL", "CD"]
+            )
+        )
+        refinement.append(
+            {
+                "Fidelity": level,
+                "Panels": len(analysis.front_left_vertices),
+                **(performance or {"CL": np.nan, "CD": np.nan, "L/D": np.nan}),
+                "Converged": converged,
+            }
+        )
+        report_refinement(refinement)
+        if converged or performance is None:
+            break
+
+    return (analysis, result, refinement)
@@ -1,15 +1,81 @@
+import functools
+import io
+import itertools
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import uuid
+
 import dash
 from dash import dcc
 from dash import html
+from dash import DiskcacheManager
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
-import aerosandbox as asb
+from dash.dependencies import ClientsideFunction, Input, Output, State
+import diskcache
+import flask
 import numpy as np
-import pandas as pd
 
-from airplane import make_airplane
+from airfoils import AIRFOIL_NAMES, get_airfoil
+from airplane import boom_locations, make_airplane, min_wing_span
+import array_store
+import batch
+from benchmark_results import estimate_seconds
+from envelope import draw_envelope, run_envelope, summarize_envelope
+from loads import draw_loads, encode_loads, root_loads, spanwise_loads
+import metrics
+from analysis import (
+    FIDELITY_LEVELS,
+    analyse_ll,
+    analyse_progressively,
+    analyse_vlm,
+    panel_outputs,
+    summarize_performance,
+)
+from optimize import OBJECTIVES, optimize_design
+from polar import run_polar, draw_polar
+import results_cache
+import scene
+import sensitivity
+import surrogate
+from trim import trim
+import vlm
+
+### Analyses run as background jobs in their own processes; the web workers only dispatch them and poll for results.
+JOBS_DIRECTORY = os.environ.get(
+    "JOBS_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "asb-demo-jobs"),
+)
+background_callback_manager = DiskcacheManager(diskcache.Cache(JOBS_DIRECTORY))
+
+### Each browser session runs one analysis at a time; further clicks are turned away until it finishes.
+SESSION_COOKIE = "asb_demo_session"
+
+### Boom counts offered on the slider; any count works, as long as the tails fit along the span (see boom_locations)
+MAX_BOOMS = 6
+
 
-app = dash.Dash(external_stylesheets=[dbc.themes.MINTY])
+def button_label(name, stages):
+    """
+    Adds the measured time range (fastest to slowest configuration, from the benchmark suite) of the given stages to
+    a button's name. Without benchmark results, the name is used as is.
+    """
+    seconds = estimate_seconds(stages)
+    if seconds is None:
+        return name
+    fastest, slowest = [f"{max(value, 0.1):.1f}" for value in seconds]
+    if fastest == slowest:
+        return f"{name} ({fastest}s)"
+    return f"{name} ({fastest}-{slowest}s)"
+
+
+app = dash.Dash(
+    external_stylesheets=[dbc.themes.MINTY],
+    background_callback_manager=background_callback_manager,
+)
+server = app.server  # The WSGI entry point, e.g. `gunicorn app:server`
 
 app.layout = dbc.Container(
     [
@@ -40,19 +106,84 @@ app.layout = dbc.Container(
                                 dcc.Slider(
                                     id="n_booms",
                                     min=1,
-                                    max=3,
+                                    max=MAX_BOOMS,
                                     step=1,
                                     value=1,
-                                    marks={
-                                        1: "1",
-                                        2: "2",
-                                        3: "3",
-                                    },
+                                    marks={n: str(n) for n in range(1, MAX_BOOMS + 1)},
                                 ),
                                 html.P("Wing Span [m]:"),
                                 dcc.Input(id="wing_span", value=43, type="number"),
                                 html.P("Angle of Attack [deg]:"),
                                 dcc.Input(id="alpha", value=7.0, type="number"),
+                                html.P("Airspeed [m/s]:"),
+                                dcc.Input(id="velocity", value=20.0, type="number"),
+                                dcc.Checklist(
+                                    id="sensitivities",
+                                    options=[
+                                        {
+                                            "label": " LL: exact gradients (span, alpha, tail)",
+                                            "value": "gradients",
+                                        },
+                                    ],
+                                    value=[],
+                                ),
+                                html.P("Fidelity (panel count scale):"),
+                                dcc.Slider(
+                                    id="fidelity",
+                                    step=None,
+                                    value=1,
+                                    marks={
+                                        level: str(level) for level in FIDELITY_LEVELS
+                                    },
+                                ),
+                                html.P("Polar Sweep [deg] (start, end, points):"),
+                                dcc.Input(id="alpha_start", value=-4.0, type="number"),
+                                dcc.Input(id="alpha_end", value=12.0, type="number"),
+                                dcc.Input(
+                                    id="alpha_points",
+                                    value=17,
+                                    type="number",
+                                    min=2,
+                                    step=1,
+                                ),
+                                html.P("Mass [kg] (trim, envelope) and Trim Method:"),
+                                dcc.Input(id="mass", value=2000.0, type="number"),
+                                dcc.Dropdown(
+                                    id="trim_method",
+                                    options=[
+                                        {"label": "LL", "value": "ll"},
+                                        {"label": "VLM", "value": "vlm"},
+                                    ],
+                                    value="ll",
+                                    clearable=False,
+                                ),
+                                html.P("Optimization Objective:"),
+                                dcc.Dropdown(
+                                    id="objective",
+                                    options=list(OBJECTIVES.keys()),
+                                    value="L/D",
+                                    clearable=False,
+                                ),
+                                html.P("Wing Span Bounds [m]:"),
+                                dcc.Input(id="span_min", value=20.0, type="number"),
+                                dcc.Input(id="span_max", value=60.0, type="number"),
+                                html.P("Angle of Attack Bounds [deg]:"),
+                                dcc.Input(id="alpha_min", value=-5.0, type="number"),
+                                dcc.Input(id="alpha_max", value=15.0, type="number"),
+                                dcc.Checklist(
+                                    id="optimize_options",
+                                    options=[
+                                        {
+                                            "label": " Free angle of attack",
+                                            "value": "alpha",
+                                        },
+                                        {
+                                            "label": " Free number of booms",
+                                            "value": "n_booms",
+                                        },
+                                    ],
+                                    value=["alpha"],
+                                ),
                             ]
                         ),
                         html.Hr(),
@@ -60,32 +191,97 @@ app.layout = dbc.Container(
                             [
                                 html.H5("Commands"),
                                 dbc.Button(
-                                    "Display (1s)",
+                                    button_label(
+                                        "Display", ["make_airplane", "draw_display"]
+                                    ),
                                     id="display_geometry",
                                     color="primary",
                                     style={"margin": "5px"},
                                     n_clicks_timestamp="0",
                                 ),
                                 dbc.Button(
-                                    "LL Analysis (3s)",
+                                    button_label(
+                                        "LL Analysis",
+                                        ["make_airplane", "ll", "draw_ll"],
+                                    ),
                                     id="run_ll_analysis",
                                     color="secondary",
                                     style={"margin": "5px"},
                                     n_clicks_timestamp="0",
                                 ),
                                 dbc.Button(
-                                    "VLM Analysis (15s)",
+                                    button_label(
+                                        "VLM Analysis",
+                                        ["make_airplane", "vlm", "draw_vlm"],
+                                    ),
                                     id="run_vlm_analysis",
                                     color="secondary",
                                     style={"margin": "5px"},
                                     n_clicks_timestamp="0",
                                 ),
+                                dbc.Button(
+                                    "LL Polar",
+                                    id="run_ll_polar",
+                                    color="secondary",
+                                    style={"margin": "5px"},
+                                    n_clicks_timestamp="0",
+                                ),
+                                dbc.Button(
+                                    "VLM Polar",
+                                    id="run_vlm_polar",
+                                    color="secondary",
+                                    style={"margin": "5px"},
+                                    n_clicks_timestamp="0",
+                                ),
+                                dbc.Button(
+                                    "Optimize",
+                                    id="run_optimization",
+                                    color="secondary",
+                                    style={"margin": "5px"},
+                                    n_clicks_timestamp="0",
+                                ),
+                                dbc.Button(
+                                    "Trim",
+                                    id="run_trim",
+                                    color="secondary",
+                                    style={"margin": "5px"},
+                                    n_clicks_timestamp="0",
+                                ),
+                                dbc.Button(
+                                    "Flight Envelope",
+                                    id="run_envelope",
+                                    color="secondary",
+                                    style={"margin": "5px"},
+                                    n_clicks_timestamp="0",
+                                ),
+                                dbc.Button(
+                                    "Cancel",
+                                    id="cancel_analysis",
+                                    color="danger",
+                                    outline=True,
+                                    style={"margin": "5px"},
+                                    disabled=True,
+                                ),
+                                dbc.Progress(
+                                    id="analysis_progress",
+                                    value=0,
+                                    striped=True,
+                                    animated=True,
+                                    style={"margin": "5px", "visibility": "hidden"},
+                                ),
+                                dcc.Store(id="analysis_request"),
+                                dcc.Store(id="stage"),
+                                dcc.Store(id="geometry"),
+                                dcc.Store(id="geometry_key"),
+                                dcc.Store(id="scene"),
                             ]
                         ),
                         html.Hr(),
                         html.Div(
                             [
                                 html.H5("Aerodynamic Performance"),
+                                html.Div(id="surrogate_preview"),
+                                html.Div(id="preview"),
                                 dbc.Spinner(
                                     html.P(id="output"),
                                     color="primary",
@@ -130,210 +326,959 @@ app.layout = dbc.Container(
 )
 
 
-def make_table(dataframe):
+### Command buttons (in layout order) and the analysis each one runs
+BUTTONS = {
+    "display": "display_geometry",
+    "ll": "run_ll_analysis",
+    "vlm": "run_vlm_analysis",
+    "ll_polar": "run_ll_polar",
+    "vlm_polar": "run_vlm_polar",
+    "optimize": "run_optimization",
+    "trim": "run_trim",
+    "envelope": "run_envelope",
+}
+ANALYSES = list(BUTTONS.keys())
+
+### The inputs each analysis depends on; only these go into its cache key
+POLAR_INPUTS = [
+    "n_booms",
+    "wing_span",
+    "alpha_start",
+    "alpha_end",
+    "alpha_points",
+    "fidelity",
+]
+ANALYSIS_INPUTS = {
+    "display": ["n_booms", "wing_span"],
+    "ll": [
+        "n_booms",
+        "wing_span",
+        "alpha",
+        "velocity",
+        "fidelity",
+        "sensitivities",
+    ],
+    "vlm": ["n_booms", "wing_span", "alpha", "velocity", "fidelity"],
+    "ll_polar": POLAR_INPUTS,
+    "vlm_polar": POLAR_INPUTS,
+    "optimize": [
+        "n_booms",
+        "alpha",
+        "objective",
+        "span_min",
+        "span_max",
+        "alpha_min",
+        "alpha_max",
+        "optimize_options",
+        "velocity",
+    ],
+    "trim": ["n_booms", "wing_span", "mass", "velocity", "trim_method", "fidelity"],
+    "envelope": ["n_booms", "wing_span", "mass", "fidelity"],
+}
+PARAMETERS = list(
+    dict.fromkeys(name for inputs in ANALYSIS_INPUTS.values() for name in inputs)
+)
+
+
+def make_table(data, decimals=None):
+    """
+    Makes a table from a dict of columns or a list of rows (dicts), optionally rounding numbers to `decimals`.
+    """
+    import pandas as pd  # Only needed here, so kept off the startup path
+
+    dataframe = pd.DataFrame(data)
+    if decimals is not None:
+        dataframe = dataframe.round(decimals)
     return dbc.Table.from_dataframe(
         dataframe, bordered=True, hover=True, responsive=True, striped=True, style={}
     )
 
 
+def analysis_request(analysis, parameters, current_geometry=None) -> dict:
+    """
+    Describes a run of `analysis` with the given parameter values (only the ones it depends on are kept), along with
+    the results cache key it is stored under.
+    """
+    inputs = {name: parameters[name] for name in ANALYSIS_INPUTS[analysis]}
+    return {
+        "key": results_cache.make_key(analysis, **inputs),
+        "analysis": analysis,
+        "inputs": inputs,
+        "current_geometry": current_geometry,
+    }
+
+
+def check_inputs(request):
+    """
+    Raises a ValueError, with a message to show on the page, if the request's inputs can't be analysed: booms whose
+    tails don't fit along the span (see boom_locations), an incomplete polar sweep, or optimization bounds that are
+    missing or leave no room for the booms.
+    """
+    inputs = request["inputs"]
+    boom_locations(inputs["n_booms"], inputs.get("wing_span"))
+    if request["analysis"] == "optimize":
+        options = inputs["optimize_options"] or []
+        free_alpha = "alpha" in options
+        required = ["span_min", "span_max", "velocity"] + (
+            ["alpha_min", "alpha_max"] if free_alpha else ["alpha"]
+        )
+        if any(inputs[name] is None for name in required):
+            raise ValueError(
+                "Enter the wing span bounds, the airspeed, and the angle of attack (or its bounds) to optimize."
+            )
+        if inputs["span_min"] > inputs["span_max"]:
+            raise ValueError("The lower wing span bound is above the upper one.")
+        if free_alpha and inputs["alpha_min"] > inputs["alpha_max"]:
+            raise ValueError("The lower angle of attack bound is above the upper one.")
+        if "n_booms" not in options:
+            span_needed = min_wing_span(inputs["n_booms"])
+            if span_needed > inputs["span_max"]:
+                raise ValueError(
+                    f"{inputs['n_booms']} booms need a wing span of at least {span_needed:.1f} m for their tails to "
+                    f"fit; raise the upper span bound."
+                )
+    if request["analysis"].endswith("_polar"):
+        if any(
+            inputs[name] is None
+            for name in ["alpha_start", "alpha_end", "alpha_points"]
+        ):
+            raise ValueError(
+                "Enter the start and end angles of attack, and the number of points, of the polar."
+            )
+        if inputs["alpha_points"] < 2:
+            raise ValueError("A polar needs at least 2 points.")
+
+
+def session_id() -> str:
+    """
+    Identifies the browser session that the current callback came from, by a cookie that is set on its first call.
+    """
+    session = dash.ctx.cookies.get(SESSION_COOKIE)
+    if session is None:
+        session = uuid.uuid4().hex
+        dash.ctx.response.set_cookie(
+            SESSION_COOKIE, session, httponly=True, samesite="Lax"
+        )
+    return session
+
+
+def running_lock(session) -> tuple:
+    # Held (in the results cache) while a background job runs for this session
+    return ("running", session)
+
+
 @app.callback(
-    [Output("display", "figure"), Output("output", "children")],
-    [
-        Input("display_geometry", "n_clicks_timestamp"),
-        Input("run_ll_analysis", "n_clicks_timestamp"),
-        Input("run_vlm_analysis", "n_clicks_timestamp"),
-    ],
-    [
-        State("n_booms", "value"),
-        State("wing_span", "value"),
-        State("alpha", "value"),
+    output=[
+        Output("geometry", "data"),
+        Output("geometry_key", "data"),
+        Output("scene", "data"),
+        Output("output", "children"),
+        Output("analysis_request", "data"),
     ],
+    inputs=dict(
+        timestamps=[
+            Input(button, "n_clicks_timestamp") for button in BUTTONS.values()
+        ],
+    ),
+    state=dict(
+        parameters={name: State(name, "value") for name in PARAMETERS},
+        current_geometry=State("geometry_key", "data"),
+    ),
 )
 def display_geometry(
-    display_geometry,
-    run_ll_analysis,
-    run_vlm_analysis,
-    n_booms,
-    wing_span,
-    alpha,
+    timestamps,
+    parameters,
+    current_geometry,
 ):
     ### Figure out which button was clicked
     try:
         button_pressed = np.argmax(
-            np.array(
-                [
-                    float(display_geometry),
-                    float(run_ll_analysis),
-                    float(run_vlm_analysis),
-                ]
-            )
+            np.array([float(timestamp) for timestamp in timestamps])
         )
         assert button_pressed is not None
     except:
         button_pressed = 0
 
-    ### Make the airplane
-    airplane = make_airplane(
-        n_booms=n_booms,
-        wing_span=wing_span,
-    )
-    if button_pressed == 0:
-        # Display the geometry
-        figure = airplane.draw(show=False, backend="plotly")
+    ### Serve repeat requests straight from the shared results cache
+    analysis = ANALYSES[button_pressed]
+    request = analysis_request(analysis, parameters, current_geometry)
+    labels = {"analysis": analysis, "n_booms": request["inputs"]["n_booms"]}
+    with metrics.timed("cache_lookup", **labels):
+        result = results_cache.get(request["key"])
+
+        # The browser keeps the last mesh it was sent, so only send one if it is a different one
+        geometry = dash.no_update
+        if result is not None and result["geometry"] not in [None, current_geometry]:
+            geometry = scene.load_geometry(result["geometry"])
+            if geometry is None:  # Evicted; recompute it along with the result
+                result = None
+
+    if result is None:
+        try:
+            check_inputs(request)
+        except ValueError as e:
+            return (*[dash.no_update] * 3, html.P(str(e)), dash.no_update)
+
+        # Hand the work to a background job (see `run_analysis`) instead of blocking this worker, unless this session
+        # already has one running (e.g. a double click, before the buttons are disabled)
+        session = session_id()
+        token = results_cache.acquire(running_lock(session))
+        if token is None:
+            return (
+                *[dash.no_update] * 3,
+                html.P("An analysis is already running; wait for it to finish, or cancel it."),
+                dash.no_update,
+            )
+        return (
+            *[dash.no_update] * 4,
+            {**request, "session": session, "lock_token": token},
+        )
+
+    with metrics.timed("format", **labels):
+        return (*format_result(analysis, result, geometry), dash.no_update)
+
+
+@app.callback(
+    [
+        Output("geometry", "data", allow_duplicate=True),
+        Output("geometry_key", "data", allow_duplicate=True),
+        Output("scene", "data", allow_duplicate=True),
+        Output("output", "children", allow_duplicate=True),
+    ],
+    Input("analysis_request", "data"),
+    background=True,
+    interval=500,
+    progress=[
+        Output("analysis_progress", "value"),
+        Output("analysis_progress", "label"),
+        Output("preview", "children"),
+        Output("stage", "data"),
+    ],
+    progress_default=[0, "", None, None],
+    cancel=[Input("cancel_analysis", "n_clicks")],
+    running=[
+        (
+            Output("analysis_progress", "style"),
+            {"margin": "5px", "visibility": "visible"},
+            {"margin": "5px", "visibility": "hidden"},
+        ),
+        (Output("cancel_analysis", "disabled"), False, True),
+        (Output("display_geometry", "disabled"), True, False),
+        (Output("run_ll_analysis", "disabled"), True, False),
+        (Output("run_vlm_analysis", "disabled"), True, False),
+        (Output("run_ll_polar", "disabled"), True, False),
+        (Output("run_vlm_polar", "disabled"), True, False),
+        (Output("run_optimization", "disabled"), True, False),
+        (Output("run_trim", "disabled"), True, False),
+        (Output("run_envelope", "disabled"), True, False),
+    ],
+    prevent_initial_call=True,
+)
+def run_analysis(set_progress, request):
+    # Partial results are streamed to the page as each stage finishes: the airplane is drawn as soon as its geometry
+    # is ready (see showStage in assets/scene.js), and coarse results are shown under the progress bar while the
+    # finer levels run
+    progress = {"percent": 0, "label": "", "preview": None, "stage": None}
+
+    def report_progress(percent, label):
+        progress.update(percent=percent, label=label)
+        set_progress(
+            (
+                progress["percent"],
+                progress["label"],
+                progress["preview"],
+                progress["stage"],
+            )
+        )
+
+    def report_geometry(geometry):
+        # Only the key goes out with every progress update; the browser fetches the mesh itself, once
+        progress["stage"] = {
+            "geometry": geometry["key"],
+            "scene": {"geometry": geometry["key"]},
+        }
+        report_progress(20, "Geometry ready")
+
+    def report_refinement(refinement):
+        progress["preview"] = [
+            html.P("Preview (refining...):"),
+            make_table(refinement, decimals=4),
+        ]
+        report_progress(progress["percent"], progress["label"])
+
+    analysis = request["analysis"]
+    labels = {"analysis": analysis, "n_booms": request["inputs"]["n_booms"]}
+    with results_cache.held(
+        running_lock(request["session"]), request["lock_token"]
+    ):
+        geometry, result = evaluate(
+            request, report_progress, report_refinement, report_geometry
+        )
+
+    if geometry is None or geometry["key"] == request["current_geometry"]:
+        geometry = dash.no_update
+    with metrics.timed("format", **labels):
+        return format_result(analysis, result, geometry)
+
+
+@app.callback(Input("cancel_analysis", "n_clicks"), prevent_initial_call=True)
+def release_session(n_clicks):
+    # A cancelled job is killed before it can release its session's lock, so that is done here
+    session = dash.ctx.cookies.get(SESSION_COOKIE)
+    if session is not None:
+        results_cache.release(running_lock(session))
+
+
+def evaluate(
+    request,
+    report_progress=lambda percent, label: None,
+    report_refinement=lambda refinement: None,
+    report_geometry=lambda geometry: None,
+):
+    """
+    Runs an `analysis_request` and stores its result in the results cache, and its mesh and per-panel solver outputs
+    (see `panel_outputs`) in the array store, both under the request's key. Returns (geometry, result).
+
+    Identical requests in flight at the same time (e.g. several users pressing the same button during a demo), in
+    any worker, share one computation: the first one runs it, and the others wait for its result.
+    """
+    analysis = request["analysis"]
+    labels = {"analysis": analysis, "n_booms": request["inputs"]["n_booms"]}
+    computed = {}
+    wait_start = None
+
+    def save_solution(ap):
+        array_store.put(request["key"], **panel_outputs(ap))
+        computed["solution"] = request["key"]
+
+    def compute():
+        # The mesh and solver outputs are stored as they are made, so they are there for anyone waiting on the result
+        with metrics.profiled(f"{analysis}-{labels['n_booms']}-booms"):
+            geometry, view, performance, refinement = compute_result(
+                analysis=analysis,
+                report_progress=report_progress,
+                report_refinement=report_refinement,
+                report_geometry=report_geometry,
+                save_solution=save_solution,
+                **request["inputs"],
+            )
+        computed["geometry"] = geometry
+        return {
+            "geometry": None if geometry is None else geometry["key"],
+            "scene": view,
+            "performance": performance,
+            "refinement": refinement,
+            "solution": computed.get("solution"),
+        }
+
+    def on_wait():
+        nonlocal wait_start
+        if wait_start is None:
+            wait_start = time.perf_counter()
+            report_progress(5, "Waiting for the same analysis, already running")
+
+    result = results_cache.get_or_compute(request["key"], compute, on_wait=on_wait)
+
+    if wait_start is not None:
+        metrics.observe(
+            "stage_seconds",
+            time.perf_counter() - wait_start,
+            stage="wait",
+            **labels,
+        )
+    if "geometry" in computed:
+        return computed["geometry"], result
+    if result["geometry"] is None:
+        return None, result
+    return scene.load_geometry(result["geometry"]), result
+
+
+@app.callback(
+    Output("surrogate_preview", "children"),
+    Input("n_booms", "value"),
+    Input("wing_span", "value"),
+    Input("alpha", "value"),
+)
+def preview_surrogate(n_booms, wing_span, alpha):
+    """
+    Estimates CL, CD, and L/D from the surrogate model (see surrogate.py) on every input change - no solver call.
+    The LL and VLM buttons still run the real solver.
+    """
+    try:
+        prediction = surrogate.predict(n_booms, float(wing_span), float(alpha))
+    except (TypeError, ValueError):
+        prediction = None
+    if prediction is None:
+        return html.P("No instant estimate here (outside the surrogate's range).")
+
+    estimate, error = prediction
+    method = str(surrogate.load()["method"]).upper()
+    return [
+        html.P(f"Instant estimate ({method} surrogate; run an analysis to check):"),
+        make_table(
+            {
+                "Estimate": list(estimate.keys()),
+                "Value": [f"{value:.4g}" for value in estimate.values()],
+                "Error (RMS)": [f"± {value:.2g}" for value in error.values()],
+            }
+        ),
+    ]
+
+
+# The 3D view is assembled in the browser from the mesh and the scene (see assets/scene.js)
+app.clientside_callback(
+    ClientsideFunction(namespace="scene", function_name="render"),
+    Output("display", "figure"),
+    Input("geometry", "data"),
+    Input("scene", "data"),
+)
+
+
+# Stages streamed from a running job are drawn the same way, fetching their mesh from /geometry first if needed
+app.clientside_callback(
+    ClientsideFunction(namespace="scene", function_name="showStage"),
+    Output("geometry", "data", allow_duplicate=True),
+    Output("geometry_key", "data", allow_duplicate=True),
+    Output("scene", "data", allow_duplicate=True),
+    Input("stage", "data"),
+    State("geometry_key", "data"),
+    State("scene", "data"),
+    prevent_initial_call=True,
+)
+
+
+def format_result(analysis, result, geometry=dash.no_update):
+    """
+    Turns a cached result into the (geometry, geometry key, scene, output) shown on the page. `geometry` is the mesh
+    payload to send along, or `dash.no_update` if the browser already has it.
+    """
+    if analysis == "display":
         output = "Please run an analysis to display the data."
-    elif button_pressed == 1:
-        # Run an analysis
-        opti = asb.Opti()  # Initialize an analysis/optimization environment
-
-        ap, result = analyse_ll(
-            my_airplane=airplane,
-            ms_velocity=20,
-            angle_of_attack=alpha,
-            angle_of_sideslip=0,
+    elif analysis == "envelope" and result["performance"] is None:
+        output = html.P(
+            "No level flight anywhere in the envelope: the airplane is too heavy to fly at these airspeeds."
         )
-        # Solver options
-        p_opts = {}
-        s_opts = {}
-        s_opts["max_iter"] = 50
-        # s_opts["mu_strategy"] = "adaptive"
-        opti.solver("ipopt", p_opts, s_opts)
-        # Solve
-        try:
-            sol = opti.solve()
-            output = make_table(
-                pd.DataFrame(
-                    {
-                        "Figure": ["CL", "CD", "L/D"],
-                        "Value": [
-                            sol.value(result["CL"]),
-                            sol.value(result["CD"]),
-                            sol.value(result["CL"] / result["CD"]),
-                        ],
-                    }
-                )
+    elif analysis == "optimize" and result["performance"] is None:
+        output = html.P(
+            "Optimization failed: no design converged within the bounds (or none leaves room for the booms' tails)."
+        )
+    elif result["performance"] is None:
+        output = html.P(
+            "Aerodynamic analysis failed! Most likely the airplane is stalled at this flight condition."
+        )
+    elif analysis.endswith("_polar"):
+        output = make_table(result["performance"], decimals=4)
+    elif analysis == "optimize":
+        output = make_table(
+            {
+                "Optimum": list(result["performance"].keys()),
+                "Value": list(result["performance"].values()),
+            }
+        )
+    elif analysis == "trim":
+        if result["performance"]["converged"]:
+            status = "Trimmed: lift equals weight and Cm is zero."
+        else:
+            status = (
+                "Not trimmed: found no point with L = W and Cm = 0 (the stabilizer may stall first). "
+                "Showing the closest one."
             )
-        except RuntimeError as e:
-            sol = opti.debug
-            output = html.P(
-                "Aerodynamic analysis failed! Most likely the airplane is stalled at this flight condition."
+        output = [
+            html.P(status),
+            make_table(
+                {
+                    "Trim": list(result["performance"].keys()),
+                    "Value": list(result["performance"].values()),
+                }
+            ),
+        ]
+    else:
+        output = make_table(
+            {
+                "Figure": list(result["performance"].keys()),
+                "Value": list(result["performance"].values()),
+            }
+        )
+
+    if result.get("solution") and result["performance"] is not None:
+        output = [output, *loads_output(result["solution"])]
+
+    if result.get("refinement"):
+        refinement = result["refinement"]
+        if refinement[-1]["Converged"]:
+            status = f"Converged at fidelity {refinement[-1]['Fidelity']}: CL and CD changed by under 1%."
+        else:
+            status = "Not converged: CL and CD still change by over 1% between the last two fidelities."
+        output = [
+            output,
+            html.P(status),
+            make_table(refinement, decimals=4),
+        ]
+
+    geometry_key = dash.no_update if geometry is dash.no_update else geometry["key"]
+    return (geometry, geometry_key, result["scene"], output)
+
+
+def loads_output(key) -> list:
+    """
+    The main wing's spanwise loads, from the solver outputs stored under `key`: root loads, plots, and download
+    links. Empty if they are no longer in the array store.
+    """
+    solution = array_store.get(key)
+    if solution is None or "wing_indices" not in solution:
+        return []
+    loads = spanwise_loads(solution)
+    root = root_loads(loads)
+    return [
+        make_table(
+            {"Main Wing": list(root.keys()), "Value": list(root.values())},
+            decimals=1,
+        ),
+        dcc.Graph(figure=draw_loads(loads), config={"displayModeBar": False}),
+        html.P(
+            [
+                "Download the spanwise loads: ",
+                html.A("CSV", href=f"/loads/{key}.csv"),
+                ", ",
+                html.A("NumPy (.npz)", href=f"/loads/{key}.npz"),
+            ]
+        ),
+    ]
+
+
+def compute_result(
+    analysis,
+    n_booms,
+    wing_span=None,
+    alpha=None,
+    alpha_start=None,
+    alpha_end=None,
+    alpha_points=None,
+    objective=None,
+    span_min=None,
+    span_max=None,
+    alpha_min=None,
+    alpha_max=None,
+    optimize_options=(),
+    velocity=20,
+    mass=None,
+    trim_method="ll",
+    fidelity=1,
+    sensitivities=(),
+    report_progress=lambda percent, label: None,
+    report_refinement=lambda refinement: None,
+    report_geometry=lambda geometry: None,
+    save_solution=lambda analysis: None,
+):
+    """
+    Runs the requested analysis from scratch, calling `report_progress(percent, label)` as each stage starts, and
+    `report_geometry(geometry)` with the airplane's mesh payload as soon as it is built, ahead of the analysis.
+    Every mesh is saved to the array store (see `scene.save_geometry`) before its payload is reported or returned,
+    and `save_solution(analysis)` is called with the solved LL or VLM analysis, if any, before drawing it.
+
+    Returns a tuple of (geometry, scene, performance, refinement):
+        geometry: the mesh payload the scene is drawn on (see scene.py), or None for 2D plots.
+        scene: what to draw on it, or a plain figure.
+        performance: a dict of CL, CD, and L/D (of lists of them, for polars; of the optimal design, for
+            optimizations; of the trim point, for trims; of the headline figures, for flight envelopes), or None
+            if there is nothing to report (geometry display) or the analysis failed.
+        refinement: for LL and VLM, the results at each fidelity level run (see `analyse_progressively`), else None.
+
+    LL and VLM runs are previewed at coarse fidelity first (reported through `report_refinement`) and refined up to
+    `fidelity`, stopping early once converged. With "gradients" in `sensitivities`, an LL run's performance also
+    has the exact derivatives of CL, CD, and L/D with respect to the design inputs (see sensitivity.py).
+    """
+    performance = None
+    refinement = None
+    airplane_options = {}  # make_airplane inputs other than n_booms and wing_span
+    labels = {"analysis": analysis, "n_booms": n_booms}
+
+    if analysis.endswith("_polar"):
+        report_progress(30, "Running polar sweep")
+        with metrics.timed("solve", **labels):
+            polar = run_polar(
+                method=analysis[: -len("_polar")],
+                n_booms=n_booms,
+                wing_span=wing_span,
+                alphas=np.linspace(alpha_start, alpha_end, int(alpha_points)),
+                fidelity=fidelity,
             )
-            print(e)
+        with metrics.timed("draw", **labels):
+            view = scene.figure_scene(draw_polar(polar))
+        performance = {name: values.tolist() for name, values in polar.items()}
+        return (None, view, performance, refinement)
 
-        figure = ap.draw(show=False, backend="plotly")
+    if analysis == "envelope":
+        report_progress(30, "Sweeping the flight envelope")
+        with metrics.timed("solve", **labels):
+            flight_envelope = run_envelope(
+                n_booms=n_booms,
+                wing_span=wing_span,
+                mass=mass,
+                fidelity=fidelity,
+            )
+        with metrics.timed("draw", **labels):
+            view = scene.figure_scene(draw_envelope(flight_envelope))
+        performance = summarize_envelope(flight_envelope)
+        return (None, view, performance, refinement)
 
-    elif button_pressed == 2:
-        # Run an analysis
-        opti = asb.Opti()  # Initialize an analysis/optimization environment
-        ap, result = analyse_vlm(
-            my_airplane=airplane,
-            ms_velocity=20,
-            angle_of_attack=alpha,
-            angle_of_sideslip=0,
+    if analysis == "optimize":
+        with metrics.timed("solve", **labels):
+            performance = optimize_design(
+                objective=objective,
+                span_bounds=(span_min, span_max),
+                alpha_bounds=(
+                    (alpha_min, alpha_max)
+                    if "alpha" in optimize_options
+                    else (alpha, alpha)
+                ),
+                boom_counts=(
+                    range(1, MAX_BOOMS + 1)
+                    if "n_booms" in optimize_options
+                    else (n_booms,)
+                ),
+                ms_velocity=velocity,
+                report_progress=report_progress,
+            )
+        if performance is None:  # No boom count fit within the bounds, or none solved: nothing to draw
+            return (None, None, performance, refinement)
+        n_booms = performance["n_booms"]
+        wing_span = performance["wing_span"]
+
+    if analysis == "trim":
+        with metrics.timed("solve", **labels):
+            performance = trim(
+                method=trim_method,
+                n_booms=n_booms,
+                wing_span=wing_span,
+                mass=mass,
+                ms_velocity=velocity,
+                fidelity=fidelity,
+                report_progress=report_progress,
+            )
+        if performance is not None:
+            airplane_options["hstab_twist_angle"] = performance["hstab_twist_angle"]
+
+    ### Make the airplane
+    report_progress(10, "Building airplane")
+    with metrics.timed("make_airplane", **labels):
+        airplane = make_airplane(
+            n_booms=n_booms,
+            wing_span=wing_span,
+            **airplane_options,
         )
-        # Solver options
-        p_opts = {}
-        s_opts = {}
-        s_opts["max_iter"] = 50
-        # s_opts["mu_strategy"] = "adaptive"
-        opti.solver("ipopt", p_opts, s_opts)
-        # Solve
+    ap = airplane
+    body_key = scene.geometry_key("body", n_booms, wing_span, **airplane_options)
+    if analysis != "display":
+        with metrics.timed("mesh", **labels):
+            geometry = scene.load_geometry(body_key)
+            if geometry is None:
+                points, faces = scene.body_mesh(airplane)
+                scene.save_geometry(body_key, points, faces)
+                geometry = scene.geometry_payload(body_key, points, faces)
+        report_geometry(geometry)
+
+    if analysis in ["ll", "vlm"]:
+        # Run an analysis. Every input is a plain number, so the solver evaluates directly in NumPy; Opti (and
+        # IPOPT) is only needed when there are decision variables.
+        report_progress(30, f"Running {analysis.upper()} analysis")
+        if analysis == "ll":
+            analyse = analyse_ll
+        else:
+            analyse = functools.partial(
+                analyse_vlm,
+                report_assembled=lambda vlm: report_progress(
+                    45,
+                    f"Influence matrix assembled ({len(vlm.front_left_vertices)} panels); solving",
+                ),
+            )
         try:
-            sol = opti.solve()
-            output = make_table(
-                pd.DataFrame(
-                    {
-                        "Figure": ["CL", "CD", "L/D"],
-                        "Value": [
-                            sol.value(result["CL"]),
-                            sol.value(result["CD"]),
-                            sol.value(result["CL"] / result["CD"]),
-                        ],
-                    }
+            with metrics.timed("solve", **labels):
+                ap, result, refinement = analyse_progressively(
+                    analyse,
+                    my_airplane=airplane,
+                    ms_velocity=velocity,
+                    angle_of_attack=alpha,
+                    angle_of_sideslip=0,
+                    fidelity=fidelity,
+                    report_refinement=report_refinement,
                 )
-            )
-        except RuntimeError as e:
-            sol = opti.debug
-            output = html.P(
-                "Aerodynamic analysis failed! Most likely the airplane is stalled at this flight condition."
-            )
+            performance = summarize_performance(result)
+        except (RuntimeError, ValueError, np.linalg.LinAlgError) as e:
+            ap = airplane
+            performance = None
             print(e)
 
-        figure = ap.draw(show=False, backend="plotly")  # Generates figure
-
-    figure.update_layout(
-        autosize=True,
-        # width=1000,
-        # height=700,
-        margin=dict(
-            l=0,
-            r=0,
-            b=0,
-            t=0,
-        ),
+        if analysis == "ll" and "gradients" in sensitivities and performance:
+            report_progress(55, "Differentiating CL, CD, and L/D")
+            with metrics.timed("gradients", **labels):
+                # At the fidelity that the refinement stopped at, to match the reported values
+                point = sensitivity.sensitivities(
+                    n_booms=n_booms,
+                    wing_span=wing_span,
+                    alpha=alpha,
+                    ms_velocity=velocity,
+                    fidelity=refinement[-1]["Fidelity"],
+                )
+            if point is not None:
+                performance.update(sensitivity.gradient_table(point["gradients"]))
+
+    if analysis == "trim" and performance is not None:
+        # Solve at the trim point again for the drawing (the trim only kept the coefficients)
+        analyse = analyse_ll if trim_method == "ll" else analyse_vlm
+        with metrics.timed("solve", **labels):
+            ap, result = analyse(
+                my_airplane=airplane,
+                ms_velocity=velocity,
+                angle_of_attack=performance["alpha"],
+                angle_of_sideslip=0,
+                fidelity=fidelity,
+            )
+
+    if ap is not airplane:
+        with metrics.timed("store", **labels):
+            save_solution(ap)
+
+    report_progress(60, "Drawing")
+    with metrics.timed("draw", **labels):
+        if ap is airplane:
+            # Display the geometry
+            key = body_key
+            points, faces = scene.body_mesh(airplane)
+            view = {"geometry": key}
+        else:
+            # The panels depend on the fidelity that the refinement stopped at
+            key = scene.geometry_key(
+                trim_method if analysis == "trim" else analysis,
+                n_booms,
+                wing_span,
+                fidelity=fidelity if refinement is None else refinement[-1]["Fidelity"],
+                **airplane_options,
+            )
+            points, faces = scene.panel_mesh(ap)
+            view = scene.solution_scene(ap, key)
+    with metrics.timed("store", **labels):
+        scene.save_geometry(key, points, faces)
+    return (
+        scene.geometry_payload(key, points, faces),
+        view,
+        performance,
+        refinement,
     )
 
-    return (figure, output)
 
+@app.server.route("/cache-stats")
+def cache_stats():
+    return {**results_cache.stats(), "arrays": array_store.stats()}
+
+
+@app.server.before_request
+def start_request_timer():
+    flask.g.request_start = time.perf_counter()
 
-# Analysis type: Vortex Lattice Method
-def analyse_vlm(
-    my_airplane,
-    ms_velocity,
-    angle_of_attack,
-    angle_of_sideslip,
-):
 
-    op_point = asb.OperatingPoint(
-        atmosphere=asb.Atmosphere(altitude=0),
-        velocity=ms_velocity,  # airspeed, m/s
-        alpha=angle_of_attack,  # angle of attack, deg
-        beta=angle_of_sideslip,  # sideslip angle, deg
-        p=0,  # x-axis rotation rate, rad/sec
-        q=0,  # y-axis rotation rate, rad/sec
-        r=0,  # z-axis rotation rate, rad/sec
+@app.server.after_request
+def record_request_time(response):
+    if "request_start" not in flask.g:
+        return response
+
+    # Labelled by route rather than URL (e.g. "/geometry/<key>"), so that the number of series stays bounded
+    rule = flask.request.url_rule
+    # Callback requests all share one URL; tell them apart by their outputs (minus allow_duplicate suffixes)
+    callback = ""
+    if flask.request.path.endswith("_dash-update-component"):
+        output = (flask.request.get_json(silent=True) or {}).get("output", "")
+        callback = re.sub(r"@[0-9a-f]+", "", output).strip(".")
+    metrics.observe(
+        "request_seconds",
+        time.perf_counter() - flask.g.request_start,
+        path=rule.rule if rule is not None else "unmatched",
+        callback=callback,
     )
+    return response
+
+
+@app.server.teardown_request
+def close_stores(exception=None):
+    """
+    Closes this thread's connections to the shared stores. SQLite connections must not be carried across a fork, and
+    background jobs are forked from the request threads, so none are kept open between requests (nor by the
+    gunicorn master; see `warm_caches`). Each process or thread reopens its own on first use.
+    """
+    for store in [
+        results_cache.get_cache(),
+        array_store.get_store(),
+        metrics.get_store(),
+        vlm.get_session_store(),
+        batch.get_store(),
+        background_callback_manager.handle,
+    ]:
+        store.close()
 
-    xyz_ref = [my_airplane.wings[0].aerodynamic_center(chord_fraction=0.35)[0], 0, 0]
 
-    analysis = asb.VortexLatticeMethod(
-        airplane=my_airplane,
-        op_point=op_point,
-        xyz_ref=xyz_ref,
+@app.server.route("/geometry/<key>")
+def serve_geometry(key):
+    """
+    Serves a mesh payload from the array store. Keys are content-addressed, so the browser may cache it for good.
+    """
+    geometry = scene.load_geometry(key)
+    if geometry is None:
+        flask.abort(404)
+    response = flask.jsonify(geometry)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@app.server.route("/loads/<key>.<format>")
+def serve_loads(key, format):
+    """
+    Serves the main wing's spanwise loads (see loads.py) of a solved analysis, as CSV or .npz.
+    """
+    solution = array_store.get(key)
+    if (
+        format not in ["csv", "npz"]
+        or solution is None
+        or "wing_indices" not in solution
+    ):
+        flask.abort(404)
+    return flask.Response(
+        encode_loads(spanwise_loads(solution), format),
+        mimetype="text/csv" if format == "csv" else "application/octet-stream",
+        headers={
+            "Content-Disposition": f"attachment; filename=spanwise_loads.{format}"
+        },
     )
-    result = analysis.run()
 
-    return (analysis, result)
 
+@app.server.route("/metrics")
+def serve_metrics():
+    return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-# Analysis type: LiftingLine
-def analyse_ll(
-    my_airplane,
-    ms_velocity,
-    angle_of_attack,
-    angle_of_sideslip,
-):
 
-    op_point = asb.OperatingPoint(
-        atmosphere=asb.Atmosphere(altitude=0),
-        velocity=ms_velocity,  # airspeed, m/s
-        alpha=angle_of_attack,  # angle of attack, deg
-        beta=angle_of_sideslip,  # sideslip angle, deg
-        p=0,  # x-axis rotation rate, rad/sec
-        q=0,  # y-axis rotation rate, rad/sec
-        r=0,  # z-axis rotation rate, rad/sec
+### Batches run as background jobs too: a sync worker would be killed (by gunicorn's request timeout) long before a
+# large batch finished. POST /batch answers at once with a job id; the job stores each row (see batch.get_store) as
+# it finishes, and GET /batch/<job> returns the rows so far.
+MAX_BATCH_CASES = 1000  # Per request; larger studies can be split across requests, or run with batch.py directly
+
+
+def run_batch_job(job, cases, options):
+    """
+    Runs a batch (in its own process), storing each row under (job, i) in the order they finish, and the job's
+    progress under (job,).
+    """
+    status = {"status": "running", "cases": len(cases), "finished": 0}
+    batch.put((job,), status)
+    for row in batch.run_batch(cases, **options):
+        batch.put((job, status["finished"]), row)
+        status["finished"] += 1
+        batch.put((job,), status)
+    batch.put((job,), {**status, "status": "done"})
+
+
+@app.server.route("/batch", methods=["POST"])
+def submit_batch():
+    """
+    Starts a batch of up to MAX_BATCH_CASES cases (see batch.py) as a background job, and returns its id and the URL
+    its results are served at (see `serve_batch`). The body is either a CSV of cases (Content-Type: text/csv, with
+    options in the query string) or JSON such as:
+        {"grid": {"n_booms": [1, 2], "wing_span": [40, 50], "alpha": [0, 5]}, "method": "vlm", "timeout": 60}
+    """
+    try:
+        if flask.request.mimetype == "text/csv":
+            options = flask.request.args
+            cases = batch.cases_from_csv(
+                io.StringIO(flask.request.get_data(as_text=True))
+            )
+        else:
+            options = flask.request.get_json()
+            grid = options["grid"]
+            cases = batch.cases_from_grid(
+                n_booms=[int(value) for value in grid["n_booms"]],
+                wing_span=[float(value) for value in grid["wing_span"]],
+                alpha=[float(value) for value in grid["alpha"]],
+            )
+        cases = list(itertools.islice(cases, MAX_BATCH_CASES + 1))
+        options = {
+            "method": options.get("method", "vlm"),
+            "fidelity": float(options.get("fidelity", 1)),
+            "timeout": float(options.get("timeout", 60)),
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        flask.abort(400, description=str(e))
+    if len(cases) > MAX_BATCH_CASES:
+        flask.abort(
+            413,
+            description=f"At most {MAX_BATCH_CASES} cases per batch; split larger studies",
+        )
+
+    job = uuid.uuid4().hex
+    batch.put((job,), {"status": "queued", "cases": len(cases), "finished": 0})
+    close_stores()  # No store connection may be carried across the fork
+    # Not a daemon: the job forks its own workers (see batch.run_batch)
+    multiprocessing.get_context("fork").Process(
+        target=run_batch_job, args=(job, cases, options)
+    ).start()
+    return (
+        flask.jsonify(
+            job=job,
+            cases=len(cases),
+            results=flask.url_for("serve_batch", job=job),
+        ),
+        202,
     )
 
-    xyz_ref = [my_airplane.wings[0].aerodynamic_center(chord_fraction=0.35)[0], 0, 0]
 
-    analysis = asb.LiftingLine(
-        airplane=my_airplane,
-        op_point=op_point,
-        xyz_ref=xyz_ref,
+@app.server.route("/batch/<job>")
+def serve_batch(job):
+    """
+    Serves a batch job's rows finished so far, as CSV. The job's status ("queued", "running", or "done") and progress
+    are in the X-Batch-Status and X-Batch-Progress (finished/cases) headers. Once some of its rows have expired (see
+    batch.RESULTS_LIFETIME), the job is gone rather than served in part.
+    """
+    status = batch.get((job,))
+    if status is None:
+        flask.abort(404)
+    rows = [batch.get((job, i)) for i in range(status["finished"])]
+    if any(row is None for row in rows):
+        flask.abort(
+            410,
+            description=f"Some of this batch's rows have expired; results are kept for {batch.RESULTS_LIFETIME} s",
+        )
+    return flask.Response(
+        "".join(batch.csv_lines(rows)),
+        mimetype="text/csv",
+        headers={
+            "X-Batch-Status": status["status"],
+            "X-Batch-Progress": f"{status['finished']}/{status['cases']}",
+        },
     )
-    result = analysis.run()
 
-    return (analysis, result)
+
+def warm_caches(boom_counts=(1, 2, 3)):
+    """
+    Loads what every analysis shares - the airfoils, the surrogate model, and the airplane at the
+    page's default inputs for each boom count - and makes sure the default geometry displays are in the results
+    cache.
+
+    Meant to run once in the gunicorn master, before it forks (see gunicorn.conf.py): workers, and the background
+    jobs they fork in turn, then start with all of this already in memory instead of each rebuilding it.
+    """
+    for name in AIRFOIL_NAMES:
+        get_airfoil(name)
+    surrogate.load()
+
+    defaults = {name: app.layout[name].value for name in PARAMETERS}
+    for n_booms in boom_counts:
+        make_airplane(n_booms=n_booms, wing_span=defaults["wing_span"])
+        request = analysis_request("display", {**defaults, "n_booms": n_booms})
+        if results_cache.get(request["key"]) is None:
+            evaluate(request)
+
+    close_stores()
 
 
 if __name__ == "__main__":
-    app.run(debug=False)
+    warm_caches()
+    # One request at a time, like a gunicorn sync worker: a job forked while another thread is inside a transaction
+    # on a shared store would inherit SQLite's record of that thread's lock, and find the store locked for good
+    app.run(debug=False, threaded=False)
@@ -0,0 +1,112 @@
+import io
+import json
+import mmap
+import os
+import tempfile
+
+import diskcache
+import numpy as np
+
+### Shared store of NumPy arrays (meshes and per-panel solver outputs), memory-mapped by every process that reads them.
+# Each entry is a single file: a JSON header giving each array's dtype, shape, and offset, then the raw array data.
+# Readers map the file read-only and get NumPy views straight onto the OS page cache, so any number of workers
+# reading the same entry share one copy of it in memory, instead of each unpickling its own. The directory defaults
+# to /dev/shm (RAM-backed) where there is one. diskcache keeps the index: the total size is bounded, and the
+# least-recently-used entries are evicted past the limit (a mapping that is still in use stays valid after that).
+ARRAY_STORE_DIRECTORY = os.environ.get(
+    "ARRAY_STORE_DIR",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        "asb-demo-arrays",
+    ),
+)
+ARRAY_STORE_SIZE_LIMIT = int(
+    os.environ.get("ARRAY_STORE_SIZE_LIMIT", 256 * 1024**2)
+)  # bytes
+ALIGNMENT = 64  # bytes; every array starts on a multiple of this
+
+_store = None
+
+
+def get_store() -> diskcache.Cache:
+    global _store
+    if _store is None:
+        _store = diskcache.Cache(
+            directory=ARRAY_STORE_DIRECTORY,
+            size_limit=ARRAY_STORE_SIZE_LIMIT,
+            eviction_policy="least-recently-used",
+            statistics=1,
+        )
+    return _store
+
+
+def _align(offset) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def put(key, **arrays):
+    """
+    Stores the given arrays together under `key`, replacing whatever was there.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    header = {}
+    offset = 0  # From the start of the data, which follows the header
+    for name, array in arrays.items():
+        header[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + array.nbytes)
+    encoded_header = json.dumps(header).encode()
+
+    file = io.BytesIO()
+    file.write(len(encoded_header).to_bytes(8, "little"))
+    file.write(encoded_header)
+    data_start = _align(file.tell())
+    for name, array in arrays.items():
+        file.seek(data_start + header[name]["offset"])
+        file.write(array.tobytes())
+    file.seek(0)
+    get_store().set(key, file, read=True)
+
+
+def get(key):
+    """
+    Returns the dict of arrays stored under `key`, as read-only views onto the shared mapping, or None if there is no
+    such entry (or it was evicted).
+    """
+    file = get_store().get(key, read=True)
+    if file is None:
+        return None
+    with file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    header_size = int.from_bytes(buffer[:8], "little")
+    header = json.loads(buffer[8 : 8 + header_size])
+    data_start = _align(8 + header_size)
+    arrays = {}
+    for name, entry in header.items():
+        size = int(np.prod(entry["shape"]))
+        if size == 0:
+            arrays[name] = np.empty(entry["shape"], dtype=entry["dtype"])
+            continue
+        arrays[name] = np.frombuffer(
+            buffer,
+            dtype=entry["dtype"],
+            count=size,
+            offset=data_start + entry["offset"],
+        ).reshape(entry["shape"])
+    return arrays
+
+
+def stats() -> dict:
+    store = get_store()
+    hits, misses = store.stats()
+    return {
+        "hits": hits,
+        "misses": misses,
+        "entries": len(store),
+        "size_bytes": store.volume(),
+        "size_limit_bytes": ARRAY_STORE_SIZE_LIMIT,
+    }
@@ -0,0 +1,173 @@
+// Builds the 3D view in the browser from the compact payloads made by scene.py, so that the server never sends
+// a full Plotly figure for the airplane: the mesh arrives once per configuration, and each run only adds per-panel
+// intensities and streamlines on top of it.
+
+(function () {
+    const ARRAY_TYPES = {
+        float32: Float32Array,
+        uint32: Uint32Array,
+        int16: Int16Array,
+    };
+
+    function decode(payload) {
+        const binary = atob(payload.data);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        const array = new ARRAY_TYPES[payload.dtype](bytes.buffer);
+        if (!payload.scale) {
+            return array;
+        }
+        // Quantized coordinates: value = offset + scale * q, per axis
+        const values = new Float32Array(array.length);
+        for (let i = 0; i < array.length; i++) {
+            values[i] = payload.offset[i % 3] + payload.scale[i % 3] * array[i];
+        }
+        return values;
+    }
+
+    // Splits an (n, 3) array of points into x, y, z columns
+    function columns(points) {
+        const n = points.length / 3;
+        const x = new Float32Array(n), y = new Float32Array(n), z = new Float32Array(n);
+        for (let i = 0; i < n; i++) {
+            x[i] = points[3 * i];
+            y[i] = points[3 * i + 1];
+            z[i] = points[3 * i + 2];
+        }
+        return [x, y, z];
+    }
+
+    // Polylines, separated by gaps; `paths` yields lists of point indices
+    function lineTrace(points, paths, color, width) {
+        const x = [], y = [], z = [];
+        for (const path of paths) {
+            for (const p of path) {
+                x.push(points[3 * p]);
+                y.push(points[3 * p + 1]);
+                z.push(points[3 * p + 2]);
+            }
+            x.push(null);
+            y.push(null);
+            z.push(null);
+        }
+        return {
+            type: "scatter3d",
+            x: x,
+            y: y,
+            z: z,
+            mode: "lines",
+            name: "",
+            line: {color: color, width: width},
+            showlegend: false,
+        };
+    }
+
+    function* quadOutlines(faces) {
+        for (let f = 0; f < faces.length; f += 4) {
+            yield [faces[f], faces[f + 1], faces[f + 2], faces[f + 3], faces[f]];
+        }
+    }
+
+    function* polylines(nLines, nSteps) {
+        for (let l = 0; l < nLines; l++) {
+            const path = new Array(nSteps);
+            for (let s = 0; s < nSteps; s++) {
+                path[s] = l * nSteps + s;
+            }
+            yield path;
+        }
+    }
+
+    function render(geometry, scene) {
+        const no_update = window.dash_clientside.no_update;
+        if (!scene) {
+            return no_update;
+        }
+        if (scene.figure) {
+            return scene.figure;
+        }
+        if (!geometry || geometry.key !== scene.geometry) {
+            return no_update;  // The matching mesh has not arrived yet
+        }
+
+        const points = decode(geometry.points);
+        const faces = decode(geometry.faces);
+        const [x, y, z] = columns(points);
+
+        // Two triangles per quad; intensity per triangle, so that each panel is a flat color
+        const nQuads = faces.length / 4;
+        const i = new Uint32Array(2 * nQuads), j = new Uint32Array(2 * nQuads), k = new Uint32Array(2 * nQuads);
+        const intensity = new Float32Array(2 * nQuads);
+        const panelIntensity = scene.intensity ? decode(scene.intensity) : null;
+        for (let q = 0; q < nQuads; q++) {
+            const [a, b, c, d] = faces.subarray(4 * q, 4 * q + 4);
+            i[2 * q] = a; j[2 * q] = b; k[2 * q] = c;
+            i[2 * q + 1] = a; j[2 * q + 1] = c; k[2 * q + 1] = d;
+            if (panelIntensity) {
+                intensity[2 * q] = intensity[2 * q + 1] = panelIntensity[q];
+            }
+        }
+
+        const data = [
+            {
+                type: "mesh3d",
+                x: x,
+                y: y,
+                z: z,
+                i: i,
+                j: j,
+                k: k,
+                intensity: intensity,
+                intensitymode: "cell",
+                flatshading: false,
+                colorscale: "Viridis",
+                colorbar: {title: {text: scene.colorbar_title || ""}},
+                showscale: Boolean(panelIntensity),
+            },
+            lineTrace(points, quadOutlines(faces), "rgb(0,0,0)", 3),
+        ];
+        if (scene.streamlines) {
+            const [nLines, nSteps] = scene.streamlines.shape;
+            data.push(
+                lineTrace(decode(scene.streamlines), polylines(nLines, nSteps), "rgba(119,0,255,200)", 1)
+            );
+        }
+
+        return {
+            data: data,
+            layout: {
+                autosize: true,
+                margin: {l: 0, r: 0, b: 0, t: 0},
+                scene: {aspectmode: "data"},
+            },
+        };
+    }
+
+    // Draws a stage streamed from a running analysis (see `run_analysis` in app.py): the stage names its mesh by key
+    // only, so the mesh is fetched (once, and cacheable) unless the browser already has it.
+    let latestStage = null;
+
+    async function showStage(stage, geometryKey, scene) {
+        const no_update = window.dash_clientside.no_update;
+        latestStage = JSON.stringify(stage);
+        if (!stage || JSON.stringify(stage.scene) === JSON.stringify(scene)) {
+            return [no_update, no_update, no_update];
+        }
+        if (stage.geometry === geometryKey) {
+            return [no_update, no_update, stage.scene];
+        }
+        const response = await fetch("/geometry/" + stage.geometry);
+        const geometry = response.ok ? await response.json() : null;
+        // The job may have finished (and the stage been cleared) meanwhile; its final result must not be overdrawn
+        if (!geometry || latestStage !== JSON.stringify(stage)) {
+            return [no_update, no_update, no_update];
+        }
+        return [geometry, stage.geometry, stage.scene];
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        scene: {render: render, showStage: showStage},
+    });
+})();
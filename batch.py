@@ -0,0 +1,291 @@
+import argparse
+import csv
+import io
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import tempfile
+import time
+
+import diskcache
+import numpy as np
+
+from airplane import make_airplane
+from analysis import analyse_ll, analyse_vlm, summarize_performance
+
+### Batch evaluation of many (n_booms, wing_span, alpha) cases, for trade studies.
+# Cases come from a grid or a CSV file with those columns (optionally also "method" and "fidelity"). Each case runs
+# in its own forked worker process, at most `max_workers` at a time, and is killed if it runs past `timeout`.
+# Rows are yielded as cases finish (not in input order), so results can be streamed out without being held in
+# memory. A case that fails, stalls, or times out produces a row with that status instead of aborting the batch.
+#
+# Usage:
+#   python batch.py --n_booms 1 2 3 --wing_span 30 40 50 --alpha 0 5 10 --output results.csv
+#   python batch.py --cases cases.csv --method ll --output results.parquet  (Parquet output needs pyarrow)
+
+### Results of batches run as server jobs (see app.py's /batch): the job's progress under (job,), and its rows under
+# (job, i). Kept apart from the LRU results cache, which could evict some rows of a finished batch, in a store that
+# evicts nothing; entries expire after RESULTS_LIFETIME instead.
+RESULTS_DIRECTORY = os.environ.get(
+    "BATCH_RESULTS_DIR",
+    os.path.join(tempfile.gettempdir(), "asb-demo-batches"),
+)
+RESULTS_LIFETIME = 24 * 3600  # s
+
+_store = None
+
+INPUT_COLUMNS = ["n_booms", "wing_span", "alpha", "method", "fidelity"]
+OUTPUT_COLUMNS = ["status", "CL", "CD", "L/D", "Cm", "seconds", "error"]
+COLUMNS = ["case"] + INPUT_COLUMNS + OUTPUT_COLUMNS
+
+
+def get_store() -> diskcache.Cache:
+    global _store
+    if _store is None:
+        _store = diskcache.Cache(directory=RESULTS_DIRECTORY, eviction_policy="none")
+    return _store
+
+
+def put(key, value):
+    get_store().set(key, value, expire=RESULTS_LIFETIME)
+
+
+def get(key):
+    return get_store().get(key)
+
+
+def cases_from_grid(n_booms, wing_span, alpha):
+    """
+    Yields every combination of the given values, as dicts of "n_booms", "wing_span", and "alpha".
+    """
+    for values in itertools.product(n_booms, wing_span, alpha):
+        yield dict(zip(["n_booms", "wing_span", "alpha"], values))
+
+
+def cases_from_csv(lines):
+    """
+    Yields the cases in a CSV file (an iterable of lines, e.g. an open file), one dict per row. Columns other than
+    INPUT_COLUMNS are ignored.
+    """
+    for row in csv.DictReader(lines):
+        case = {}
+        for column in INPUT_COLUMNS:
+            value = (row.get(column) or "").strip()
+            if value == "":
+                continue
+            case[column] = value if column == "method" else float(value)
+        if "n_booms" in case:
+            case["n_booms"] = int(case["n_booms"])
+        yield case
+
+
+def evaluate_case(case, method="vlm", fidelity=1) -> dict:
+    """
+    Runs a single case (without drawing) and returns its CL, CD, L/D, and Cm, with status "ok", or just status
+    "stalled" if the solution is not finite.
+    """
+    method = case.get("method", method)
+    analyse = {"vlm": analyse_vlm, "ll": analyse_ll}[method]
+    ap, result = analyse(
+        my_airplane=make_airplane(
+            n_booms=case["n_booms"],
+            wing_span=case["wing_span"],
+        ),
+        ms_velocity=20,
+        angle_of_attack=case["alpha"],
+        angle_of_sideslip=0,
+        fidelity=case.get("fidelity", fidelity),
+    )
+    performance = summarize_performance(result)
+    if performance is None:
+        return {"status": "stalled"}
+    return {"status": "ok", **performance, "Cm": float(result["Cm"])}
+
+
+def _run_case(connection, case, method, fidelity):
+    # Runs in the forked worker; always answers, so that the parent can tell failures from crashes
+    try:
+        outcome = evaluate_case(case, method, fidelity)
+    except Exception as e:
+        outcome = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+    connection.send(outcome)
+    connection.close()
+
+
+def run_batch(
+    cases,
+    method="vlm",
+    fidelity=1,
+    max_workers=None,
+    timeout=60,
+):
+    """
+    Evaluates an iterable of cases across worker processes, yielding one row (a dict with all of COLUMNS) per case
+    as each one finishes. Status is one of "ok", "stalled", "failed", or "timeout".
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    context = multiprocessing.get_context("fork")  # Workers inherit the warm airplane and airfoil caches
+    cases = enumerate(cases)
+    running = {}  # connection -> (process, index, case, start time)
+
+    def row(index, case, outcome, start):
+        return {
+            "case": index,
+            "method": method,
+            "fidelity": fidelity,
+            **case,
+            "CL": np.nan,
+            "CD": np.nan,
+            "L/D": np.nan,
+            "Cm": np.nan,
+            "error": "",
+            **outcome,
+            "seconds": time.monotonic() - start,
+        }
+
+    while True:
+        ### Keep the workers busy
+        while len(running) < max_workers:
+            index, case = next(cases, (None, None))
+            if case is None:
+                break
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_run_case,
+                args=(sender, case, method, fidelity),
+                daemon=True,
+            )
+            process.start()
+            sender.close()
+            running[receiver] = (process, index, case, time.monotonic())
+        if not running:
+            return
+
+        ### Collect whatever finishes before the earliest deadline
+        earliest_start = min(start for _, _, _, start in running.values())
+        for connection in multiprocessing.connection.wait(
+            list(running),
+            timeout=max(0, earliest_start + timeout - time.monotonic()),
+        ):
+            process, index, case, start = running.pop(connection)
+            try:
+                outcome = connection.recv()
+            except EOFError:
+                outcome = {"status": "failed", "error": "Worker exited"}
+            connection.close()
+            process.join()
+            yield row(index, case, outcome, start)
+
+        ### Kill anything past its deadline
+        for connection, (process, index, case, start) in list(running.items()):
+            if time.monotonic() - start > timeout:
+                process.kill()
+                process.join()
+                connection.close()
+                del running[connection]
+                yield row(
+                    index,
+                    case,
+                    {"status": "timeout", "error": f"Exceeded {timeout} s"},
+                    start,
+                )
+
+
+def csv_lines(rows):
+    """
+    Yields CSV text: the header line, then one line per row as it arrives.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for row in itertools.chain([None], rows):
+        if row is not None:
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def write_csv(rows, file):
+    for line in csv_lines(rows):
+        file.write(line)
+        file.flush()
+
+
+def write_parquet(rows, path, rows_per_group=64):
+    """
+    Writes rows to a Parquet file, one row group every `rows_per_group` rows. Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("case", pa.int64()),
+            ("n_booms", pa.int64()),
+            ("wing_span", pa.float64()),
+            ("alpha", pa.float64()),
+            ("method", pa.string()),
+            ("fidelity", pa.float64()),
+            ("status", pa.string()),
+            ("CL", pa.float64()),
+            ("CD", pa.float64()),
+            ("L/D", pa.float64()),
+            ("Cm", pa.float64()),
+            ("seconds", pa.float64()),
+            ("error", pa.string()),
+        ]
+    )
+    with pq.ParquetWriter(path, schema) as writer:
+        group = []
+        for row in itertools.chain(rows, [None]):
+            if row is not None:
+                group.append({column: row.get(column) for column in COLUMNS})
+            if group and (row is None or len(group) >= rows_per_group):
+                writer.write_table(pa.Table.from_pylist(group, schema=schema))
+                group = []
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Evaluate a grid or CSV of cases, writing a row per case as it finishes."
+    )
+    parser.add_argument("--cases", help="CSV file of cases (instead of a grid)")
+    parser.add_argument("--n_booms", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--wing_span", type=float, nargs="+", default=[43])
+    parser.add_argument("--alpha", type=float, nargs="+", default=[7])
+    parser.add_argument("--method", choices=["vlm", "ll"], default="vlm")
+    parser.add_argument("--fidelity", type=float, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=60, help="Per case [s]")
+    parser.add_argument(
+        "--output", help="CSV or .parquet file to write (default: CSV to stdout)"
+    )
+    args = parser.parse_args(args)
+
+    if args.cases:
+        with open(args.cases, newline="") as file:
+            cases = list(cases_from_csv(file))
+    else:
+        cases = cases_from_grid(args.n_booms, args.wing_span, args.alpha)
+
+    rows = run_batch(
+        cases,
+        method=args.method,
+        fidelity=args.fidelity,
+        max_workers=args.workers,
+        timeout=args.timeout,
+    )
+    if args.output is None:
+        write_csv(rows, sys.stdout)
+    elif args.output.endswith(".parquet"):
+        write_parquet(rows, args.output)
+    else:
+        with open(args.output, "w", newline="") as file:
+            write_csv(rows, file)
+
+
+if __name__ == "__main__":
+    main()
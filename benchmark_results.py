@@ -0,0 +1,35 @@
+import json
+import os
+
+### Results of the benchmark suite (see benchmarks.py); the app's button labels are read from here.
+# Kept apart from the benchmarks themselves, which import every solver, so that the app can read them at startup.
+BENCHMARK_RESULTS = os.environ.get(
+    "BENCHMARK_RESULTS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks.json"),
+)
+
+
+def load_results(path=BENCHMARK_RESULTS):
+    try:
+        with open(path) as f:
+            return json.load(f)["results"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def estimate_seconds(stages, results=None):
+    """
+    Returns the (fastest, slowest) measured total time of the given stages over the benchmarked configurations, or
+    None if there are no benchmark results.
+    """
+    results = load_results() if results is None else results
+    if not results:
+        return None
+    totals = {}
+    for result in results:
+        if result["stage"] in stages:
+            case = (result["n_booms"], result["wing_span"])
+            totals[case] = totals.get(case, 0) + result["median_s"]
+    if not totals:
+        return None
+    return (min(totals.values()), max(totals.values()))
@@ -0,0 +1,690 @@
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import aerosandbox as asb
+import diskcache
+import numpy as np
+
+from airplane import _build_airplane, build_fuse, make_airplane
+from analysis import (
+    analyse_ll,
+    analyse_progressively,
+    analyse_vlm,
+    summarize_performance,
+)
+import array_store
+from benchmark_results import BENCHMARK_RESULTS, load_results
+import envelope
+import scene
+import sensitivity
+import vlm
+
+### The fuselage's dimensions, as in make_airplane
+FUSE_ARGUMENTS = dict(
+    boom_length=6.181,
+    nose_length=1.5,
+    fuse_diameter=0.6,
+    boom_diameter=0.2,
+    wing_x_quarter_chord=-0.1,
+    wing_root_chord=2.316,
+)
+
+
+@contextlib.contextmanager
+def silence_stdout():
+    # IPOPT prints from C, so redirect the file descriptor rather than sys.stdout
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            yield
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+@contextlib.contextmanager
+def cold_vlm_sessions():
+    """
+    Swaps in a VLM session store that stores nothing, so that every VLM run assembles and factors its system
+    rather than loading a factorization left by an earlier run.
+    """
+    saved_sessions = vlm._sessions
+    with tempfile.TemporaryDirectory() as directory:
+        vlm._sessions = diskcache.Cache(directory, size_limit=0)
+        try:
+            yield
+        finally:
+            vlm._sessions.close()
+            vlm._sessions = saved_sessions
+
+
+def time_call(function, n_repeats=5):
+    """
+    Returns the median wall time of `function()` over `n_repeats` calls, in seconds.
+    """
+    times = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def bench_opti_overhead(n_booms=1, wing_span=43, alpha=7.0, n_repeats=5):
+    """
+    Compares the analysis stage of the LL and VLM buttons as they used to run (wrapped in an Opti environment and
+    an IPOPT solve) against the direct numeric path. Drawing is the same in both cases and is not included.
+    """
+    airplane = make_airplane(
+        n_booms=n_booms,
+        wing_span=wing_span,
+    )
+
+    def with_opti(analyse):
+        opti = asb.Opti()
+        ap, result = analyse(
+            my_airplane=airplane,
+            ms_velocity=20,
+            angle_of_attack=alpha,
+            angle_of_sideslip=0,
+        )
+        opti.solver("ipopt", {}, {"max_iter": 50})
+        with silence_stdout():
+            sol = opti.solve()
+        return sol.value(result["CL"]), sol.value(result["CD"])
+
+    def direct(analyse):
+        ap, result = analyse(
+            my_airplane=airplane,
+            ms_velocity=20,
+            angle_of_attack=alpha,
+            angle_of_sideslip=0,
+        )
+        return summarize_performance(result)
+
+    results = {}
+    for name, analyse in [("LL", analyse_ll), ("VLM", analyse_vlm)]:
+        direct(analyse)  # Warm up (airfoil store, NeuralFoil weights, etc.)
+        results[name] = {
+            "opti": time_call(lambda: with_opti(analyse), n_repeats),
+            "direct": time_call(lambda: direct(analyse), n_repeats),
+        }
+        print(
+            f"{name:>4}: with Opti {results[name]['opti'] * 1e3:8.1f} ms, "
+            f"direct {results[name]['direct'] * 1e3:8.1f} ms"
+        )
+
+    return results
+
+
+def bench_payload_size(n_booms=1, wing_span=43, alpha=7.0):
+    """
+    Compares the bytes sent to the browser for the 3D view: the full Plotly figure JSON that used to be sent on every
+    click, against the compact payloads (see scene.py) - the mesh, sent once per configuration, plus the scene.
+    """
+    airplane = make_airplane(
+        n_booms=n_booms,
+        wing_span=wing_span,
+    )
+
+    def size(payload):
+        return len(json.dumps(payload))
+
+    results = {}
+    for name, analyse in [("display", None), ("LL", analyse_ll), ("VLM", analyse_vlm)]:
+        if analyse is None:
+            figure = airplane.draw(show=False, backend="plotly")
+            geometry = scene.body_geometry(airplane, key=name)
+            view = {"geometry": name}
+        else:
+            ap, result = analyse(
+                my_airplane=airplane,
+                ms_velocity=20,
+                angle_of_attack=alpha,
+                angle_of_sideslip=0,
+            )
+            figure = ap.draw(show=False, backend="plotly")
+            geometry = scene.panel_geometry(ap, key=name)
+            view = scene.solution_scene(ap, key=name)
+
+        results[name] = {
+            "figure": len(figure.to_json()),
+            "first": size(geometry) + size(view),
+            "repeat": size(view),
+        }
+        print(
+            f"{name:>8}: figure {results[name]['figure'] / 1e3:8.1f} kB, "
+            f"mesh + scene {results[name]['first'] / 1e3:8.1f} kB, "
+            f"scene only {results[name]['repeat'] / 1e3:8.1f} kB"
+        )
+
+    return results
+
+
+def bench_fuse_scaling(
+    resolutions=(10, 30, 100, 300, 1000),
+    boom_counts=(1, 2, 3),
+    n_repeats=5,
+):
+    """
+    Times building the fuselage (`build_fuse`) and the whole airplane (uncached) against the fuselage resolution.
+    The time per station should stay flat as the resolution grows.
+    """
+    results = []
+    for resolution in resolutions:
+        result = {
+            "resolution": resolution,
+            "stations": len(build_fuse(**FUSE_ARGUMENTS, resolution=resolution).xsecs),
+            "build_fuse_s": time_call(
+                lambda: build_fuse(**FUSE_ARGUMENTS, resolution=resolution), n_repeats
+            ),
+        }
+        for n_booms in boom_counts:
+            result[f"airplane_{n_booms}_booms_s"] = time_call(
+                lambda: _build_airplane(n_booms, 43, fuse_resolution=resolution),
+                n_repeats,
+            )
+        results.append(result)
+        print(
+            f"resolution {resolution:>5} ({result['stations']:>5} stations): "
+            f"build_fuse {result['build_fuse_s'] * 1e3:7.2f} ms "
+            f"({result['build_fuse_s'] / result['stations'] * 1e6:5.2f} us/station), "
+            + ", ".join(
+                f"{n_booms} booms {result[f'airplane_{n_booms}_booms_s'] * 1e3:7.2f} ms"
+                for n_booms in boom_counts
+            )
+        )
+
+    return results
+
+
+def bench_boom_scaling(boom_counts=(1, 2, 3, 4, 6), wing_span=60, n_repeats=3):
+    """
+    Times the VLM factorization (meshing, assembly, and LU, with nothing stored) with and without the symmetry
+    reduction, and the airplane's body mesh instanced against meshing every boom's copy, as the boom count grows.
+    """
+    results = []
+    with cold_vlm_sessions():
+        for n_booms in boom_counts:
+            airplane = make_airplane(n_booms=n_booms, wing_span=wing_span)
+            op_point = asb.OperatingPoint(velocity=20, alpha=5)
+
+            def factor(exploit_symmetry):
+                analysis = vlm.FactoredVortexLatticeMethod(
+                    airplane=airplane,
+                    op_point=op_point,
+                    exploit_symmetry=exploit_symmetry,
+                )
+                analysis.factor()
+                return analysis
+
+            analysis = factor(True)
+            result = {
+                "n_booms": n_booms,
+                "panels": len(analysis.vortex_centers),
+                "unknowns": len(analysis.unknowns),
+                "vlm_symmetric_s": time_call(lambda: factor(True), n_repeats),
+                "vlm_full_s": time_call(lambda: factor(False), n_repeats),
+                "mesh_instanced_s": time_call(
+                    lambda: scene.body_mesh(airplane), n_repeats
+                ),
+                "mesh_copies_s": time_call(
+                    lambda: airplane.mesh_body(method="quad"), n_repeats
+                ),
+            }
+            results.append(result)
+            print(
+                f"{n_booms} booms ({result['panels']:>5} panels, "
+                f"{result['unknowns']:>5} unknowns): "
+                f"VLM symmetric {result['vlm_symmetric_s']:6.2f} s, "
+                f"full {result['vlm_full_s']:6.2f} s; "
+                f"body mesh instanced {result['mesh_instanced_s'] * 1e3:6.1f} ms, "
+                f"copies {result['mesh_copies_s'] * 1e3:6.1f} ms"
+            )
+
+    return results
+
+
+def bench_gradients(n_booms=1, wing_span=43, alpha=5.0, step=1e-3, n_repeats=5):
+    """
+    Compares the exact gradients of CL, CD, and L/D (sensitivity.py) against central finite differences of the
+    numeric LL analysis: time per gradient, largest difference, and the one-off cost of building the function.
+    """
+    point = dict(wing_span=wing_span, alpha=alpha, hstab_twist_angle=-4)
+
+    def performance(**inputs):
+        ap, result = analyse_ll(
+            my_airplane=make_airplane(
+                n_booms=n_booms,
+                wing_span=inputs["wing_span"],
+                hstab_twist_angle=inputs["hstab_twist_angle"],
+            ),
+            ms_velocity=20,
+            angle_of_attack=inputs["alpha"],
+            angle_of_sideslip=0,
+        )
+        return summarize_performance(result)
+
+    def finite_differences():
+        gradients = {output: {} for output in sensitivity.OUTPUTS}
+        for name in sensitivity.INPUTS:
+            plus = performance(**{**point, name: point[name] + step})
+            minus = performance(**{**point, name: point[name] - step})
+            for output in sensitivity.OUTPUTS:
+                gradients[output][name] = (plus[output] - minus[output]) / (2 * step)
+        return gradients
+
+    start = time.perf_counter()
+    sensitivity.build_gradient_function(n_booms)
+    build_s = time.perf_counter() - start
+    exact = sensitivity.sensitivities(n_booms, **point)["gradients"]
+    approximate = finite_differences()
+
+    results = {
+        "build_s": build_s,
+        "exact_s": time_call(
+            lambda: sensitivity.sensitivities(n_booms, **point), n_repeats
+        ),
+        "finite_differences_s": time_call(finite_differences, n_repeats),
+        "max_relative_difference": max(
+            abs(exact[output][name] - approximate[output][name])
+            / max(abs(exact[output][name]), 1e-12)
+            for output in sensitivity.OUTPUTS
+            for name in sensitivity.INPUTS
+        ),
+    }
+    print(
+        f"exact {results['exact_s'] * 1e3:7.1f} ms per gradient "
+        f"(built once in {results['build_s']:.1f} s), "
+        f"finite differences {results['finite_differences_s'] * 1e3:7.1f} ms; "
+        f"largest relative difference {results['max_relative_difference']:.1e}"
+    )
+
+    return results
+
+
+def bench_envelope(n_booms=1, wing_span=43, mass=2000, n_samples=10, seed=0):
+    """
+    Times the flight envelope (envelope.py) over its default grid, against what one LL analysis per grid point and
+    angle of attack would take (estimated from `n_samples` random ones, run directly at their altitude and airspeed),
+    and measures the largest error in CL and CD from reusing the Reynolds-number sweep at those points.
+    """
+    start = time.perf_counter()
+    flight_envelope = envelope.run_envelope(n_booms, wing_span, mass)
+    envelope_s = time.perf_counter() - start
+
+    airplane = make_airplane(n_booms=n_booms, wing_span=wing_span)
+    rng = np.random.default_rng(seed)
+    feasible = np.argwhere(np.isfinite(flight_envelope["alpha"]))
+    point_times = []
+    errors = {"CL": [], "CD": []}
+    for i, j in feasible[rng.choice(len(feasible), n_samples, replace=False)]:
+        start = time.perf_counter()
+        ap, result = analyse_ll(
+            my_airplane=airplane,
+            ms_velocity=flight_envelope["velocity"][j],
+            angle_of_attack=flight_envelope["alpha"][i, j],
+            angle_of_sideslip=0,
+            altitude=flight_envelope["altitude"][i],
+        )
+        point_times.append(time.perf_counter() - start)
+        for name in errors:
+            errors[name].append(abs(result[name] / flight_envelope[name][i, j] - 1))
+
+    n_points = (
+        len(envelope.ALTITUDES) * len(envelope.VELOCITIES) * len(envelope.ALPHAS)
+    )
+    results = {
+        "envelope_s": envelope_s,
+        "pointwise_s": float(np.median(point_times)) * n_points,
+        "pointwise_analyses": n_points,
+        "sweep_analyses": envelope.N_REYNOLDS * len(envelope.ALPHAS),
+        **{
+            f"max_{name}_error": float(max(values))
+            for name, values in errors.items()
+        },
+    }
+    print(
+        f"envelope {results['envelope_s']:.1f} s "
+        f"({results['sweep_analyses']} LL analyses), "
+        f"point by point ~{results['pointwise_s']:.0f} s ({n_points} analyses); "
+        f"largest relative error CL {results['max_CL_error']:.1e}, "
+        f"CD {results['max_CD_error']:.1e}"
+    )
+
+    return results
+
+
+def bench_store_reads(
+    n_booms=3, wing_span=43, fidelity=2, n_readers=4, n_holds=10, n_repeats=20
+):
+    """
+    Compares two ways for workers to read back a stored VLM panel mesh: unpickling its encoded payload from a
+    diskcache entry (how meshes used to be kept in the results cache), against mapping its arrays from the array
+    store. Reports the time per read, and the private memory (USS) that each of `n_readers` forked readers adds by
+    holding `n_holds` reads of the mesh (as if serving that many requests) at the same time: pages that the readers
+    share, such as a common mapping, don't count.
+    """
+    import psutil  # Installed with Dash
+
+    ap, result = analyse_vlm(
+        my_airplane=make_airplane(n_booms=n_booms, wing_span=wing_span),
+        ms_velocity=20,
+        angle_of_attack=7.0,
+        angle_of_sideslip=0,
+        fidelity=fidelity,
+    )
+    points, faces = scene.panel_mesh(ap)
+    context = multiprocessing.get_context("fork")
+
+    def hold(read, ready, done, connection):
+        # Runs in a forked reader: read the mesh, touch all of it, and stay alive until every reader has too
+        process = psutil.Process()
+        before = process.memory_full_info().uss
+        values = [read() for _ in range(n_holds)]
+        for value in values:
+            for array in value.values():
+                if isinstance(array, np.ndarray):
+                    array.sum()  # Touch every page of the mapping
+        ready.wait()
+        connection.send(process.memory_full_info().uss - before)
+        done.wait()
+
+    results = {"panels": len(ap.front_left_vertices)}
+    with tempfile.TemporaryDirectory() as directory:
+        pickled = diskcache.Cache(os.path.join(directory, "pickled"))
+        pickled.set("mesh", scene.geometry_payload("mesh", points, faces))
+        array_store._store = diskcache.Cache(os.path.join(directory, "arrays"))
+        scene.save_geometry("mesh", points, faces)
+
+        for name, read in [
+            ("lookup", lambda: pickled.get("missing", {})),  # Just opening a store, for reference
+            ("pickle", lambda: pickled.get("mesh")),
+            ("mmap", lambda: array_store.get("mesh")),
+        ]:
+            ready = context.Barrier(n_readers + 1)
+            done = context.Event()
+            connections = []
+            processes = []
+            for _ in range(n_readers):
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=hold, args=(read, ready, done, sender))
+                process.start()
+                connections.append(receiver)
+                processes.append(process)
+            ready.wait()
+            uss = [connection.recv() for connection in connections]
+            done.set()
+            for process in processes:
+                process.join()
+
+            results[name] = {
+                "read_s": time_call(read, n_repeats),
+                "uss_per_reader_bytes": float(np.mean(uss)),
+            }
+            print(
+                f"{name:>6}: {results[name]['read_s'] * 1e3:7.3f} ms per read, "
+                f"{results[name]['uss_per_reader_bytes'] / 1e3:8.1f} kB per reader "
+                f"({n_readers} readers x {n_holds} reads, {results['panels']} panels)"
+            )
+
+        pickled.close()
+        array_store._store.close()
+        array_store._store = None
+
+    return results
+
+
+def bench_startup(n_repeats=5, n_slowest=8):
+    """
+    Times cold starts of the app, each in a fresh interpreter with empty caches: importing it (what every worker
+    would pay without --preload), and warming its caches (what the gunicorn master pays once, before forking). Also
+    lists the app's slowest direct imports, from `python -X importtime`.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    def run(code, *options):
+        with tempfile.TemporaryDirectory() as stores:
+            environment = {
+                **os.environ,
+                **{
+                    variable: os.path.join(stores, variable)
+                    for variable in [
+                        "RESULTS_CACHE_DIR",
+                        "ARRAY_STORE_DIR",
+                        "METRICS_DIR",
+                        "JOBS_CACHE_DIR",
+                        "VLM_SESSION_DIR",
+                    ]
+                },
+            }
+            start = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, *options, "-c", code],
+                cwd=directory,
+                env=environment,
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            return time.perf_counter() - start, process.stderr
+
+    def median_time(code):
+        return float(np.median([run(code)[0] for _ in range(n_repeats)]))
+
+    results = {
+        "interpreter_s": median_time("pass"),
+        "import_s": median_time("import app"),
+        "import_and_warm_s": median_time("import app; app.warm_caches()"),
+    }
+
+    # Lines are "import time: self [us] | cumulative [us] | <indent>module"; the app's own imports are one level in
+    imports = []
+    for line in run("import app", "-X", "importtime")[1].splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if len(name) - len(name.lstrip()) == 3:
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    results["slowest_imports"] = sorted(imports, key=lambda item: -item[1])[:n_slowest]
+
+    for label, name in [
+        ("interpreter", "interpreter_s"),
+        ("import app", "import_s"),
+        ("import app + warm_caches", "import_and_warm_s"),
+    ]:
+        print(f"{label:<28} {results[name] * 1e3:8.1f} ms")
+    for name, seconds in results["slowest_imports"]:
+        print(f"  {name:<26} {seconds * 1e3:8.1f} ms (cumulative)")
+
+    return results
+
+
+def measure(function, setup=lambda: None, n_repeats=3) -> dict:
+    """
+    Times `function(setup())` (setup is not timed) and records the peak traced memory of one extra, untimed call.
+    Returns a dict of "median_s", "min_s", and "peak_memory_bytes".
+    """
+    times = []
+    for _ in range(n_repeats):
+        argument = setup()
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+
+    argument = setup()
+    tracemalloc.start()
+    try:
+        function(argument)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_s": float(np.median(times)),
+        "min_s": float(np.min(times)),
+        "peak_memory_bytes": int(peak),
+    }
+
+
+def benchmark_stages(n_booms, wing_span, alpha=7.0):
+    """
+    Returns {stage name: (function, setup)} for every stage of the app's analyses at one configuration.
+    """
+    airplane = make_airplane(
+        n_booms=n_booms,
+        wing_span=wing_span,
+    )
+
+    def analyse(method):
+        # As the app runs it: refined progressively from a coarse preview up to fidelity 1
+        return lambda _: analyse_progressively(
+            method,
+            my_airplane=airplane,
+            ms_velocity=20,
+            angle_of_attack=alpha,
+            angle_of_sideslip=0,
+        )
+
+    def draw(ap):
+        # What the app sends for an analysis: panels plus the solution (streamlines are computed here)
+        scene.panel_geometry(ap, key="")
+        scene.solution_scene(ap, key="")
+
+    return {
+        "make_airplane": (lambda _: _build_airplane(n_booms, wing_span), lambda: None),
+        "build_fuse": (lambda _: build_fuse(**FUSE_ARGUMENTS), lambda: None),
+        "ll": (analyse(analyse_ll), lambda: None),
+        "vlm": (analyse(analyse_vlm), lambda: None),
+        "draw_display": (lambda _: scene.body_geometry(airplane, key=""), lambda: None),
+        "draw_ll": (draw, lambda: analyse(analyse_ll)(None)[0]),
+        "draw_vlm": (draw, lambda: analyse(analyse_vlm)(None)[0]),
+    }
+
+
+def bench_suite(
+    boom_counts=(1, 2, 3),
+    wing_spans=(30, 43, 60),
+    n_repeats=3,
+    output=BENCHMARK_RESULTS,
+):
+    """
+    Times every stage across boom counts and spans, headless, and writes the results (with timing and peak memory
+    per stage and configuration) to `output` as JSON. VLM runs start cold (see `cold_vlm_sessions`), as a new
+    configuration does in the app, so that assembly and factorization are timed too.
+    """
+    results = []
+    with cold_vlm_sessions():
+        for n_booms in boom_counts:
+            for wing_span in wing_spans:
+                stages = benchmark_stages(n_booms, wing_span)
+                stages["ll"][0](None)  # Warm up (airfoil store, NeuralFoil weights, etc.)
+                for stage, (function, setup) in stages.items():
+                    results.append(
+                        {
+                            "stage": stage,
+                            "n_booms": n_booms,
+                            "wing_span": wing_span,
+                            **measure(function, setup, n_repeats),
+                        }
+                    )
+                    print(
+                        f"{stage:>14} n_booms={n_booms} wing_span={wing_span:>4}: "
+                        f"{results[-1]['median_s'] * 1e3:9.1f} ms, "
+                        f"peak {results[-1]['peak_memory_bytes'] / 1e6:7.1f} MB"
+                    )
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "n_repeats": n_repeats,
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def compare(baseline_path, current_path=BENCHMARK_RESULTS, threshold=1.2):
+    """
+    Prints, and returns, the stages whose median time grew by more than `threshold` times since the baseline.
+    """
+
+    def by_case(results):
+        return {
+            (result["stage"], result["n_booms"], result["wing_span"]): result
+            for result in results
+        }
+
+    baseline = by_case(load_results(baseline_path) or [])
+    current = by_case(load_results(current_path) or [])
+    regressions = []
+    for case in sorted(set(baseline) & set(current)):
+        ratio = current[case]["median_s"] / baseline[case]["median_s"]
+        if ratio > threshold:
+            regressions.append((*case, ratio))
+            print(f"{case[0]:>14} n_booms={case[1]} wing_span={case[2]:>4}: {ratio:.2f}x slower")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless benchmarks.")
+    parser.add_argument(
+        "benchmark",
+        nargs="?",
+        default="suite",
+        choices=[
+            "suite",
+            "opti_overhead",
+            "payload_size",
+            "startup",
+            "fuse_scaling",
+            "boom_scaling",
+            "gradients",
+            "store_reads",
+            "envelope",
+        ],
+    )
+    parser.add_argument("--output", default=BENCHMARK_RESULTS)
+    parser.add_argument("--n_repeats", type=int, default=3)
+    parser.add_argument(
+        "--baseline", help="Earlier suite results to check for regressions against"
+    )
+    args = parser.parse_args()
+
+    if args.benchmark == "suite":
+        bench_suite(n_repeats=args.n_repeats, output=args.output)
+        if args.baseline:
+            compare(args.baseline, args.output)
+    elif args.benchmark == "opti_overhead":
+        bench_opti_overhead()
+    elif args.benchmark == "payload_size":
+        bench_payload_size()
+    elif args.benchmark == "startup":
+        bench_startup()
+    elif args.benchmark == "fuse_scaling":
+        bench_fuse_scaling()
+    elif args.benchmark == "boom_scaling":
+        bench_boom_scaling()
+    elif args.benchmark == "gradients":
+        bench_gradients()
+    elif args.benchmark == "store_reads":
+        bench_store_reads()
+    elif args.benchmark == "envelope":
+        bench_envelope()
@@ -0,0 +1,213 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import aerosandbox as asb
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from airplane import make_airplane
+from polar import ll_point
+from trim import G
+
+### Flight envelope: level-flight L/D and power required over a grid of altitude x airspeed.
+# The LL coefficients at a given angle of attack depend on altitude and airspeed only through the Reynolds number
+# (the Mach number stays below ~0.2 here, and its effect is neglected). So instead of one analysis per grid point
+# and angle of attack, LL runs over alpha x a few log-spaced unit Reynolds numbers (V / nu) - all in parallel - and
+# every grid point reuses them, interpolated in log(Re). The atmosphere is evaluated for all altitudes at once.
+# At each grid point, level flight needs CL = weight / (q S); the angle of attack that gives it (below stall) is
+# interpolated from the sweep, and with it CD, L/D, and the power required, D V.
+
+ALTITUDES = np.linspace(0, 20e3, 21)  # m
+VELOCITIES = np.linspace(10, 60, 26)  # m/s
+ALPHAS = np.arange(-4, 15, 2.0)  # deg
+N_REYNOLDS = 6  # Unit Reynolds numbers the sweep is run at, spanning the grid's
+
+
+def atmosphere(altitudes) -> dict:
+    """
+    Returns the density [kg/m^3], kinematic viscosity [m^2/s], and speed of sound [m/s] at each of the altitudes
+    [m], as arrays.
+    """
+    atmosphere = asb.Atmosphere(altitude=np.asarray(altitudes, dtype=float))
+    return {
+        "density": atmosphere.density(),
+        "kinematic_viscosity": atmosphere.kinematic_viscosity(),
+        "speed_of_sound": atmosphere.speed_of_sound(),
+    }
+
+
+def run_sweep(n_booms, wing_span, alphas, unit_reynolds, fidelity=1):
+    """
+    Evaluates CL and CD at every angle of attack and unit Reynolds number [1/m], across a process pool. Each
+    Reynolds number is run at sea level, at the airspeed that gives it. Returns (CL, CD) arrays of shape
+    (len(unit_reynolds), len(alphas)); points where the analysis failed are NaN.
+    """
+    sea_level_velocities = (
+        np.asarray(unit_reynolds) * atmosphere(0)["kinematic_viscosity"]
+    )
+    velocities, alphas = [
+        grid.ravel()
+        for grid in np.meshgrid(sea_level_velocities, alphas, indexing="ij")
+    ]
+    with ProcessPoolExecutor(
+        max_workers=min(len(alphas), os.cpu_count() or 1)
+    ) as pool:
+        points = list(
+            pool.map(
+                ll_point,
+                repeat(n_booms),
+                repeat(wing_span),
+                alphas,
+                velocities,
+                repeat(fidelity),
+            )
+        )
+    CL, CD, _ = np.array(points).T
+    shape = (len(sea_level_velocities), -1)
+    return CL.reshape(shape), CD.reshape(shape)
+
+
+def run_envelope(
+    n_booms,
+    wing_span,
+    mass,
+    altitudes=ALTITUDES,
+    velocities=VELOCITIES,
+    alphas=ALPHAS,
+    n_reynolds=N_REYNOLDS,
+    fidelity=1,
+) -> dict:
+    """
+    Evaluates level flight at `mass` [kg] over the altitude [m] x airspeed [m/s] grid. Returns a dict of the
+    "altitude" and "velocity" axes, and arrays of shape (len(altitudes), len(velocities)) of:
+        alpha: the angle of attack [deg] that holds level flight
+        CL, CD, L/D: the coefficients there
+        power: the power required [kW], drag times airspeed
+        mach: the Mach number
+    Points where level flight is out of reach within `alphas` (too slow to hold altitude without stalling, or too
+    fast for the lowest angle) are NaN.
+    """
+    altitudes = np.asarray(altitudes, dtype=float)
+    velocities = np.asarray(velocities, dtype=float)
+    alphas = np.asarray(alphas, dtype=float)
+    air = {name: values[:, None] for name, values in atmosphere(altitudes).items()}
+    dynamic_pressure = 0.5 * air["density"] * velocities**2
+    log_reynolds = np.log(velocities / air["kinematic_viscosity"])
+
+    ### The sweep, and its coefficients at every grid point and angle of attack, interpolated in log(Re)
+    levels = np.linspace(log_reynolds.min(), log_reynolds.max(), n_reynolds)
+    CL_sweep, CD_sweep = run_sweep(
+        n_booms, wing_span, alphas, np.exp(levels), fidelity
+    )
+    CL, CD = [
+        np.stack(
+            [np.interp(log_reynolds, levels, sweep[:, i]) for i in range(len(alphas))],
+            axis=-1,
+        )
+        for sweep in [CL_sweep, CD_sweep]
+    ]
+
+    ### Level flight: the first angle of attack, up to stall (the maximum CL), at which CL reaches what is needed
+    airplane = make_airplane(n_booms=n_booms, wing_span=wing_span)
+    CL_required = mass * G / (dynamic_pressure * airplane.s_ref)
+    below_stall = np.arange(len(alphas)) <= np.argmax(CL, axis=-1)[..., None]
+    reached = below_stall & (CL >= CL_required[..., None])
+    upper = np.argmax(reached, axis=-1)[..., None]
+    lower = np.maximum(upper - 1, 0)
+    feasible = np.any(reached, axis=-1) & (upper[..., 0] > 0)
+
+    def bracket(values):
+        # The values at the angles of attack either side of level flight
+        return [
+            np.take_along_axis(values, index, axis=-1)[..., 0]
+            for index in [lower, upper]
+        ]
+
+    def where_feasible(values):
+        return np.where(feasible, values, np.nan)
+
+    CL_low, CL_high = bracket(CL)
+    alpha_low, alpha_high = bracket(np.broadcast_to(alphas, CL.shape))
+    CD_low, CD_high = bracket(CD)
+    with np.errstate(divide="ignore", invalid="ignore"):  # Only where infeasible
+        fraction = (CL_required - CL_low) / (CL_high - CL_low)
+        alpha = alpha_low + fraction * (alpha_high - alpha_low)
+        CD_level = CD_low + fraction * (CD_high - CD_low)
+
+    return {
+        "altitude": altitudes,
+        "velocity": velocities,
+        "alpha": where_feasible(alpha),
+        "CL": where_feasible(CL_required),
+        "CD": where_feasible(CD_level),
+        "L/D": where_feasible(CL_required / CD_level),
+        "power": where_feasible(
+            CD_level * dynamic_pressure * airplane.s_ref * velocities / 1e3
+        ),
+        "mach": velocities / air["speed_of_sound"],
+    }
+
+
+def summarize_envelope(envelope) -> dict:
+    """
+    The envelope's headline figures: its minimum power required and best L/D, where they are, and its ceiling.
+    Returns None if level flight is out of reach everywhere.
+    """
+    if np.all(np.isnan(envelope["power"])):
+        return None
+    summary = {}
+    for name, label, best in [
+        ("power", "Minimum power [kW]", np.nanargmin),
+        ("L/D", "Best L/D", np.nanargmax),
+    ]:
+        i, j = np.unravel_index(best(envelope[name]), envelope[name].shape)
+        summary[label] = float(envelope[name][i, j])
+        summary[f"{label}: altitude [m]"] = float(envelope["altitude"][i])
+        summary[f"{label}: airspeed [m/s]"] = float(envelope["velocity"][j])
+    flyable = np.any(np.isfinite(envelope["power"]), axis=1)
+    summary["Ceiling [m]"] = float(envelope["altitude"][flyable].max())
+    return summary
+
+
+def draw_envelope(envelope) -> go.Figure:
+    fig = make_subplots(
+        rows=1,
+        cols=2,
+        subplot_titles=["Level-Flight L/D", "Power Required [kW]"],
+    )
+    altitude_km = envelope["altitude"] / 1e3
+    for col, name in enumerate(["L/D", "power"], start=1):
+        fig.add_trace(
+            go.Contour(
+                x=envelope["velocity"],
+                y=altitude_km,
+                z=envelope[name].astype(np.float32),
+                colorscale="Viridis" if name == "L/D" else "Viridis_r",
+                colorbar=dict(x=0.45 if col == 1 else 1.0, len=0.9),
+                contours=dict(showlabels=True),
+                name=name,
+            ),
+            row=1,
+            col=col,
+        )
+        fig.update_xaxes(title_text="Airspeed [m/s]", row=1, col=col)
+        fig.update_yaxes(title_text="Altitude [km]", row=1, col=col)
+
+    # The minimum-power airspeed at each altitude, where there is one
+    flyable = np.any(np.isfinite(envelope["power"]), axis=1)
+    fig.add_trace(
+        go.Scatter(
+            x=envelope["velocity"][np.nanargmin(envelope["power"][flyable], axis=1)],
+            y=altitude_km[flyable],
+            mode="lines",
+            line=dict(color="white", dash="dash"),
+            name="Minimum power",
+        ),
+        row=1,
+        col=2,
+    )
+    fig.update_layout(showlegend=False)
+
+    return fig
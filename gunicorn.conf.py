@@ -0,0 +1,15 @@
+import gc
+
+### Production server settings; gunicorn reads this file from the working directory.
+# The app is imported once, in the master, and its caches warmed there before any worker is forked. Workers (and
+# the background jobs they fork in turn) then start with AeroSandbox imported, the airfoils loaded, and the default
+# airplanes built, sharing those pages copy-on-write instead of each importing and building everything again.
+preload_app = True
+threads = 1  # Sync workers: jobs are forked from the request thread, which must be the process's only one (see app.py)
+
+
+def on_starting(server):
+    import app
+
+    app.warm_caches()
+    gc.freeze()  # The warm objects live for good; keeping the collector off them keeps their pages shared
@@ -0,0 +1,146 @@
+import io
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+### Spanwise loads on the main wing, reduced from the per-panel solver outputs (see analysis.panel_outputs, kept in
+# the array store under each analysis's key).
+# Panels are grouped into spanwise strips, and each half-span's shear and bending moment are cumulative sums from
+# its tip inward, so the whole reduction is a handful of array operations, whatever the panel count.
+
+COLUMNS = {  # name: unit
+    "y": "m",
+    "width": "m",
+    "chord": "m",
+    "lift_per_span": "N/m",
+    "cl": "-",
+    "y_inboard": "m",
+    "shear": "N",
+    "bending_moment": "N m",
+}
+
+
+def spanwise_loads(solution, wing=0, decimals=6) -> dict:
+    """
+    Reduces the per-panel outputs of an analysis to the spanwise loads on one of its wings (by default the main
+    one). Returns a dict of arrays, one entry per spanwise strip, from left tip to right tip:
+        y: the strip's spanwise position [m]
+        width, chord: its spanwise width and mean chord [m]
+        lift_per_span: its lift per unit span [N/m]
+        cl: its sectional lift coefficient
+        y_inboard: the spanwise position of its inboard edge [m]
+        shear, bending_moment: the shear force [N] and bending moment [N m] at that edge, from everything outboard
+            of it on the same half of the wing (the values at the innermost strips are the root's)
+    """
+    on_wing = solution["wing_indices"] == wing
+    centers = solution["vortex_centers"][on_wing]
+    lift = solution["forces_geometry"][on_wing] @ solution["lift_direction"]
+    areas = solution["areas"][on_wing]
+    widths = np.abs(solution["vortex_bound_leg"][on_wing, 1])
+
+    ### Strips: the chordwise panels that share a spanwise position
+    y, strip = np.unique(np.round(centers[:, 1], decimals), return_inverse=True)
+    counts = np.bincount(strip)
+    width = np.bincount(strip, weights=widths) / counts
+    strip_area = np.bincount(strip, weights=areas)
+    strip_lift = np.bincount(strip, weights=lift)
+
+    ### Shear and bending moment at each strip's inboard edge: sums over the strips outboard of it, tip inward
+    y_inboard = np.sign(y) * (np.abs(y) - width / 2)
+    shear = np.empty_like(y)
+    bending_moment = np.empty_like(y)
+    for half in [y < 0, y >= 0]:
+        order = np.flatnonzero(half)[np.argsort(-np.abs(y[half]))]  # Tip first
+        outboard_lift = np.cumsum(strip_lift[order])
+        outboard_moment = np.cumsum(strip_lift[order] * np.abs(y[order]))
+        shear[order] = outboard_lift
+        bending_moment[order] = (
+            outboard_moment - np.abs(y_inboard[order]) * outboard_lift
+        )
+
+    return {
+        "y": y,
+        "width": width,
+        "chord": strip_area / width,
+        "lift_per_span": strip_lift / width,
+        "cl": strip_lift / (solution["dynamic_pressure"] * strip_area),
+        "y_inboard": y_inboard,
+        "shear": shear,
+        "bending_moment": bending_moment,
+    }
+
+
+def root_loads(loads) -> dict:
+    """
+    The shear force [N] and bending moment [N m] at the wing root, as plain floats: those of the more heavily
+    loaded half.
+    """
+    roots = [
+        np.flatnonzero(half)[np.argmin(np.abs(loads["y_inboard"][half]))]
+        for half in [loads["y"] < 0, loads["y"] >= 0]
+        if np.any(half)
+    ]
+    root = roots[np.argmax(np.abs(loads["bending_moment"][roots]))]
+    return {
+        "Root shear [N]": float(loads["shear"][root]),
+        "Root bending moment [N m]": float(loads["bending_moment"][root]),
+    }
+
+
+def draw_loads(loads) -> go.Figure:
+    fig = make_subplots(
+        rows=1,
+        cols=4,
+        subplot_titles=[
+            "Lift Distribution",
+            "Sectional Lift Coefficient",
+            "Shear Force",
+            "Bending Moment",
+        ],
+    )
+    for col, (x, y, title) in enumerate(
+        [
+            ("y", "lift_per_span", "Lift per span [N/m]"),
+            ("y", "cl", "Cl"),
+            ("y_inboard", "shear", "Shear [N]"),
+            ("y_inboard", "bending_moment", "Bending moment [N m]"),
+        ],
+        start=1,
+    ):
+        fig.add_trace(
+            go.Scatter(
+                x=loads[x].astype(np.float32),
+                y=loads[y].astype(np.float32),
+                mode="lines",
+                name=title,
+            ),
+            row=1,
+            col=col,
+        )
+        fig.update_xaxes(title_text="Spanwise position [m]", row=1, col=col)
+        fig.update_yaxes(title_text=title, row=1, col=col)
+    fig.update_layout(showlegend=False, height=320, margin=dict(t=40, b=40))
+
+    return fig
+
+
+def encode_loads(loads, format="npz") -> bytes:
+    """
+    Serializes the loads for download: as an .npz of the arrays, or as a CSV with one row per strip.
+    """
+    file = io.BytesIO()
+    if format == "npz":
+        np.savez(file, **loads)
+    elif format == "csv":
+        np.savetxt(
+            file,
+            np.column_stack([loads[name] for name in COLUMNS]),
+            fmt="%.6g",
+            delimiter=",",
+            header=",".join(f"{name} [{unit}]" for name, unit in COLUMNS.items()),
+            comments="",
+        )
+    else:
+        raise ValueError("Bad value of `format`!")
+    return file.getvalue()
@@ -0,0 +1,523 @@
+import argparse
+import contextlib
+import http.cookiejar
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+### Load test: simulated users clicking the app's buttons at once, over HTTP, the way their browsers would.
+# Each user is a `Browser` with its own cookies (so its own session, and its own one-job-at-a-time lock). A click is
+# posted to `display_geometry` through Dash's callback endpoint; when that hands the analysis to a background job,
+# the job is started and polled (at the page's 500 ms interval) until its result arrives, as dash-renderer does. A
+# click's latency runs from the click to its result. The mix of buttons, and how many distinct inputs they are
+# clicked with (and so how often they hit the results cache), are configurable.
+# Worker saturation is read off the server's own /metrics: the time its workers spent serving requests, over the
+# time they had. Near 1, requests queue for a free worker, which shows as HTTP latency beyond the server time.
+#
+# Usage, against a running server (--workers is only used to work out the saturation):
+#   python loadtest.py --url http://127.0.0.1:8050 --workers 2 --users 8 --duration 60 --mix display=2,ll=2,vlm=1
+# or starting gunicorn, with empty caches, at each of several worker counts in turn:
+#   python loadtest.py --serve 1 2 4 --users 8 --duration 60
+
+BUTTONS = {  # As in app.BUTTONS; not imported, so that this runs without the app's dependencies
+    "display": "display_geometry",
+    "ll": "run_ll_analysis",
+    "vlm": "run_vlm_analysis",
+    "ll_polar": "run_ll_polar",
+    "vlm_polar": "run_vlm_polar",
+    "optimize": "run_optimization",
+    "trim": "run_trim",
+    "envelope": "run_envelope",
+}
+DEFAULT_MIX = {"display": 2, "ll": 2, "vlm": 1}
+VARIED = {  # Parameters drawn anew for each distinct input, and their choices or ranges
+    "n_booms": [1, 2, 3],
+    "wing_span": (30, 55),  # m
+    "alpha": (0, 10),  # deg
+}
+POLL_INTERVAL = 0.5  # s; the background callback's `interval`
+STORE_VARIABLES = [
+    "RESULTS_CACHE_DIR",
+    "ARRAY_STORE_DIR",
+    "METRICS_DIR",
+    "JOBS_CACHE_DIR",
+    "VLM_SESSION_DIR",
+    "BATCH_RESULTS_DIR",
+]
+
+
+class Browser:
+    """
+    Stands in for one browser tab: keeps its own cookies, and requests pages and callbacks from the app at `url`.
+    Each HTTP request's latency is added to `http_seconds`.
+    """
+
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        self.http_seconds = []
+
+    def request(self, path, body=None):
+        """
+        GETs `path`, or POSTs `body` to it as JSON. Returns the response body, parsed if it is JSON.
+        """
+        request = urllib.request.Request(
+            self.url + path,
+            data=None if body is None else json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                content = response.read()
+                content_type = response.headers.get("Content-Type", "")
+        finally:
+            self.http_seconds.append(time.perf_counter() - start)
+        if "json" in content_type:
+            return json.loads(content) if content else {}
+        return content.decode()
+
+
+def find_component_values(layout) -> dict:
+    """
+    Returns {id: value} for every component in a Dash layout (as served at /_dash-layout) that has both.
+    """
+    values = {}
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            props = node.get("props", {})
+            if isinstance(props.get("id"), str) and "value" in props:
+                values[props["id"]] = props["value"]
+            stack.extend(props.values())
+    return values
+
+
+def output_spec(callback) -> list:
+    # The "outputs" of a callback request, from the dependency's output string (minus allow_duplicate suffixes)
+    return [
+        {"id": output.split(".")[0], "property": output.split(".")[1].split("@")[0]}
+        for output in callback["output"].strip(".").split("...")
+    ]
+
+
+class App:
+    """
+    What the load test needs to know of the app, read from it once: its two analysis callbacks (the dispatching one
+    and the background one) and the page's initial parameter values.
+    """
+
+    def __init__(self, browser):
+        dependencies = browser.request("/_dash-dependencies")
+        self.dispatch = next(
+            callback
+            for callback in dependencies
+            if "analysis_request.data" in callback["output"]
+            and not callback.get("background")
+        )
+        self.background = next(
+            callback
+            for callback in dependencies
+            if callback.get("background")
+            and callback["inputs"][0]["id"] == "analysis_request"
+        )
+        self.defaults = find_component_values(browser.request("/_dash-layout"))
+
+    def variants(self, n_distinct, seed=0) -> list:
+        """
+        `n_distinct` sets of parameter values to click with: the page's defaults first, then random draws of VARIED.
+        """
+        rng = random.Random(seed)
+        variants = [dict(self.defaults)]
+        while len(variants) < n_distinct:
+            variant = dict(self.defaults)
+            for name, choices in VARIED.items():
+                if isinstance(choices, list):
+                    variant[name] = rng.choice(choices)
+                else:
+                    variant[name] = round(rng.uniform(*choices), 1)
+            variants.append(variant)
+        return variants
+
+    def click(self, browser, analysis, parameters, current_geometry=None, timeout=120):
+        """
+        Clicks the button for `analysis` with the given parameter values, and waits for its result. Returns a dict:
+            outcome: "cached" (served straight from the results cache), "computed" (by a background job),
+                "rejected" (the app answered with a message instead, e.g. a job is already running), "timeout", or
+                "error"
+            seconds: the time from the click to its result
+            geometry_key: the mesh the page now shows
+        """
+        start = time.perf_counter()
+        outcome = {"outcome": "error", "geometry_key": current_geometry}
+        try:
+            response = browser.request(
+                "/_dash-update-component",
+                {
+                    "output": self.dispatch["output"],
+                    "outputs": output_spec(self.dispatch),
+                    "inputs": [
+                        {**input, "value": 1 if input["id"] == BUTTONS[analysis] else 0}
+                        for input in self.dispatch["inputs"]
+                    ],
+                    "state": [
+                        {
+                            **state,
+                            "value": (
+                                current_geometry
+                                if state["id"] == "geometry_key"
+                                else parameters.get(state["id"])
+                            ),
+                        }
+                        for state in self.dispatch["state"]
+                    ],
+                    "changedPropIds": [f"{BUTTONS[analysis]}.n_clicks_timestamp"],
+                },
+            )["response"]
+            if "analysis_request" in response:
+                response = self.run_job(
+                    browser, response["analysis_request"]["data"], start + timeout
+                )
+                outcome["outcome"] = "timeout" if response is None else "computed"
+            elif "scene" in response:
+                outcome["outcome"] = "cached"
+            else:
+                outcome["outcome"] = "rejected"
+            if response is not None and "geometry_key" in response:
+                outcome["geometry_key"] = response["geometry_key"]["data"]
+        except (urllib.error.URLError, OSError, KeyError, ValueError):
+            pass
+        outcome["seconds"] = time.perf_counter() - start
+        return outcome
+
+    def run_job(self, browser, request, deadline):
+        """
+        Starts the background callback on `request`, and polls it until it finishes. Returns its outputs, or None if
+        it is not done by `deadline` (a time.perf_counter() value).
+        """
+        body = {
+            "output": self.background["output"],
+            "outputs": output_spec(self.background),
+            "inputs": [{"id": "analysis_request", "property": "data", "value": request}],
+            "state": [],
+            "changedPropIds": ["analysis_request.data"],
+        }
+        job = browser.request("/_dash-update-component", body)
+        query = urllib.parse.urlencode({"cacheKey": job["cacheKey"], "job": job["job"]})
+        while time.perf_counter() < deadline:
+            time.sleep(POLL_INTERVAL)
+            status = browser.request(f"/_dash-update-component?{query}", body)
+            if "response" in status:
+                return status["response"]
+        return None
+
+
+def server_time(browser) -> tuple:
+    """
+    Returns (seconds, count): the total time the server has spent serving HTTP requests, and how many, from /metrics.
+    """
+    seconds = count = 0
+    for line in browser.request("/metrics").splitlines():
+        match = re.match(r"asb_demo_request_seconds_(sum|count)\{.*\} (\S+)$", line)
+        if match and match[1] == "sum":
+            seconds += float(match[2])
+        elif match:
+            count += int(match[2])
+    return seconds, count
+
+
+def run_load(
+    url,
+    users=4,
+    duration=30,
+    mix=DEFAULT_MIX,
+    n_distinct=10,
+    think_seconds=1,
+    workers=1,
+    click_timeout=120,
+    seed=0,
+    browser_class=Browser,
+) -> dict:
+    """
+    Has `users` simulated users click buttons in turn, for `duration` seconds: each picks an analysis by the weights
+    in `mix` and one of `n_distinct` sets of inputs, clicks, waits for the result, then pauses for a random time
+    (exponentially distributed, with mean `think_seconds`). Returns the clicks and the summary (see `summarize`).
+    """
+    monitor = browser_class(url)
+    app = App(monitor)
+    variants = app.variants(n_distinct, seed)
+    analyses, weights = zip(*mix.items())
+
+    clicks = []
+    browsers = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user(index):
+        rng = random.Random(f"{seed}-{index}")
+        browser = browser_class(url)
+        browsers.append(browser)
+        browser.request("/")  # A visit starts with the page itself
+        geometry_key = None
+        while time.perf_counter() < deadline:
+            analysis = rng.choices(analyses, weights)[0]
+            click = app.click(
+                browser,
+                analysis,
+                rng.choice(variants),
+                geometry_key,
+                click_timeout,
+            )
+            geometry_key = click.pop("geometry_key")
+            with lock:
+                clicks.append({"analysis": analysis, **click})
+            if think_seconds > 0:
+                time.sleep(rng.expovariate(1 / think_seconds))
+
+    busy_before, requests_before = server_time(monitor)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    busy_after, requests_after = server_time(monitor)
+
+    return {
+        "clicks": clicks,
+        "summary": summarize(
+            clicks,
+            elapsed,
+            http_seconds=[s for browser in browsers for s in browser.http_seconds],
+            server_seconds=busy_after - busy_before,
+            server_requests=requests_after - requests_before,
+            workers=workers,
+            users=users,
+        ),
+    }
+
+
+def latency_percentiles(seconds) -> dict:
+    if len(seconds) == 0:
+        return {"p50_s": None, "p95_s": None, "p99_s": None}
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    return {"p50_s": float(p50), "p95_s": float(p95), "p99_s": float(p99)}
+
+
+def summarize(
+    clicks,
+    elapsed,
+    http_seconds,
+    server_seconds,
+    server_requests,
+    workers=1,
+    users=1,
+) -> dict:
+    """
+    Reduces a load test's clicks to its throughput and latencies, overall and per analysis, and to the saturation of
+    the server's workers: the fraction of their time spent serving requests. Latency percentiles count only the
+    clicks that got a result (cached or computed).
+    """
+    outcomes = ["cached", "computed", "rejected", "timeout", "error"]
+    analyses = {}
+    for analysis in [*dict.fromkeys(click["analysis"] for click in clicks), "all"]:
+        selected = [
+            click for click in clicks if analysis in ["all", click["analysis"]]
+        ]
+        answered = [
+            click["seconds"]
+            for click in selected
+            if click["outcome"] in ["cached", "computed"]
+        ]
+        analyses[analysis] = {
+            "clicks": len(selected),
+            **{
+                outcome: sum(click["outcome"] == outcome for click in selected)
+                for outcome in outcomes
+            },
+            "throughput_per_s": len(answered) / elapsed,
+            **latency_percentiles(answered),
+        }
+
+    n_http = len(http_seconds)
+    mean_http = float(np.mean(http_seconds)) if n_http else 0.0
+    mean_server = server_seconds / server_requests if server_requests else 0.0
+    return {
+        "users": users,
+        "workers": workers,
+        "elapsed_s": elapsed,
+        "analyses": analyses,
+        "http_requests": n_http,
+        "http_per_s": n_http / elapsed,
+        "mean_http_s": mean_http,
+        "mean_server_s": mean_server,
+        "mean_queueing_s": max(mean_http - mean_server, 0.0),
+        "server_busy_s": server_seconds,
+        "saturation": server_seconds / (elapsed * workers),
+        "jobs_in_flight": sum(
+            click["seconds"] for click in clicks if click["outcome"] == "computed"
+        )
+        / elapsed,
+    }
+
+
+def print_summary(summary):
+    print(
+        f"{summary['users']} users, {summary['workers']} workers, {summary['elapsed_s']:.1f} s:"
+        f" {summary['http_requests']} HTTP requests ({summary['http_per_s']:.1f}/s)"
+    )
+    print(
+        f"  {'analysis':<10} {'clicks':>6} {'cached':>6} {'run':>5} {'reject':>6} {'t/o':>4} {'error':>5}"
+        f" {'done/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7}"
+    )
+    for analysis, row in summary["analyses"].items():
+        percentiles = [
+            "-" if row[name] is None else f"{row[name]:.3f}"
+            for name in ["p50_s", "p95_s", "p99_s"]
+        ]
+        print(
+            f"  {analysis:<10} {row['clicks']:>6} {row['cached']:>6} {row['computed']:>5}"
+            f" {row['rejected']:>6} {row['timeout']:>4} {row['error']:>5}"
+            f" {row['throughput_per_s']:>7.2f} {percentiles[0]:>7} {percentiles[1]:>7} {percentiles[2]:>7}"
+        )
+    print(
+        f"  Workers busy {summary['server_busy_s']:.1f} s of {summary['elapsed_s'] * summary['workers']:.1f} s:"
+        f" saturation {summary['saturation']:.2f}. HTTP latency {summary['mean_http_s'] * 1e3:.1f} ms on average,"
+        f" of which {summary['mean_queueing_s'] * 1e3:.1f} ms queueing. Background jobs in flight:"
+        f" {summary['jobs_in_flight']:.2f} on average."
+    )
+
+
+@contextlib.contextmanager
+def serve(workers, port=8060, ready_timeout=180):
+    """
+    Runs the app under gunicorn (as in production: see `Procfile` and `gunicorn.conf.py`) with `workers` workers and
+    empty caches of its own, for the duration of the block. Yields its URL.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as stores:
+        environment = {
+            **os.environ,
+            **{variable: os.path.join(stores, variable) for variable in STORE_VARIABLES},
+        }
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "app:server",
+                f"--workers={workers}",
+                f"--bind=127.0.0.1:{port}",
+            ],
+            cwd=directory,
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            deadline = time.perf_counter() + ready_timeout
+            while True:
+                try:
+                    urllib.request.urlopen(url, timeout=5).close()
+                    break
+                except (urllib.error.URLError, OSError):
+                    if process.poll() is not None or time.perf_counter() > deadline:
+                        raise RuntimeError(f"gunicorn did not start serving at {url}")
+                    time.sleep(1)
+            yield url
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def parse_mix(text) -> dict:
+    """
+    Parses e.g. "display=2,ll=2,vlm=1" into {"display": 2.0, "ll": 2.0, "vlm": 1.0}.
+    """
+    mix = {}
+    for item in text.split(","):
+        analysis, _, weight = item.partition("=")
+        if analysis not in BUTTONS:
+            raise ValueError(f"Bad analysis in mix: {analysis!r}")
+        mix[analysis] = float(weight or 1)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drive the app's analysis callbacks with concurrent simulated users, and report throughput, "
+        "latency percentiles, and worker saturation."
+    )
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://127.0.0.1:8050")
+    target.add_argument(
+        "--serve",
+        type=int,
+        nargs="+",
+        metavar="WORKERS",
+        help="Start gunicorn with each of these worker counts in turn, instead of using --url",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="The server's worker count, with --url"
+    )
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help='Relative weights of the buttons clicked, e.g. "display=2,ll=2,vlm=1"',
+    )
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=10,
+        help="How many distinct sets of inputs are clicked with; fewer makes for more cache hits",
+    )
+    parser.add_argument("--think", type=float, default=1, help="Mean seconds between a user's clicks")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds a click may take")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also save the clicks and summaries to this JSON file")
+    args = parser.parse_args()
+
+    options = dict(
+        users=args.users,
+        duration=args.duration,
+        mix=args.mix,
+        n_distinct=args.distinct,
+        think_seconds=args.think,
+        click_timeout=args.timeout,
+        seed=args.seed,
+    )
+    runs = []
+    if args.serve:
+        for workers in args.serve:
+            with serve(workers) as url:
+                runs.append(run_load(url, workers=workers, **options))
+                print_summary(runs[-1]["summary"])
+    else:
+        runs.append(run_load(args.url, workers=args.workers, **options))
+        print_summary(runs[-1]["summary"])
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(runs, file, indent=2)
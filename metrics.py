@@ -0,0 +1,131 @@
+import contextlib
+import cProfile
+import os
+import tempfile
+import time
+
+import diskcache
+
+### Timing histograms, shared by every process (web workers and background jobs) through an on-disk store, and
+# exposed in the Prometheus text format by the app's /metrics route.
+METRICS_DIRECTORY = os.environ.get(
+    "METRICS_DIR",
+    os.path.join(tempfile.gettempdir(), "asb-demo-metrics"),
+)
+PREFIX = "asb_demo_"
+BUCKETS = [0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]  # seconds
+DESCRIPTIONS = {
+    "stage_seconds": "Time spent in each stage of an analysis.",
+    "request_seconds": "Time spent serving each HTTP request.",
+}
+
+### Opt-in profiling: set PROFILE_SLOW_SECONDS to keep a cProfile dump of every profiled block slower than that.
+PROFILE_SLOW_SECONDS = os.environ.get("PROFILE_SLOW_SECONDS")
+PROFILE_DIRECTORY = os.environ.get(
+    "PROFILE_DIR",
+    os.path.join(tempfile.gettempdir(), "asb-demo-profiles"),
+)
+
+_store = None
+
+
+def get_store() -> diskcache.Cache:
+    global _store
+    if _store is None:
+        _store = diskcache.Cache(directory=METRICS_DIRECTORY, eviction_policy="none")
+    return _store
+
+
+def observe(name, seconds, **labels):
+    """
+    Adds one observation to the histogram `name`, with the given labels.
+    """
+    store = get_store()
+    key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+    with store.transact():
+        histogram = store.get(key) or {
+            "count": 0,
+            "sum": 0.0,
+            "buckets": [0] * len(BUCKETS),
+        }
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+        store.set(key, histogram)
+
+
+@contextlib.contextmanager
+def timed(stage, **labels):
+    """
+    Times the block as one stage (e.g. "solve") of an analysis, labelled e.g. by analysis type and boom count.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+
+@contextlib.contextmanager
+def profiled(name):
+    """
+    Profiles the block with cProfile if PROFILE_SLOW_SECONDS is set, and writes the profile to PROFILE_DIRECTORY
+    (as <time>-<name>.prof, readable with pstats or snakeviz) if the block took longer than that.
+    """
+    if PROFILE_SLOW_SECONDS is None:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if time.perf_counter() - start > float(PROFILE_SLOW_SECONDS):
+            os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+            profiler.dump_stats(
+                os.path.join(
+                    PROFILE_DIRECTORY,
+                    f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{name}.prof",
+                )
+            )
+
+
+def render() -> str:
+    """
+    Returns every histogram in the Prometheus text exposition format.
+    """
+    store = get_store()
+    histograms = {}
+    for key in store.iterkeys():
+        value = store.get(key)
+        if value is not None:
+            histograms.setdefault(key[0], []).append((dict(key[1]), value))
+
+    lines = []
+    for name, series in sorted(histograms.items()):
+        metric = PREFIX + name
+        lines.append(f"# HELP {metric} {DESCRIPTIONS.get(name, name)}")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, histogram in sorted(series, key=lambda item: sorted(item[0].items())):
+            for bound, count in zip(
+                [*BUCKETS, "+Inf"], [*histogram["buckets"], histogram["count"]]
+            ):
+                lines.append(
+                    f"{metric}_bucket{_format_labels({**labels, 'le': bound})} {count}"
+                )
+            lines.append(f"{metric}_sum{_format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels) -> str:
+    escaped = {
+        label: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for label, value in labels.items()
+    }
+    return "{" + ",".join(f'{label}="{value}"' for label, value in escaped.items()) + "}"
@@ -0,0 +1,159 @@
+import functools
+import zlib
+
+import aerosandbox as asb
+import casadi
+
+from airplane import make_airplane, min_wing_span
+from analysis import make_op_point, reference_point
+import results_cache
+
+OBJECTIVES = {
+    "L/D": lambda CL, CD: CL / CD,
+    "endurance": lambda CL, CD: CL**1.5 / CD,  # Power-limited endurance parameter
+}
+
+
+def build_optimizer(n_booms, objective="L/D") -> casadi.Function:
+    """
+    Builds the design optimization problem for one boom count: maximize the objective over wing span and angle of
+    attack, with the LiftingLine model evaluated symbolically through make_airplane. The problem is wrapped up as a
+    single CasADi function:
+
+        (span_min, span_max, alpha_min, alpha_max, ms_velocity, wing_span_guess, alpha_guess)
+            -> (wing_span, alpha, CL, CD, objective)
+
+    Bounds and airspeed are parameters, and the guesses seed IPOPT, so re-solving with new bounds or airspeed, or
+    from a warm start, skips graph construction entirely.
+    """
+    opti = asb.Opti()
+
+    span_min = opti.parameter()
+    span_max = opti.parameter()
+    alpha_min = opti.parameter()
+    alpha_max = opti.parameter()
+    ms_velocity = opti.parameter()
+
+    # Unscaled, so that the variables are pure symbols and can be function inputs (initial guesses)
+    wing_span = opti.variable(init_guess=43, scale=1)
+    alpha = opti.variable(init_guess=5, scale=1)
+    opti.subject_to(
+        [
+            wing_span >= span_min,
+            wing_span <= span_max,
+            alpha >= alpha_min,
+            alpha <= alpha_max,
+        ]
+    )
+
+    airplane = make_airplane(
+        n_booms=n_booms,
+        wing_span=wing_span,
+    )
+    result = asb.LiftingLine(
+        airplane=airplane,
+        op_point=make_op_point(ms_velocity, alpha, angle_of_sideslip=0),
+        xyz_ref=reference_point(airplane),
+    ).run()
+    objective_value = OBJECTIVES[objective](result["CL"], result["CD"])
+    opti.maximize(objective_value)
+
+    # Solver options
+    p_opts = {"print_time": False}
+    s_opts = {}
+    s_opts["max_iter"] = 200
+    s_opts["print_level"] = 0
+    s_opts["sb"] = "yes"
+    opti.solver("ipopt", p_opts, s_opts)
+
+    return opti.to_function(
+        f"optimize_{n_booms}_booms",
+        [span_min, span_max, alpha_min, alpha_max, ms_velocity, wing_span, alpha],
+        [wing_span, alpha, result["CL"], result["CD"], objective_value],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_optimizer(n_booms, objective="L/D") -> casadi.Function:
+    """
+    Returns `build_optimizer(n_booms, objective)`, from this process's memory, else from the shared results cache,
+    else built (and stored there). Each analysis runs in a freshly forked background job, so without the shared
+    copy every Optimize click would rebuild the graph.
+    """
+    key = results_cache.make_key(
+        "optimizer_function",
+        n_booms=n_booms,
+        objective=objective,
+        versions=[asb.__version__, casadi.__version__],
+    )
+    built = {}
+
+    def build():
+        built["function"] = build_optimizer(n_booms, objective)
+        return zlib.compress(built["function"].serialize().encode(), 1)
+
+    serialized = results_cache.get_or_compute(key, build)
+    if "function" in built:
+        return built["function"]
+    return casadi.Function.deserialize(zlib.decompress(serialized).decode())
+
+
+def optimize_design(
+    objective="L/D",
+    span_bounds=(20, 60),
+    alpha_bounds=(-5, 15),
+    boom_counts=(1, 2, 3),
+    ms_velocity=20,
+    report_progress=lambda percent, label: None,
+):
+    """
+    Finds the wing span, angle of attack, and (out of `boom_counts`) number of booms that maximize the objective at
+    airspeed `ms_velocity` [m/s]. To hold alpha fixed, pass equal alpha bounds. Each boom count's span is kept wide
+    enough for its tails to fit (see airplane.min_wing_span); counts that do not fit within the span bounds are
+    skipped.
+
+    Each boom count warm-starts from its previous optimum (kept in the shared results cache, clipped into the new
+    bounds). Returns a dict of the best design, or None if no boom count solved.
+    """
+    best = None
+    for i, n_booms in enumerate(boom_counts):
+        report_progress(
+            10 + 80 * i // len(boom_counts), f"Optimizing {n_booms}-boom design"
+        )
+        warm_start_key = results_cache.make_key(
+            "optimize_warm_start", n_booms=n_booms, objective=objective
+        )
+        wing_span_guess, alpha_guess = results_cache.get(warm_start_key) or (43, 5)
+        span_lower = max(span_bounds[0], min_wing_span(n_booms))
+        if span_lower > span_bounds[1]:
+            continue
+
+        try:
+            wing_span, alpha, CL, CD, objective_value = get_optimizer(
+                n_booms, objective
+            )(
+                span_lower,
+                span_bounds[1],
+                *alpha_bounds,
+                ms_velocity,
+                min(max(wing_span_guess, span_lower), span_bounds[1]),
+                min(max(alpha_guess, alpha_bounds[0]), alpha_bounds[1]),
+            )
+        except RuntimeError as e:
+            print(e)
+            continue
+
+        design = {
+            "n_booms": n_booms,
+            "wing_span": float(wing_span),
+            "alpha": float(alpha),
+            "CL": float(CL),
+            "CD": float(CD),
+            objective: float(objective_value),
+        }
+        results_cache.put(warm_start_key, (design["wing_span"], design["alpha"]))
+
+        if best is None or design[objective] > best[objective]:
+            best = design
+
+    return best
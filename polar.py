@@ -0,0 +1,123 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from airplane import make_airplane
+from analysis import analyse_ll, make_op_point, panel_resolution, reference_point
+from vlm import FactoredVortexLatticeMethod
+
+
+def run_polar(
+    method,
+    n_booms,
+    wing_span,
+    alphas,
+    ms_velocity=20,
+    fidelity=1,
+):
+    """
+    Evaluates the airplane over a range of angles of attack in a single call.
+
+    VLM is linear in the freestream, so its influence matrix is assembled and factored once and every alpha is a
+    right-hand side of the same solve. LL is nonlinear (airfoil data is evaluated at the induced alpha), so its
+    points are spread across a process pool instead.
+
+    `fidelity` scales the panel counts, as in `analysis.panel_resolution`.
+
+    Returns a dict of arrays: "alpha", "CL", "CD", "L/D", and "Cm". Points where the analysis failed are NaN.
+    """
+    alphas = np.array(alphas, dtype=float)
+
+    if method == "vlm":
+        airplane = make_airplane(
+            n_booms=n_booms,
+            wing_span=wing_span,
+        )
+        op_points = [
+            make_op_point(ms_velocity, alpha, angle_of_sideslip=0) for alpha in alphas
+        ]
+        analysis = FactoredVortexLatticeMethod(
+            airplane=airplane,
+            op_point=op_points[0],
+            xyz_ref=reference_point(airplane),
+            **panel_resolution("vlm", fidelity),
+        )
+        sweep = analysis.run_sweep(op_points)
+        CL, CD, Cm = sweep["CL"], sweep["CD"], sweep["Cm"]
+
+    elif method == "ll":
+        with ProcessPoolExecutor(
+            max_workers=min(len(alphas), os.cpu_count() or 1)
+        ) as pool:
+            points = list(
+                pool.map(
+                    ll_point,
+                    repeat(n_booms),
+                    repeat(wing_span),
+                    alphas,
+                    repeat(ms_velocity),
+                    repeat(fidelity),
+                )
+            )
+        CL, CD, Cm = np.array(points).T
+
+    else:
+        raise ValueError("Bad value of `method`!")
+
+    return {
+        "alpha": alphas,
+        "CL": CL,
+        "CD": CD,
+        "L/D": CL / CD,
+        "Cm": Cm,
+    }
+
+
+def ll_point(n_booms, wing_span, alpha, ms_velocity, fidelity):
+    """
+    One LL point of a sweep: returns (CL, CD, Cm), or NaNs if the analysis failed. Meant to run in a worker process,
+    so it rebuilds the airplane itself rather than pickling one across.
+    """
+    airplane = make_airplane(
+        n_booms=n_booms,
+        wing_span=wing_span,
+    )
+    try:
+        ap, result = analyse_ll(
+            my_airplane=airplane,
+            ms_velocity=ms_velocity,
+            angle_of_attack=alpha,
+            angle_of_sideslip=0,
+            fidelity=fidelity,
+        )
+    except (RuntimeError, ValueError, np.linalg.LinAlgError) as e:
+        print(e)
+        return (np.nan, np.nan, np.nan)
+
+    return (float(result["CL"]), float(result["CD"]), float(result["Cm"]))
+
+
+def draw_polar(polar) -> go.Figure:
+    fig = make_subplots(
+        rows=1,
+        cols=3,
+        subplot_titles=["Lift Curve", "Drag Polar", "Pitching Moment"],
+    )
+    for col, (x, y) in enumerate(
+        [("alpha", "CL"), ("CD", "CL"), ("alpha", "Cm")],
+        start=1,
+    ):
+        fig.add_trace(
+            go.Scatter(x=polar[x], y=polar[y], mode="lines+markers", name=y),
+            row=1,
+            col=col,
+        )
+        fig.update_xaxes(title_text=x, row=1, col=col)
+        fig.update_yaxes(title_text=y, row=1, col=col)
+    fig.update_layout(showlegend=False)
+
+    return fig
@@ -0,0 +1,183 @@
+import contextlib
+import hashlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import diskcache
+
+### Shared, on-disk store of finished callback results (figure JSON + aerodynamic performance).
+# Every gunicorn worker opens the same directory, so a result computed by one worker is a hit for all of them.
+CACHE_DIRECTORY = os.environ.get(
+    "RESULTS_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "asb-demo-results"),
+)
+CACHE_SIZE_LIMIT = int(
+    os.environ.get("RESULTS_CACHE_SIZE_LIMIT", 512 * 1024**2)
+)  # bytes
+
+_cache = None
+
+
+def get_cache() -> diskcache.Cache:
+    """
+    Returns the process-wide handle to the results cache, opening it on first use.
+    """
+    global _cache
+    if _cache is None:
+        _cache = diskcache.Cache(
+            directory=CACHE_DIRECTORY,
+            size_limit=CACHE_SIZE_LIMIT,
+            eviction_policy="least-recently-used",
+            statistics=1,
+        )
+    return _cache
+
+
+def normalize(value):
+    """
+    Maps equivalent user inputs (e.g. 43, 43.0, "43"; True and 1) onto the same hashable value: numbers, bools, and
+    numeric strings become ints where they are whole, else floats rounded to 6 decimals. Other strings are kept as
+    they are, and lists (e.g. checklist values) are treated as unordered.
+    """
+    if value is None:
+        return value
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return value
+        if not math.isfinite(number):
+            return value
+        value = number
+    if isinstance(value, (list, tuple)):
+        items = [normalize(item) for item in value]
+        return sorted(items, key=lambda item: (isinstance(item, str), item))
+    value = float(value)
+    if value.is_integer():
+        return int(value)
+    return round(value, 6)
+
+
+def make_key(analysis, **inputs) -> str:
+    """
+    Content-addressed cache key: a hash of the analysis type and its normalized inputs.
+    """
+    description = json.dumps(
+        {
+            "analysis": analysis,
+            **{name: normalize(value) for name, value in inputs.items()},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def get(key):
+    return get_cache().get(key)
+
+
+def put(key, value):
+    get_cache().set(key, value)
+
+
+def acquire(lock_key, lease=10):
+    """
+    Takes the lock entry `lock_key` for `lease` [s], shared by every process that opens the cache. Returns a token
+    that identifies this holder (for `held` and `release`), or None if the lock is already held (and its lease has
+    not run out).
+    """
+    token = uuid.uuid4().hex
+    if get_cache().add(lock_key, token, expire=lease):
+        return token
+    return None
+
+
+def release(lock_key, token=None):
+    """
+    Deletes the lock entry. Given a holder's `token`, only while the lock is still that holder's: once its lease has
+    run out, the lock may have been taken by another.
+    """
+    cache = get_cache()
+    if token is None:
+        cache.delete(lock_key)
+        return
+    with cache.transact():
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+@contextlib.contextmanager
+def held(lock_key, token, lease=10):
+    """
+    Keeps renewing the lease on a lock entry acquired with `token` while the block runs, then releases it. If the
+    process dies in the block, the lease runs out on its own. A lease that ran out anyway (e.g. the process was
+    stalled) is neither renewed nor released, as the lock may have passed to another holder.
+    """
+    cache = get_cache()
+    stop_renewing = threading.Event()
+
+    def renew_lease():
+        while not stop_renewing.wait(lease / 3):
+            with cache.transact():
+                if cache.get(lock_key) != token:
+                    return
+                cache.touch(lock_key, expire=lease)
+
+    threading.Thread(target=renew_lease, daemon=True).start()
+    try:
+        yield
+    finally:
+        stop_renewing.set()
+        release(lock_key, token)
+
+
+def get_or_compute(
+    key,
+    compute,
+    on_wait=lambda: None,
+    lease=10,
+    poll_interval=0.25,
+):
+    """
+    Returns the value stored under `key`, calling `compute()` to make (and store) it if there is none. `compute()`
+    must not return None.
+
+    Single-flight: callers with the same key, in any process that shares the cache (e.g. jobs started by different
+    gunicorn workers), wait for one computation instead of each running their own. The computing process holds a
+    lock entry whose `lease` [s] it renews while it runs; if that process dies (e.g. a cancelled job), the lease
+    runs out and a waiting caller takes over. Waiting callers call `on_wait()` every `poll_interval` [s].
+    """
+    cache = get_cache()
+    lock_key = ("in_flight", key)
+    while True:
+        if key in cache:  # Checked before reading, so that polling doesn't count as misses
+            value = cache.get(key)
+            if value is not None:
+                return value
+
+        token = acquire(lock_key, lease)
+        if token is not None:
+            with held(lock_key, token, lease):
+                value = compute()
+                cache.set(key, value)
+                return value
+
+        on_wait()
+        time.sleep(poll_interval)
+
+
+def stats() -> dict:
+    cache = get_cache()
+    hits, misses = cache.stats()
+    return {
+        "hits": hits,
+        "misses": misses,
+        "entries": len(cache),
+        "size_bytes": cache.volume(),
+        "size_limit_bytes": CACHE_SIZE_LIMIT,
+    }
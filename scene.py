@@ -0,0 +1,166 @@
+import base64
+import json
+
+import numpy as np
+
+from airplane import instances
+import array_store
+import results_cache
+
+### Compact payloads for the 3D view, rendered in the browser by assets/scene.js.
+# The view is split in two:
+#   geometry : a quad mesh (points + faces) that depends only on the airplane (and, for analyses, on the panelling
+#              of the method). Sent once per configuration and kept client-side.
+#   scene    : what changes from run to run on top of that mesh - per-panel intensities and streamlines - or, for
+#              2D plots, a plain Plotly figure.
+# Arrays are base64-encoded little-endian typed arrays, which the browser views directly (no JSON number parsing).
+# Meshes are kept server-side as raw arrays in the shared array store (see array_store.py), and encoded on the way out.
+
+
+def encode(array, dtype="<f4") -> dict:
+    array = np.ascontiguousarray(array, dtype=dtype)
+    return {
+        "dtype": array.dtype.name,
+        "shape": list(array.shape),
+        "data": base64.b64encode(array).decode("ascii"),  # Straight from the array's buffer
+    }
+
+
+def encode_quantized(array) -> dict:
+    """
+    Encodes an (..., 3) array of coordinates as int16, scaled per axis to its own bounding box. Half the size of
+    float32, and still ~1e-5 of the extent in resolution, which is plenty for drawing lines.
+    """
+    array = np.asarray(array, dtype=float)
+    lower = array.reshape(-1, 3).min(axis=0)
+    upper = array.reshape(-1, 3).max(axis=0)
+    scale = np.where(upper > lower, (upper - lower) / 65534, 1)
+    quantized = np.round((array - lower) / scale - 32767)
+    return {
+        **encode(quantized, dtype="<i2"),
+        "offset": (lower + 32767 * scale).tolist(),
+        "scale": scale.tolist(),
+    }
+
+
+def decode(payload) -> np.ndarray:
+    array = np.frombuffer(
+        base64.b64decode(payload["data"]),
+        dtype=np.dtype(payload["dtype"]).newbyteorder("<"),
+    ).reshape(payload["shape"])
+    if "scale" in payload:
+        array = np.array(payload["offset"]) + np.array(payload["scale"]) * array
+    return array
+
+
+def geometry_key(kind, n_booms, wing_span, fidelity=None, **airplane_options) -> str:
+    """
+    Identifies a mesh: "body" for the airplane's surfaces, or the name of the method whose panels (at `fidelity`)
+    are drawn. `airplane_options` are any other make_airplane inputs that differ from their defaults.
+    """
+    return results_cache.make_key(
+        "geometry",
+        kind=kind,
+        n_booms=n_booms,
+        wing_span=wing_span,
+        fidelity=fidelity,
+        **airplane_options,
+    )
+
+
+def geometry_payload(key, points, faces) -> dict:
+    return {
+        "key": key,
+        "points": encode(points),
+        "faces": encode(faces, dtype="<u4"),
+    }
+
+
+def body_mesh(airplane):
+    """
+    The same faces as `airplane.mesh_body(method="quad")` (though not in the same order), with each distinct
+    component meshed once and then tiled at every offset it is placed at (see airplane.instances).
+    """
+    points = []
+    faces = []
+    n_points = 0
+    for components in ["wings", "fuselages"]:
+        for component, offsets in instances(airplane, components):
+            component_points, component_faces = component.mesh_body(method="quad")
+            points.append((component_points + offsets[:, None, :]).reshape(-1, 3))
+            faces.append(
+                (
+                    component_faces
+                    + n_points
+                    + len(component_points) * np.arange(len(offsets))[:, None, None]
+                ).reshape(-1, component_faces.shape[1])
+            )
+            n_points += len(offsets) * len(component_points)
+    return np.concatenate(points), np.concatenate(faces)
+
+
+def panel_mesh(analysis):
+    # One quad per panel, with its own four vertices so that each panel can be colored on its own
+    points = np.stack(
+        [
+            analysis.front_left_vertices,
+            analysis.back_left_vertices,
+            analysis.back_right_vertices,
+            analysis.front_right_vertices,
+        ],
+        axis=1,
+    )
+    return points.reshape(-1, 3), np.arange(points.shape[0] * 4).reshape(-1, 4)
+
+
+def body_geometry(airplane, key) -> dict:
+    return geometry_payload(key, *body_mesh(airplane))
+
+
+def panel_geometry(analysis, key) -> dict:
+    return geometry_payload(key, *panel_mesh(analysis))
+
+
+def save_geometry(key, points, faces):
+    """
+    Stores a mesh in the shared array store, in the dtypes it is sent in, so that it can be encoded straight from
+    the mapping.
+    """
+    array_store.put(
+        key,
+        points=np.asarray(points, dtype="<f4"),
+        faces=np.asarray(faces, dtype="<u4"),
+    )
+
+
+def load_geometry(key):
+    """
+    Returns the payload of a stored mesh, or None if it is not (or no longer) in the array store.
+    """
+    arrays = array_store.get(key)
+    if arrays is None:
+        return None
+    return geometry_payload(key, arrays["points"], arrays["faces"])
+
+
+def solution_scene(analysis, key) -> dict:
+    """
+    Per-panel vortex strengths and streamlines of a solved LL or VLM analysis, to be drawn on `panel_geometry`.
+    """
+    if not hasattr(analysis, "streamlines"):
+        analysis.calculate_streamlines()
+    streamlines = np.transpose(analysis.streamlines, (0, 2, 1))  # (streamline, step, xyz)
+    streamlines = streamlines[np.all(np.isfinite(streamlines), axis=(1, 2))]
+
+    view = {
+        "geometry": key,
+        "intensity": encode(np.ravel(analysis.vortex_strengths)),
+        "colorbar_title": "Vortex Strengths",
+    }
+    if len(streamlines) > 0:
+        view["streamlines"] = encode_quantized(streamlines)
+    return view
+
+
+def figure_scene(figure) -> dict:
+    return {"figure": json.loads(figure.to_json())}
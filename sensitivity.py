@@ -0,0 +1,124 @@
+import functools
+import zlib
+
+import aerosandbox as asb
+import casadi
+import numpy as np
+
+from airplane import make_airplane
+from analysis import make_op_point, panel_resolution, reference_point
+import results_cache
+
+### Exact sensitivities of CL, CD, and L/D to the design inputs, by automatic differentiation.
+# make_airplane and the LiftingLine model are evaluated on CasADi symbols rather than numbers (as in optimize.py), and
+# CasADi differentiates the resulting graph: one call of the function gives the outputs and their whole Jacobian,
+# instead of one extra analysis per input (and a step size to pick) for finite differences.
+# Building and differentiating the graph takes seconds, so the function is built once per boom count and fidelity:
+# kept in memory for the life of the process, and stored (serialized) in the shared results cache, so that other
+# workers and background jobs load it instead of rebuilding it.
+
+INPUTS = {  # name: unit
+    "wing_span": "m",
+    "alpha": "deg",
+    "hstab_twist_angle": "deg",
+}
+OUTPUTS = ["CL", "CD", "L/D"]
+
+
+def build_gradient_function(n_booms, fidelity=1) -> casadi.Function:
+    """
+    Builds the CasADi function
+
+        (wing_span, alpha, hstab_twist_angle, ms_velocity) -> (outputs, jacobian)
+
+    where outputs are (CL, CD, L/D) from the LiftingLine model, and jacobian is their (3, 3) Jacobian with respect
+    to the first three inputs.
+    """
+    wing_span, alpha, hstab_twist_angle, ms_velocity = [
+        casadi.MX.sym(name) for name in [*INPUTS, "ms_velocity"]
+    ]
+    airplane = make_airplane(
+        n_booms=n_booms,
+        wing_span=wing_span,
+        hstab_twist_angle=hstab_twist_angle,
+    )
+    result = asb.LiftingLine(
+        airplane=airplane,
+        op_point=make_op_point(ms_velocity, alpha, angle_of_sideslip=0),
+        xyz_ref=reference_point(airplane),
+        **panel_resolution("ll", fidelity),
+    ).run()
+    outputs = casadi.vertcat(result["CL"], result["CD"], result["CL"] / result["CD"])
+    design = casadi.vertcat(wing_span, alpha, hstab_twist_angle)
+
+    return casadi.Function(
+        f"gradients_{n_booms}_booms",
+        [wing_span, alpha, hstab_twist_angle, ms_velocity],
+        [outputs, casadi.jacobian(outputs, design)],
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_gradient_function(n_booms, fidelity=1) -> casadi.Function:
+    """
+    Returns `build_gradient_function(n_booms, fidelity)`, from this process's memory, else from the shared results
+    cache, else built (and stored there). Concurrent first calls from several processes share one build.
+    """
+    key = results_cache.make_key(
+        "gradient_function",
+        n_booms=n_booms,
+        fidelity=fidelity,
+        versions=[asb.__version__, casadi.__version__],
+    )
+    built = {}
+
+    def build():
+        built["function"] = build_gradient_function(n_booms, fidelity)
+        return zlib.compress(built["function"].serialize().encode(), 1)
+
+    serialized = results_cache.get_or_compute(key, build)
+    if "function" in built:
+        return built["function"]
+    return casadi.Function.deserialize(zlib.decompress(serialized).decode())
+
+
+def sensitivities(
+    n_booms,
+    wing_span,
+    alpha,
+    hstab_twist_angle=-4,
+    ms_velocity=20,
+    fidelity=1,
+) -> dict:
+    """
+    Evaluates CL, CD, and L/D and their exact derivatives with respect to the INPUTS. Returns a dict of the three
+    outputs and, under "gradients", a dict of dicts: gradients[output][input] is d(output)/d(input), per unit of
+    that input (see INPUTS). Returns None if the solution is not finite.
+    """
+    outputs, jacobian = get_gradient_function(n_booms, fidelity)(
+        wing_span, alpha, hstab_twist_angle, ms_velocity
+    )
+    outputs = np.array(outputs).ravel()
+    jacobian = np.array(jacobian)
+    if not (np.all(np.isfinite(outputs)) and np.all(np.isfinite(jacobian))):
+        return None
+    return {
+        **{output: float(value) for output, value in zip(OUTPUTS, outputs)},
+        "gradients": {
+            output: {name: float(value) for name, value in zip(INPUTS, row)}
+            for output, row in zip(OUTPUTS, jacobian)
+        },
+    }
+
+
+def gradient_table(gradients) -> dict:
+    """
+    Flattens `sensitivities(...)["gradients"]` into {"dCL/dwing_span [1/m]": ..., "d(L/D)/dalpha [1/deg]": ...},
+    e.g. for a results table.
+    """
+    table = {}
+    for output, row in gradients.items():
+        numerator = f"d({output})" if "/" in output else f"d{output}"
+        for name, value in row.items():
+            table[f"{numerator}/d{name} [1/{INPUTS[name]}]"] = value
+    return table
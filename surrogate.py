@@ -0,0 +1,186 @@
+import argparse
+import functools
+import itertools
+import os
+
+import numpy as np
+
+import batch
+
+### Surrogate model of CL and CD over (n_booms, wing_span, alpha), for instant previews while the inputs change.
+# `python surrogate.py` samples the solver over a grid (in parallel, through batch.run_batch) and fits, for each boom
+# count, a polynomial in wing span and alpha to CL and CD by least squares. The coefficients are saved to an .npz
+# file; evaluating the surrogate is then a few dozen multiply-adds, with no solver call.
+# Each fit's error is estimated by leave-one-out cross-validation, which least squares gives exactly, for free,
+# through the diagonal of the hat matrix.
+#
+# Usage:
+#   python surrogate.py --method ll --output surrogate_ll.npz
+
+SURROGATE_PATH = os.environ.get(
+    "SURROGATE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "surrogate_ll.npz"),
+)
+N_BOOMS = [1, 2, 3]
+WING_SPAN_BOUNDS = (20, 60)  # m
+ALPHA_BOUNDS = (-5, 15)  # deg
+DEGREE = 6  # Total degree of the polynomial in (wing_span, alpha)
+OUTPUTS = ["CL", "CD"]
+
+
+def features(
+    wing_span,
+    alpha,
+    degree=DEGREE,
+    wing_span_bounds=WING_SPAN_BOUNDS,
+    alpha_bounds=ALPHA_BOUNDS,
+) -> np.ndarray:
+    """
+    Returns the (N, n_terms) polynomial features of points, with both inputs scaled to [-1, 1] over their bounds.
+    """
+    x = np.interp(np.atleast_1d(wing_span), wing_span_bounds, [-1, 1])
+    y = np.interp(np.atleast_1d(alpha), alpha_bounds, [-1, 1])
+    return np.stack(
+        [
+            x**i * y**j
+            for i, j in itertools.product(range(degree + 1), repeat=2)
+            if i + j <= degree
+        ],
+        axis=-1,
+    )
+
+
+def fit(wing_span, alpha, values, degree=DEGREE):
+    """
+    Least-squares fit of `values` (N, n_outputs) at the given points. Returns (coefficients, errors): the
+    (n_outputs, n_terms) coefficients and, per output, the root-mean-square leave-one-out prediction error.
+    """
+    X = features(wing_span, alpha, degree)
+    coefficients, *_ = np.linalg.lstsq(X, values, rcond=None)
+    hat_diagonal = np.einsum("ij,ji->i", X, np.linalg.pinv(X))
+    leave_one_out = (values - X @ coefficients) / (1 - hat_diagonal)[:, None]
+    return coefficients.T, np.sqrt(np.mean(leave_one_out**2, axis=0))
+
+
+def build(
+    method="ll",
+    n_wing_spans=9,
+    n_alphas=11,
+    degree=DEGREE,
+    max_workers=None,
+    output=SURROGATE_PATH,
+):
+    """
+    Samples `method` over an n_booms x n_wing_spans x n_alphas grid, fits the surrogate, and saves it to `output`.
+    Cases that fail or stall are left out of the fit.
+    """
+    rows = list(
+        batch.run_batch(
+            batch.cases_from_grid(
+                n_booms=N_BOOMS,
+                wing_span=np.linspace(*WING_SPAN_BOUNDS, n_wing_spans).tolist(),
+                alpha=np.linspace(*ALPHA_BOUNDS, n_alphas).tolist(),
+            ),
+            method=method,
+            max_workers=max_workers,
+        )
+    )
+
+    coefficients = []
+    errors = []
+    for n_booms in N_BOOMS:
+        samples = [
+            row for row in rows if row["n_booms"] == n_booms and row["status"] == "ok"
+        ]
+        c, e = fit(
+            [row["wing_span"] for row in samples],
+            [row["alpha"] for row in samples],
+            np.array([[row[name] for name in OUTPUTS] for row in samples]),
+            degree,
+        )
+        coefficients.append(c)
+        errors.append(e)
+        print(
+            f"n_booms={n_booms}: {len(samples)} samples, leave-one-out RMS error "
+            + ", ".join(f"{name} {error:.2e}" for name, error in zip(OUTPUTS, e))
+        )
+
+    np.savez(
+        output,
+        method=method,
+        degree=degree,
+        n_booms=N_BOOMS,
+        wing_span_bounds=WING_SPAN_BOUNDS,
+        alpha_bounds=ALPHA_BOUNDS,
+        coefficients=np.array(coefficients),
+        errors=np.array(errors),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load(path=SURROGATE_PATH):
+    """
+    Returns the saved surrogate as a dict of arrays, or None if there is none.
+    """
+    try:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    except FileNotFoundError:
+        return None
+
+
+def predict(n_booms, wing_span, alpha, model=None):
+    """
+    Estimates CL, CD, and L/D. Returns (estimate, error): dicts of the estimated values and of their estimated RMS
+    errors, or None if there is no surrogate or the point is outside the sampled range.
+    """
+    model = load() if model is None else model
+    if model is None or n_booms not in model["n_booms"]:
+        return None
+    if not (
+        model["wing_span_bounds"][0] <= wing_span <= model["wing_span_bounds"][1]
+        and model["alpha_bounds"][0] <= alpha <= model["alpha_bounds"][1]
+    ):
+        return None
+
+    i = list(model["n_booms"]).index(n_booms)
+    CL, CD = (
+        model["coefficients"][i]
+        @ features(
+            wing_span,
+            alpha,
+            int(model["degree"]),
+            model["wing_span_bounds"],
+            model["alpha_bounds"],
+        )[0]
+    )
+    CL_error, CD_error = model["errors"][i]
+    estimate = {"CL": float(CL), "CD": float(CD), "L/D": float(CL / CD)}
+    error = {
+        "CL": float(CL_error),
+        "CD": float(CD_error),
+        "L/D": float(abs(CL / CD) * np.hypot(CL_error / CL, CD_error / CD)),
+    }
+    return estimate, error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sample the solver and fit the CL/CD surrogate used for previews."
+    )
+    parser.add_argument("--method", choices=["ll", "vlm"], default="ll")
+    parser.add_argument("--n_wing_spans", type=int, default=9)
+    parser.add_argument("--n_alphas", type=int, default=11)
+    parser.add_argument("--degree", type=int, default=DEGREE)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=SURROGATE_PATH)
+    args = parser.parse_args()
+
+    build(
+        method=args.method,
+        n_wing_spans=args.n_wing_spans,
+        n_alphas=args.n_alphas,
+        degree=args.degree,
+        max_workers=args.workers,
+        output=args.output,
+    )
@@ -1,5 +1,58 @@
+import io
+import multiprocessing
+import time
+
 import aerosandbox as asb
-from airplane import make_airplane
+import diskcache
+import numpy as np
+import pytest
+from airplane import boom_locations, build_fuse, instances, make_airplane
+import array_store
+import batch
+import metrics
+from analysis import (
+    analyse_ll,
+    analyse_progressively,
+    analyse_vlm,
+    panel_outputs,
+    summarize_performance,
+)
+import envelope
+import loads
+import loadtest
+import optimize
+from optimize import optimize_design
+import results_cache
+import scene
+import sensitivity
+import surrogate
+from trim import trim
+import vlm
+from vlm import FactoredVortexLatticeMethod
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    """
+    Points the shared stores (results cache, array store, metrics, VLM sessions, and batch results) at fresh
+    directories for the test, to be opened on first use with their usual settings, and closes them after it,
+    whether it passed or not.
+    """
+    handles = [
+        (results_cache, "_cache", "CACHE_DIRECTORY", "results"),
+        (array_store, "_store", "ARRAY_STORE_DIRECTORY", "arrays"),
+        (metrics, "_store", "METRICS_DIRECTORY", "metrics"),
+        (vlm, "_sessions", "SESSION_DIRECTORY", "vlm"),
+        (batch, "_store", "RESULTS_DIRECTORY", "batches"),
+    ]
+    for module, handle, directory, name in handles:
+        monkeypatch.setattr(module, directory, str(tmp_path / name))
+        monkeypatch.setattr(module, handle, None)
+    yield
+    for module, handle, _, _ in handles:
+        store = getattr(module, handle)
+        if store is not None:
+            store.close()
 
 
 def test_lifting_line():
@@ -18,28 +71,681 @@ def test_lifting_line():
     )
 
     ### LL
-    # Run an analysis
-    opti = asb.Opti()  # Initialize an analysis/optimization environment
+    # Run an analysis (all inputs are numeric, so no Opti is needed)
     # airplane.fuselages=[]
     ap = asb.LiftingLine(
         airplane=airplane,
         op_point=op_point,
     )
     result = ap.run()
-    # Solver options
-    p_opts = {}
-    s_opts = {}
-    # s_opts["mu_strategy"] = "adaptive"
-    opti.solver("ipopt", p_opts, s_opts)
-    # Solve
-    try:
-        sol = opti.solve()
-    except RuntimeError:
-        sol = opti.debug
-        raise Exception("An error occurred!")
-    # Postprocess
-    # ap.substitute_solution(sol)
-    ap.draw(show=False, backend="plotly").show()
+    assert summarize_performance(result) is not None, "An error occurred!"
+    # Postprocess (headless; nothing is shown)
+    figure = ap.draw(show=False, backend="plotly")
+    assert len(figure.data) > 0
+
+
+def test_make_airplane_memoized():
+    airplane = make_airplane(n_booms=3, wing_span=40)
+    assert make_airplane(n_booms=3.0, wing_span=40.0) is airplane
+
+    ### Boom instances are mirror images about the centerline
+    left_fuse, center_fuse, right_fuse = airplane.fuselages
+    assert np.allclose(
+        left_fuse.xsecs[0].xyz_c[1], -right_fuse.xsecs[0].xyz_c[1]
+    )
+    assert center_fuse.xsecs[0].xyz_c[1] == 0
+
+
+def test_build_fuse():
+    dimensions = dict(
+        boom_length=6.181,
+        nose_length=1.5,
+        fuse_diameter=0.6,
+        boom_diameter=0.2,
+        wing_x_quarter_chord=-0.1,
+        wing_root_chord=2.316,
+    )
+
+    ### The nose starts at a point and the boom ends at its full diameter, at any resolution
+    fuse = build_fuse(**dimensions, resolution=300)
+    assert len(fuse.xsecs) == 2 * 300 + 3
+    assert fuse.xsecs[0].width == 0
+    assert np.isclose(fuse.xsecs[-1].xyz_c[0], 6.181)
+    assert np.isclose(fuse.xsecs[-1].width, 0.2)
+    assert np.isclose(fuse.volume(), build_fuse(**dimensions).volume(), rtol=0.02)
+
+    ### Boom instances are offset copies; the template is left as it was
+    airplane = make_airplane(n_booms=2, wing_span=40, fuse_resolution=100)
+    left, right = airplane.fuselages
+    assert len(left.xsecs) == 2 * 100 + 3
+    assert np.allclose(left.xsecs[50].xyz_c, right.xsecs[50].xyz_c * [1, -1, 1])
+    assert np.isclose(right.xsecs[50].xyz_c[1], 0.4 * 20)
+
+
+def test_boom_layout(stores):
+    ### Any number of booms, symmetric about the centerline, as long as their tails fit
+    for n_booms in range(1, 8):
+        locations = boom_locations(n_booms)
+        assert len(locations) == n_booms and np.all(np.diff(locations) > 0)
+        assert locations == [-location for location in locations[::-1]]
+    assert boom_locations(3) == [-0.57, 0, 0.57]
+    for n_booms, wing_span in [(0, 43), (2.5, 43), (6, 20)]:
+        with pytest.raises(ValueError, match="n_booms"):
+            boom_locations(n_booms, wing_span)
+
+    ### Each boom is an instance of one template; the instances cover the same surfaces as the airplane
+    airplane = make_airplane(n_booms=5, wing_span=60)
+    (_, wing_offsets), (hstab, offsets), (vstab, _) = instances(airplane, "wings")
+    assert len(wing_offsets) == 1 and len(offsets) == 5
+    assert len(airplane.wings) == 11 and len(airplane.fuselages) == 5
+    points, faces = scene.body_mesh(airplane)
+    reference_points, reference_faces = airplane.mesh_body(method="quad")
+    assert faces.shape == reference_faces.shape
+    assert np.allclose(
+        np.sort(points[faces].reshape(len(faces), -1), axis=0),
+        np.sort(reference_points[reference_faces].reshape(len(faces), -1), axis=0),
+    )
+
+    ### The symmetric VLM solve has half the unknowns, and the same answers as the full one
+    op_point = asb.OperatingPoint(velocity=20, alpha=5)
+    symmetric = FactoredVortexLatticeMethod(airplane=airplane, op_point=op_point)
+    full = FactoredVortexLatticeMethod(
+        airplane=airplane, op_point=op_point, exploit_symmetry=False
+    )
+    symmetric.factor()
+    assert len(symmetric.unknowns) < len(symmetric.vortex_centers) / 2
+    for op_points in [[op_point], [asb.OperatingPoint(velocity=20, alpha=5, beta=5)]]:
+        sweep, reference = [
+            analysis.run_sweep(op_points) for analysis in [symmetric, full]
+        ]
+        for key in ["CL", "CD", "Cm", "CY"]:
+            assert np.allclose(sweep[key], reference[key], rtol=1e-8, atol=1e-10)
+
+
+def test_factored_vlm(stores):
+    airplane = make_airplane(
+        n_booms=2,
+        wing_span=40,
+    )
+    op_points = [asb.OperatingPoint(velocity=20, alpha=alpha) for alpha in [0, 5]]
+
+    ### One factorization, several right-hand sides, same answers as the stock VLM
+    sweep = FactoredVortexLatticeMethod(
+        airplane=airplane,
+        op_point=op_points[0],
+    ).run_sweep(op_points)
+    for i, op_point in enumerate(op_points):
+        result = asb.VortexLatticeMethod(
+            airplane=airplane,
+            op_point=op_point,
+        ).run()
+        for key in ["CL", "CD", "Cm"]:
+            assert np.isclose(sweep[key][i], result[key])
+
+
+def test_progressive_refinement():
+    airplane = make_airplane(n_booms=1, wing_span=40)
+    kwargs = dict(
+        my_airplane=airplane,
+        ms_velocity=20,
+        angle_of_attack=5,
+        angle_of_sideslip=0,
+    )
+
+    ### Coarse levels first, each one reported as it finishes; panel counts grow with fidelity
+    previews = []
+    ap, result, refinement = analyse_progressively(
+        analyse_ll,
+        fidelity=1,
+        rtol=0,
+        report_refinement=lambda refinement: previews.append(len(refinement)),
+        **kwargs,
+    )
+    assert [level["Fidelity"] for level in refinement] == [0.25, 0.5, 1]
+    assert previews == [1, 2, 3]
+    assert np.all(np.diff([level["Panels"] for level in refinement]) > 0)
+    assert refinement[-1]["CL"] == summarize_performance(result)["CL"]
+
+    ### A loose tolerance converges (and stops) at the second level
+    ap, result, refinement = analyse_progressively(
+        analyse_ll, fidelity=2, rtol=1, **kwargs
+    )
+    assert len(refinement) == 2 and refinement[-1]["Converged"]
+
+
+def test_batch(stores):
+    cases = batch.cases_from_csv(
+        io.StringIO("n_booms,wing_span,alpha\n1,40,5\n0,40,5\n2,40,5\n")
+    )
+
+    ### Every case gets a row, in whatever order they finish; bad or slow cases are recorded, not raised
+    rows = {
+        row["case"]: row for row in batch.run_batch(cases, max_workers=2, timeout=30)
+    }
+    assert rows[0]["status"] == "ok" and np.isfinite(rows[0]["CL"])
+    assert rows[1]["status"] == "failed" and "n_booms" in rows[1]["error"]
+    assert rows[2]["status"] == "ok"
+
+    rows = list(batch.run_batch([{"n_booms": 3, "wing_span": 40, "alpha": 5}], timeout=0))
+    assert rows[0]["status"] == "timeout"
+
+    lines = "".join(batch.csv_lines([rows[0]])).splitlines()
+    assert lines[0].split(",") == batch.COLUMNS
+    assert len(lines) == 2
+
+
+def test_metrics(stores):
+    ### Histograms are cumulative per label set, in the Prometheus text format
+    with metrics.timed("solve", analysis="vlm", n_booms=2):
+        pass
+    metrics.observe("stage_seconds", 3.0, stage="solve", analysis="vlm", n_booms=2)
+    text = metrics.render()
+    labels = 'analysis="vlm",n_booms="2",stage="solve"'
+    assert "# TYPE asb_demo_stage_seconds histogram" in text
+    assert f'asb_demo_stage_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'asb_demo_stage_seconds_bucket{{{labels},le="5"}} 2' in text
+    assert f'asb_demo_stage_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"asb_demo_stage_seconds_count{{{labels}}} 2" in text
+
+
+def test_vlm_sessions(stores):
+    airplane = make_airplane(n_booms=1, wing_span=40)
+
+    ### The second analysis of a geometry, at any alpha, reuses the stored factorization
+    first = FactoredVortexLatticeMethod(
+        airplane=airplane,
+        op_point=asb.OperatingPoint(velocity=20, alpha=5),
+    )
+    first.run()
+    assert len(vlm.get_session_store()) == 1
+
+    second = FactoredVortexLatticeMethod(
+        airplane=airplane,
+        op_point=asb.OperatingPoint(velocity=20, alpha=8),
+    )
+    result = second.run()
+    assert len(vlm.get_session_store()) == 1
+    assert np.array_equal(second.AIC_lu[0], first.AIC_lu[0])
+
+    reference = asb.VortexLatticeMethod(
+        airplane=airplane,
+        op_point=asb.OperatingPoint(velocity=20, alpha=8),
+    ).run()
+    assert np.isclose(result["CL"], reference["CL"])
+
+
+def test_results_cache(stores):
+    ### Equivalent inputs map to the same entry; different analyses do not
+    key = results_cache.make_key("ll", n_booms=1, wing_span=43, alpha=7)
+    assert key == results_cache.make_key("ll", n_booms=1.0, wing_span=43.0, alpha=7.0)
+    assert key != results_cache.make_key("vlm", n_booms=1, wing_span=43, alpha=7)
+    assert key == results_cache.make_key("ll", n_booms=True, wing_span="43", alpha="7.0")
+    assert results_cache.make_key(
+        "optimize", optimize_options=["alpha", "n_booms"]
+    ) == results_cache.make_key("optimize", optimize_options=["n_booms", "alpha"])
+
+    assert results_cache.get(key) is None
+    results_cache.put(key, {"figure": "{}", "performance": {"CL": 1.0}})
+    assert results_cache.get(key)["performance"] == {"CL": 1.0}
+
+    stats = results_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_array_store(stores, monkeypatch):
+    monkeypatch.setattr(array_store, "ARRAY_STORE_SIZE_LIMIT", 2 * 1024**2)
+
+    ### Arrays come back exactly, as read-only views onto the stored file
+    arrays = {
+        "points": np.random.default_rng(0).random((1000, 3)).astype("<f4"),
+        "faces": np.arange(4000, dtype="<u4").reshape(-1, 4),
+        "flags": np.array([True, False]),
+        "empty": np.zeros((0, 3)),
+    }
+    array_store.put("mesh", **arrays)
+    stored = array_store.get("mesh")
+    for name, array in arrays.items():
+        assert stored[name].dtype == array.dtype
+        assert np.array_equal(stored[name], array)
+    assert not stored["points"].flags.writeable
+    assert array_store.get("missing") is None
+
+    ### The total size stays bounded, evicting the least recently used entries
+    for i in range(20):
+        array_store.put(i, values=np.full(2**15, i, dtype=float))  # 256 kB each
+    assert array_store.get_store().volume() <= 2 * 1024**2
+    assert array_store.get(0) is None
+    assert np.all(array_store.get(19)["values"] == 19)
+
+
+def test_single_flight(stores):
+    cache = results_cache.get_cache()
+
+    ### Concurrent identical requests, in separate processes, share a single computation
+    def compute():
+        cache.incr("computations")
+        time.sleep(1)
+        return {"CL": 1.0}
+
+    def request(i):
+        answer = results_cache.get_or_compute("key", compute, poll_interval=0.05)
+        cache.set(("answer", i), answer)
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=request, args=(i,)) for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert cache.get("computations") == 1
+    assert all(cache.get(("answer", i)) == {"CL": 1.0} for i in range(4))
+
+    ### A computation whose process died (its lease is not renewed) is taken over once the lease runs out
+    cache.add(("in_flight", "other key"), 0, expire=0.5)
+    assert results_cache.get_or_compute(
+        "other key", lambda: {"CL": 2.0}, poll_interval=0.05
+    ) == {"CL": 2.0}
+
+    ### A holder whose lease ran out (and whose lock was taken over) can't release its successor's lock
+    token = results_cache.acquire("lock", lease=0.05)
+    time.sleep(0.1)
+    successor = results_cache.acquire("lock")
+    assert successor is not None
+    with results_cache.held("lock", token):
+        pass
+    assert results_cache.acquire("lock") is None
+    results_cache.release("lock", successor)
+    assert results_cache.acquire("lock") is not None
+
+
+def test_scene_payloads():
+    airplane = make_airplane(n_booms=2, wing_span=40)
+    ap, result = analyse_ll(
+        my_airplane=airplane,
+        ms_velocity=20,
+        angle_of_attack=5,
+        angle_of_sideslip=0,
+    )
+
+    ### Panels round-trip exactly; streamlines are quantized but still far finer than the drawing needs
+    key = scene.geometry_key("ll", n_booms=2, wing_span=40)
+    geometry = scene.panel_geometry(ap, key)
+    points = scene.decode(geometry["points"]).reshape(-1, 4, 3)
+    assert np.allclose(points[:, 0, :], ap.front_left_vertices, atol=1e-5)
+    assert scene.decode(geometry["faces"]).shape == (len(points), 4)
+
+    view = scene.solution_scene(ap, key)
+    assert view["geometry"] == key
+    assert np.allclose(scene.decode(view["intensity"]), np.ravel(ap.vortex_strengths))
+    streamlines = np.transpose(ap.streamlines, (0, 2, 1))
+    extent = np.ptp(streamlines.reshape(-1, 3), axis=0)
+    assert np.all(
+        np.abs(scene.decode(view["streamlines"]) - streamlines) <= 1e-4 * extent
+    )
+
+
+def test_optimize_design(stores, monkeypatch):
+    ### With alpha held fixed, the optimum is a feasible design that the direct analysis agrees with
+    design = optimize_design(
+        span_bounds=(30, 40),
+        alpha_bounds=(5, 5),
+        boom_counts=(1,),
+    )
+    assert design["n_booms"] == 1
+    assert 30 - 1e-6 <= design["wing_span"] <= 40 + 1e-6
+    assert np.isclose(design["alpha"], 5)
+
+    ap, result = analyse_ll(
+        my_airplane=make_airplane(n_booms=1, wing_span=design["wing_span"]),
+        ms_velocity=20,
+        angle_of_attack=design["alpha"],
+        angle_of_sideslip=0,
+    )
+    assert np.isclose(summarize_performance(result)["L/D"], design["L/D"], rtol=1e-4)
+
+    ### Other processes (e.g. the next Optimize job) load the stored problem rather than rebuilding it
+    optimize.get_optimizer.cache_clear()
+    monkeypatch.setattr(optimize, "build_optimizer", None)
+    assert optimize_design(
+        span_bounds=(30, 40),
+        alpha_bounds=(5, 5),
+        boom_counts=(1,),
+    ) == pytest.approx(design)
+
+    ### Airspeed is a parameter of the same problem; boom counts whose tails can't fit in the span bounds are skipped
+    fast_design = optimize_design(
+        span_bounds=(15, 20),
+        alpha_bounds=(5, 5),
+        boom_counts=(1, 6),
+        ms_velocity=30,
+    )
+    assert fast_design["n_booms"] == 1
+    assert 15 - 1e-6 <= fast_design["wing_span"] <= 20 + 1e-6
+    ap, result = analyse_ll(
+        my_airplane=make_airplane(n_booms=1, wing_span=fast_design["wing_span"]),
+        ms_velocity=30,
+        angle_of_attack=fast_design["alpha"],
+        angle_of_sideslip=0,
+    )
+    assert np.isclose(
+        summarize_performance(result)["L/D"], fast_design["L/D"], rtol=1e-4
+    )
+
+
+def test_surrogate():
+    ### A polynomial of the fitted degree is recovered exactly, with no cross-validation error
+    wing_span, alpha = np.meshgrid(np.linspace(20, 60, 9), np.linspace(-5, 15, 11))
+    values = np.stack(
+        [1 + 0.1 * alpha + 1e-3 * wing_span**2, 0.02 + 1e-4 * alpha**2], axis=-1
+    )
+    _, errors = surrogate.fit(wing_span.ravel(), alpha.ravel(), values.reshape(-1, 2))
+    assert np.all(errors < 1e-9)
+
+    ### The shipped surrogate agrees with the solver to within a few times its estimated error
+    estimate, error = surrogate.predict(n_booms=2, wing_span=47, alpha=6)
+    ap, result = analyse_ll(
+        my_airplane=make_airplane(n_booms=2, wing_span=47),
+        ms_velocity=20,
+        angle_of_attack=6,
+        angle_of_sideslip=0,
+    )
+    for name in ["CL", "CD"]:
+        assert abs(estimate[name] - result[name]) < 4 * error[name]
+    assert surrogate.predict(n_booms=2, wing_span=100, alpha=6) is None
+
+
+def test_trim(stores):
+    ### At the trim point, lift carries the weight with no pitching moment, as an independent analysis confirms
+    point = trim(method="vlm", n_booms=1, wing_span=43, mass=2000, ms_velocity=20)
+    assert point["converged"]
+    ap, result = analyse_vlm(
+        my_airplane=make_airplane(
+            n_booms=1, wing_span=43, hstab_twist_angle=point["hstab_twist_angle"]
+        ),
+        ms_velocity=20,
+        angle_of_attack=point["alpha"],
+        angle_of_sideslip=0,
+    )
+    assert np.isclose(result["L"], 2000 * 9.81, rtol=2e-3)
+    assert abs(result["Cm"]) < 1e-3
+
+    ### Re-trimming at another mass starts from that point and needs only a few analyses
+    point = trim(method="vlm", n_booms=1, wing_span=43, mass=2100, ms_velocity=20)
+    assert point["converged"]
+    assert point["analyses"] <= 3
+
+
+def test_warm_caches(stores):
+    import app
+
+    ### After warming, the page's first request (the default display) is a cache hit
+    assert app.server is app.app.server
+    app.warm_caches(boom_counts=(1,))
+    defaults = {name: app.app.layout[name].value for name in app.PARAMETERS}
+    request = app.analysis_request("display", defaults)
+    result = results_cache.get(request["key"])
+    assert result is not None
+    assert scene.load_geometry(result["geometry"]) is not None
+
+
+def test_staged_progress(stores):
+    import app
+
+    ### The airplane's mesh is reported (and served) before the influence matrix is assembled and the solve finishes
+    events = []
+    geometry, view, performance, refinement = app.compute_result(
+        "vlm",
+        n_booms=1,
+        wing_span=43,
+        alpha=5,
+        fidelity=0.5,
+        report_progress=lambda percent, label: events.append(label),
+        report_geometry=lambda geometry: events.append(geometry["key"]),
+        report_refinement=lambda refinement: events.append("solved"),
+    )
+    body_key = scene.geometry_key("body", 1, 43)
+    assert events.index(body_key) < events.index("solved")
+    assert any(
+        "Influence matrix assembled" in event
+        for event in events[events.index(body_key) : events.index("solved")]
+    )
+    response = app.server.test_client().get(f"/geometry/{body_key}")
+    assert response.status_code == 200
+    assert response.get_json() == scene.load_geometry(body_key)
+
+    ### One job at a time per session: a second lock on it is refused until the first is released
+    lock = app.running_lock("session")
+    token = results_cache.acquire(lock)
+    assert token is not None
+    assert results_cache.acquire(lock) is None
+    with results_cache.held(lock, token):
+        assert results_cache.acquire(lock) is None
+    assert results_cache.acquire(lock) is not None
+
+    ### Inputs that can't be analysed are turned away with a message, before any job is started
+    defaults = {name: app.app.layout[name].value for name in app.PARAMETERS}
+    app.check_inputs(app.analysis_request("ll_polar", defaults))
+    for changes in [
+        {"alpha_points": None},
+        {"alpha_points": 1},
+        {"n_booms": 6, "wing_span": 10},
+    ]:
+        request = app.analysis_request("ll_polar", {**defaults, **changes})
+        with pytest.raises(ValueError):
+            app.check_inputs(request)
+    for changes in [
+        {"span_min": None},
+        {"alpha": None, "optimize_options": []},
+        {"span_min": 30, "span_max": 20},
+        {"n_booms": 6, "span_min": 20, "span_max": 21},
+    ]:
+        request = app.analysis_request("optimize", {**defaults, **changes})
+        with pytest.raises(ValueError):
+            app.check_inputs(request)
+
+    ### An optimization that finds no design is reported as failed, with nothing to draw
+    geometry, view, performance, refinement = app.compute_result(
+        "optimize",
+        n_booms=6,
+        alpha=5,
+        objective="L/D",
+        span_min=20,
+        span_max=21,
+        optimize_options=["alpha"],
+        alpha_min=-5,
+        alpha_max=15,
+    )
+    assert (geometry, view, performance) == (None, None, None)
+    result = {"scene": view, "performance": performance}
+    assert "Optimization failed" in str(app.format_result("optimize", result)[3])
+
+
+def test_batch_route(stores, monkeypatch):
+    import app
+
+    client = app.server.test_client()
+
+    ### A batch is answered at once with a job id; its rows are served as the job finishes them
+    grid = {"n_booms": [1], "wing_span": [40], "alpha": [0, 5]}
+    response = client.post("/batch", json={"grid": grid, "method": "ll"})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job["cases"] == 2
+    deadline = time.monotonic() + 120
+    while True:
+        response = client.get(job["results"])
+        assert response.status_code == 200
+        if response.headers["X-Batch-Status"] == "done" or time.monotonic() > deadline:
+            break
+        time.sleep(0.5)
+    assert response.headers["X-Batch-Progress"] == "2/2"
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0].split(",") == batch.COLUMNS
+    assert len(lines) == 3 and all(",ok," in line for line in lines[1:])
+
+    ### Unknown jobs are not found, and jobs with rows missing (expired) are gone rather than served in part
+    assert client.get("/batch/unknown").status_code == 404
+    batch.get_store().delete((job["results"].rsplit("/", 1)[1], 0))
+    assert client.get(job["results"]).status_code == 410
+
+    ### Batches over the cap are refused
+    monkeypatch.setattr(app, "MAX_BATCH_CASES", 1)
+    assert client.post("/batch", json={"grid": grid}).status_code == 413
+
+    ### Request times are labelled by route, not by each job's URL
+    exposition = metrics.render()
+    assert 'path="/batch/<job>"' in exposition
+    assert job["results"] not in exposition
+
+
+def test_spanwise_loads(stores):
+    airplane = make_airplane(n_booms=3, wing_span=43)
+    for analyse in [analyse_ll, analyse_vlm]:
+        ap, result = analyse(
+            my_airplane=airplane, ms_velocity=20, angle_of_attack=5, angle_of_sideslip=0
+        )
+        solution = panel_outputs(ap)
+
+        ### Per-panel forces add up to the total (LL's, from Kutta-Joukowski, less the fuselages and profile drag)
+        lift = solution["forces_geometry"] @ solution["lift_direction"]
+        assert np.isclose(lift.sum(), result["L"], rtol=0.01)
+
+        ### Strips cover the main wing; the root carries half its lift, and the moment of it about the root
+        spanwise = loads.spanwise_loads(solution)
+        wing_lift = lift[solution["wing_indices"] == 0]
+        assert np.isclose(
+            np.sum(spanwise["lift_per_span"] * spanwise["width"]), wing_lift.sum()
+        )
+        assert np.allclose(spanwise["y"], -spanwise["y"][::-1])
+        root = loads.root_loads(spanwise)
+        right = spanwise["y"] > 0
+        strip_lift = spanwise["lift_per_span"] * spanwise["width"]
+        assert np.isclose(root["Root shear [N]"], wing_lift.sum() / 2)
+        assert np.isclose(
+            root["Root bending moment [N m]"],
+            np.sum(strip_lift[right] * spanwise["y"][right]),
+        )
+        assert np.all(np.diff(spanwise["bending_moment"][right]) < 0)
+
+    csv = loads.encode_loads(spanwise, "csv").decode().splitlines()
+    assert len(csv) == 1 + len(spanwise["y"]) and csv[0].startswith("y [m],")
+    assert len(loads.draw_loads(spanwise).data) == 4
+
+
+def test_sensitivities(stores, monkeypatch):
+    point = dict(n_booms=1, wing_span=43, alpha=5, hstab_twist_angle=-4)
+
+    ### Exact gradients agree with central differences of the numeric LL analysis
+    exact = sensitivity.sensitivities(**point)
+
+    def performance(**changes):
+        inputs = {**point, **changes}
+        ap, result = analyse_ll(
+            my_airplane=make_airplane(
+                n_booms=inputs["n_booms"],
+                wing_span=inputs["wing_span"],
+                hstab_twist_angle=inputs["hstab_twist_angle"],
+            ),
+            ms_velocity=20,
+            angle_of_attack=inputs["alpha"],
+            angle_of_sideslip=0,
+        )
+        return summarize_performance(result)
+
+    assert np.isclose(exact["CL"], performance()["CL"])
+    step = 1e-3
+    for name in sensitivity.INPUTS:
+        plus = performance(**{name: point[name] + step})
+        minus = performance(**{name: point[name] - step})
+        for output in sensitivity.OUTPUTS:
+            assert np.isclose(
+                exact["gradients"][output][name],
+                (plus[output] - minus[output]) / (2 * step),
+                rtol=1e-3,
+                atol=1e-6,
+            )
+
+    ### Other processes load the stored function rather than rebuilding it
+    sensitivity.get_gradient_function.cache_clear()
+    monkeypatch.setattr(sensitivity, "build_gradient_function", None)
+    assert sensitivity.sensitivities(**point) == exact
+    assert "d(L/D)/dalpha [1/deg]" in sensitivity.gradient_table(exact["gradients"])
+
+
+def test_loadtest(stores):
+    import app
+
+    app.warm_caches(boom_counts=(1,))
+
+    class TestClientBrowser(loadtest.Browser):
+        # The same requests, through Flask's test client instead of a socket
+        def __init__(self, url, timeout=60):
+            super().__init__(url, timeout)
+            self.client = app.server.test_client()
+
+        def request(self, path, body=None):
+            start = time.perf_counter()
+            if body is None:
+                response = self.client.get(path)
+            else:
+                response = self.client.post(path, json=body)
+            self.http_seconds.append(time.perf_counter() - start)
+            assert response.status_code == 200
+            return response.get_json() if response.is_json else response.text
+
+    ### Clicks on the page's default display are answered straight from the warm cache, and the server's time is seen
+    run = loadtest.run_load(
+        "",
+        users=2,
+        duration=1,
+        mix={"display": 1},
+        n_distinct=1,
+        think_seconds=0,
+        workers=2,  # Each user's requests are served in its own thread
+        browser_class=TestClientBrowser,
+    )
+    summary = run["summary"]
+    assert len(run["clicks"]) > 0
+    assert all(click["outcome"] == "cached" for click in run["clicks"])
+    display = summary["analyses"]["display"]
+    assert display["cached"] == summary["analyses"]["all"]["clicks"]
+    assert 0 < display["p50_s"] <= display["p95_s"] <= display["p99_s"]
+    assert 0 < summary["saturation"] <= 1
+    assert summary["http_requests"] >= len(run["clicks"])
+    assert loadtest.parse_mix("display=2,vlm") == {"display": 2.0, "vlm": 1.0}
+
+
+def test_flight_envelope():
+    flight_envelope = envelope.run_envelope(
+        n_booms=1,
+        wing_span=43,
+        mass=2000,
+        altitudes=[0, 5000, 10000],
+        velocities=[15, 25, 35],
+        n_reynolds=3,
+    )
+
+    ### Too slow to fly high; fast enough everywhere at the top speed
+    assert np.isnan(flight_envelope["power"][:, 0]).all()
+    assert np.isfinite(flight_envelope["power"][:, -1]).all()
+
+    ### Each level-flight point agrees with an LL analysis run directly at its altitude, airspeed, and alpha
+    airplane = make_airplane(n_booms=1, wing_span=43)
+    for i, j in zip(*np.nonzero(np.isfinite(flight_envelope["alpha"]))):
+        ap, result = analyse_ll(
+            my_airplane=airplane,
+            ms_velocity=flight_envelope["velocity"][j],
+            angle_of_attack=flight_envelope["alpha"][i, j],
+            angle_of_sideslip=0,
+            altitude=flight_envelope["altitude"][i],
+        )
+        assert np.isclose(result["CL"], flight_envelope["CL"][i, j], rtol=0.02)
+        assert np.isclose(result["CD"], flight_envelope["CD"][i, j], rtol=0.05)
+
+    summary = envelope.summarize_envelope(flight_envelope)
+    assert summary["Ceiling [m]"] == 10000
+    assert summary["Minimum power [kW]"] == np.nanmin(flight_envelope["power"])
+    assert len(envelope.draw_envelope(flight_envelope).data) == 3
 
 
 if __name__ == "__main__":
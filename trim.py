@@ -0,0 +1,157 @@
+import numpy as np
+
+from airplane import make_airplane
+from analysis import analyse_ll, analyse_vlm, make_op_point
+import results_cache
+
+### Trim: the angle of attack and horizontal stabilizer incidence at which lift balances weight and the pitching
+# moment is zero, at a given mass and airspeed.
+# Both residuals (CL minus the CL needed to carry the weight, and Cm) are close to linear in the two angles, so a
+# quasi-Newton (Broyden) iteration on plain LL or VLM runs converges in a few analyses - no IPOPT solve needed. Every
+# analysis is cached, and each solve starts from the last trim point (and Jacobian) found for the same airplane and
+# method, so re-trimming at another mass or speed usually takes one or two analyses.
+
+G = 9.81  # m/s^2
+ALPHA_BOUNDS = (-10, 15)  # deg
+HSTAB_TWIST_BOUNDS = (-20, 10)  # deg
+MAX_STEP = 5  # deg, per iteration and angle
+FINITE_DIFFERENCE_STEP = 0.5  # deg
+
+
+def trim(
+    method="ll",
+    n_booms=1,
+    wing_span=43,
+    mass=2000,
+    ms_velocity=20,
+    fidelity=1,
+    lift_rtol=1e-3,
+    cm_atol=1e-4,
+    max_iterations=10,
+    report_progress=lambda percent, label: None,
+) -> dict:
+    """
+    Finds the trimmed flight condition of the airplane with `method` ("ll" or "vlm"). Returns a dict of "alpha" and
+    "hstab_twist_angle" [deg], the "CL", "CD", "L/D", and "Cm" there, "analyses" (the number of LL or VLM runs it
+    took; cached points are free), and "converged" (whether L = W within `lift_rtol` and |Cm| <= `cm_atol`). Returns
+    None if the starting point has no solution.
+    """
+    analyse = {"ll": analyse_ll, "vlm": analyse_vlm}[method]
+    airplane = make_airplane(n_booms=n_booms, wing_span=wing_span)
+    dynamic_pressure = make_op_point(ms_velocity, 0, 0).dynamic_pressure()
+    CL_required = mass * G / (dynamic_pressure * airplane.s_ref)
+    lower, upper = np.transpose([ALPHA_BOUNDS, HSTAB_TWIST_BOUNDS])
+    analyses = 0
+
+    def coefficients(x):
+        nonlocal analyses
+        alpha, hstab_twist_angle = x
+        key = results_cache.make_key(
+            "trim_point",
+            method=method,
+            n_booms=n_booms,
+            wing_span=wing_span,
+            hstab_twist_angle=hstab_twist_angle,
+            alpha=alpha,
+            ms_velocity=ms_velocity,
+            fidelity=fidelity,
+        )
+        value = results_cache.get(key)
+        if value is None:
+            ap, result = analyse(
+                my_airplane=make_airplane(
+                    n_booms=n_booms,
+                    wing_span=wing_span,
+                    hstab_twist_angle=float(hstab_twist_angle),
+                ),
+                ms_velocity=ms_velocity,
+                angle_of_attack=float(alpha),
+                angle_of_sideslip=0,
+                fidelity=fidelity,
+            )
+            value = {name: float(result[name]) for name in ["CL", "CD", "Cm"]}
+            results_cache.put(key, value)
+            analyses += 1
+        return value
+
+    def residual(x):
+        value = coefficients(x)
+        return np.array([value["CL"] - CL_required, value["Cm"]])
+
+    def converged(r):
+        return abs(r[0]) <= lift_rtol * CL_required and abs(r[1]) <= cm_atol
+
+    ### Warm start from the last trim of this airplane, if there is one
+    warm_start_key = results_cache.make_key(
+        "trim_warm_start",
+        method=method,
+        n_booms=n_booms,
+        wing_span=wing_span,
+        fidelity=fidelity,
+    )
+    warm_start = results_cache.get(warm_start_key)
+    if warm_start is not None:
+        x = np.clip(warm_start["x"], lower, upper)
+        jacobian = np.array(warm_start["jacobian"])
+    else:
+        x = np.array([5.0, -4.0])
+        jacobian = None
+
+    r = residual(x)
+    if not np.all(np.isfinite(r)):
+        return None
+    if jacobian is None:
+        jacobian = np.stack(
+            [
+                (residual(x + FINITE_DIFFERENCE_STEP * e) - r) / FINITE_DIFFERENCE_STEP
+                for e in np.eye(2)
+            ],
+            axis=1,
+        )
+
+    for iteration in range(max_iterations):
+        report_progress(
+            10 + 70 * iteration // max_iterations,
+            f"Trimming: alpha {x[0]:.2f} deg, hstab {x[1]:.2f} deg",
+        )
+        if converged(r):
+            break
+        try:
+            step = np.linalg.solve(jacobian, -r)
+        except np.linalg.LinAlgError:
+            break
+        step *= min(1, MAX_STEP / np.max(np.abs(step)))
+
+        # Back off toward the current point if the step lands somewhere without a solution (e.g. stalled)
+        for _ in range(4):
+            x_new = np.clip(x + step, lower, upper)
+            r_new = residual(x_new)
+            if np.all(np.isfinite(r_new)):
+                break
+            step /= 2
+        else:
+            break
+
+        # Broyden update: the secant along this step, unchanged in every other direction
+        dx = x_new - x
+        if np.any(dx != 0):
+            jacobian += np.outer(r_new - r - jacobian @ dx, dx) / (dx @ dx)
+        x, r = x_new, r_new
+
+    is_converged = converged(r)
+    if is_converged:
+        results_cache.put(
+            warm_start_key, {"x": x.tolist(), "jacobian": jacobian.tolist()}
+        )
+
+    value = coefficients(x)
+    return {
+        "alpha": float(x[0]),
+        "hstab_twist_angle": float(x[1]),
+        "CL": value["CL"],
+        "CD": value["CD"],
+        "L/D": value["CL"] / value["CD"],
+        "Cm": value["Cm"],
+        "analyses": analyses,
+        "converged": bool(is_converged),
+    }
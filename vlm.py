@@ -0,0 +1,484 @@
+import hashlib
+import os
+import tempfile
+
+import aerosandbox as asb
+import diskcache
+import numpy as np
+from aerosandbox.aerodynamics.aero_3D.singularities.uniform_strength_horseshoe_singularities import (
+    calculate_induced_velocity_horseshoe,
+)
+from aerosandbox.aerodynamics.aero_3D.vortex_lattice_method import tall, wide
+from scipy import linalg
+from typing import Dict, Any, List
+
+from airplane import instances
+
+### Factored influence matrices, keyed by the panel geometry and shared by every process through an on-disk store.
+# The VLM solve for a geometry that any worker (or earlier background job) has already seen is then a
+# back-substitution. Least-recently-used entries are evicted past the size limit.
+SESSION_DIRECTORY = os.environ.get(
+    "VLM_SESSION_DIR",
+    os.path.join(tempfile.gettempdir(), "asb-demo-vlm-sessions"),
+)
+SESSION_SIZE_LIMIT = int(
+    os.environ.get("VLM_SESSION_SIZE_LIMIT", 1024**3)
+)  # bytes
+
+_sessions = None
+
+
+def get_session_store() -> diskcache.Cache:
+    global _sessions
+    if _sessions is None:
+        _sessions = diskcache.Cache(
+            directory=SESSION_DIRECTORY,
+            size_limit=SESSION_SIZE_LIMIT,
+            eviction_policy="least-recently-used",
+        )
+    return _sessions
+
+
+def mirror_panels(left_vortex_vertices, right_vortex_vertices, decimals=9):
+    """
+    Pairs up the horseshoe vortices that are mirror images of each other about the y = 0 plane. Returns (images,
+    signs): panel i's image is panel images[i], and signs[i] is +1 if the image runs the other way round (its left
+    vertex is the image of panel i's right vertex, as on the two halves of a symmetric wing), or -1 if it runs the
+    same way (as on two vertical fins, or a fin on the centerline, which is its own image). Returns None if some
+    panel has no image, i.e. the mesh is not symmetric.
+    """
+    mirror = np.array([1, -1, 1])
+
+    def keys(left, right):
+        # Rounded (and with -0.0 made 0.0), so that coordinates that only differ by round-off match
+        vertices = np.round(np.concatenate([left, right], axis=1), decimals) + 0.0
+        return [row.tobytes() for row in vertices]
+
+    index = {
+        key: i
+        for i, key in enumerate(keys(left_vortex_vertices, right_vortex_vertices))
+    }
+    images = np.empty(len(index), dtype=int)
+    signs = np.empty(len(index))
+    for i, (reversed_key, same_key) in enumerate(
+        zip(
+            keys(right_vortex_vertices * mirror, left_vortex_vertices * mirror),
+            keys(left_vortex_vertices * mirror, right_vortex_vertices * mirror),
+        )
+    ):
+        if reversed_key in index:
+            images[i], signs[i] = index[reversed_key], 1
+        elif same_key in index:
+            images[i], signs[i] = index[same_key], -1
+        else:
+            return None
+    return images, signs
+
+
+def is_symmetric(op_point) -> bool:
+    # Sideslip, roll rate, and yaw rate are the only operating-point inputs that break the left/right symmetry
+    return all(
+        np.all(np.asarray(value) == 0)
+        for value in [op_point.beta, op_point.p, op_point.r]
+    )
+
+
+class FactoredVortexLatticeMethod(asb.VortexLatticeMethod):
+    """
+    A VortexLatticeMethod that assembles and LU-factorizes the aerodynamic influence coefficient (AIC) matrix once
+    per geometry. The AIC matrix does not depend on the operating point (as long as the trailing vortices stay
+    aligned with the geometry x-axis), so every further operating point costs only a back-substitution.
+
+    If the mesh is symmetric about the y = 0 plane (and `exploit_symmetry` is True), the solution at a symmetric
+    operating point (no sideslip, roll rate, or yaw rate) is too: each mirror pair of panels has one unknown vortex
+    strength, and a fin on the centerline none. The AIC matrix is then only assembled for one panel per pair, about
+    half the rows of the full one, and folded onto as many columns, for an eighth of the factorization work. An
+    asymmetric operating point falls back to the full matrix.
+
+    Usage example:
+        >>> analysis = FactoredVortexLatticeMethod(airplane=my_airplane, op_point=asb.OperatingPoint(alpha=5))
+        >>> aero_data = analysis.run()  # Assembles and factors the AIC matrix, then solves
+        >>> sweep = analysis.run_sweep([asb.OperatingPoint(alpha=a) for a in range(10)])  # Back-substitutions only
+    """
+
+    def __init__(self, *args, exploit_symmetry=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.align_trailing_vortices_with_wind:
+            raise ValueError(
+                "The AIC matrix can only be reused if `align_trailing_vortices_with_wind` is False."
+            )
+        self.exploit_symmetry = exploit_symmetry
+        self.is_factored = False
+
+    def factor(self) -> None:
+        """
+        Meshes the airplane (identically to VortexLatticeMethod.run(), but meshing each distinct wing only once; see
+        airplane.instances), then assembles and LU-factorizes the AIC matrix, reduced by symmetry where it applies.
+        Also keeps the unit-strength induced velocities at the vortex centers, which turns the force computation for
+        any operating point into a matrix product.
+
+        Both are looked up in the shared session store first (keyed by the mesh), and stored there once computed.
+        """
+        if self.verbose:
+            print("Meshing...")
+
+        ##### Make Panels
+        front_left_vertices = []
+        back_left_vertices = []
+        back_right_vertices = []
+        front_right_vertices = []
+        is_trailing_edge = []
+
+        for wing, offsets in instances(self.airplane, "wings"):
+            if self.spanwise_resolution > 1:
+                wing = wing.subdivide_sections(
+                    ratio=self.spanwise_resolution,
+                    spacing_function=self.spanwise_spacing_function,
+                )
+
+            # Every instance of a wing (e.g. each boom's tail) is the same mesh, translated
+            points, faces = wing.mesh_thin_surface(
+                method="quad",
+                chordwise_resolution=self.chordwise_resolution,
+                chordwise_spacing_function=self.chordwise_spacing_function,
+                add_camber=True,
+            )
+            for vertices, corner in zip(
+                [
+                    front_left_vertices,
+                    back_left_vertices,
+                    back_right_vertices,
+                    front_right_vertices,
+                ],
+                range(4),
+            ):
+                vertices.append(
+                    (points[faces[:, corner], :] + offsets[:, None, :]).reshape(-1, 3)
+                )
+            is_trailing_edge.append(
+                np.tile(
+                    (np.arange(len(faces)) + 1) % self.chordwise_resolution == 0,
+                    len(offsets),
+                )
+            )
+
+        front_left_vertices = np.concatenate(front_left_vertices)
+        back_left_vertices = np.concatenate(back_left_vertices)
+        back_right_vertices = np.concatenate(back_right_vertices)
+        front_right_vertices = np.concatenate(front_right_vertices)
+        is_trailing_edge = np.concatenate(is_trailing_edge)
+
+        ### Compute panel statistics
+        diag1 = front_right_vertices - back_left_vertices
+        diag2 = front_left_vertices - back_right_vertices
+        cross = np.cross(diag1, diag2)
+        cross_norm = np.linalg.norm(cross, axis=1)
+        normal_directions = cross / tall(cross_norm)
+        areas = cross_norm / 2
+
+        # Compute the location of points of interest on each panel
+        left_vortex_vertices = 0.75 * front_left_vertices + 0.25 * back_left_vertices
+        right_vortex_vertices = 0.75 * front_right_vertices + 0.25 * back_right_vertices
+        vortex_centers = (left_vortex_vertices + right_vortex_vertices) / 2
+        vortex_bound_leg = right_vortex_vertices - left_vortex_vertices
+        collocation_points = 0.5 * (
+            0.25 * front_left_vertices + 0.75 * back_left_vertices
+        ) + 0.5 * (0.25 * front_right_vertices + 0.75 * back_right_vertices)
+
+        ### Save things to the instance for later access
+        self.front_left_vertices = front_left_vertices
+        self.back_left_vertices = back_left_vertices
+        self.back_right_vertices = back_right_vertices
+        self.front_right_vertices = front_right_vertices
+        self.is_trailing_edge = is_trailing_edge
+        self.normal_directions = normal_directions
+        self.areas = areas
+        self.left_vortex_vertices = left_vortex_vertices
+        self.right_vortex_vertices = right_vortex_vertices
+        self.vortex_centers = vortex_centers
+        self.vortex_bound_leg = vortex_bound_leg
+        self.collocation_points = collocation_points
+
+        self.symmetry = (
+            mirror_panels(left_vortex_vertices, right_vortex_vertices)
+            if self.exploit_symmetry and is_symmetric(self.op_point)
+            else None
+        )
+        self._assemble()
+
+    def _assemble(self) -> None:
+        # Assembles and factors the AIC matrix of the mesh (only for the unknowns left by `self.symmetry`, if set),
+        # or looks it up in the session store
+        n_panels = len(self.vortex_centers)
+        if self.symmetry is None:
+            self.unknowns = np.arange(n_panels)
+        else:
+            images, signs = self.symmetry
+            self.unknowns = np.flatnonzero(
+                (images > np.arange(n_panels))
+                | ((images == np.arange(n_panels)) & (signs > 0))
+            )  # The first panel of each mirror pair, and panels that are their own image with a nonzero strength
+        rows = self.unknowns
+
+        ### Reuse the factorization for this exact mesh, if any process has made it already
+        session_key = hashlib.sha256(
+            b"".join(
+                np.ascontiguousarray(array, dtype=float).tobytes()
+                for array in [
+                    self.front_left_vertices,
+                    self.back_left_vertices,
+                    self.back_right_vertices,
+                    self.front_right_vertices,
+                    np.atleast_1d(self.vortex_core_radius),
+                ]
+            )
+            + (b"symmetric" if self.symmetry is not None else b"")
+        ).hexdigest()
+        session = get_session_store().get(session_key)
+        if session is not None:
+            self.AIC_lu, self.center_influences = session
+            self.is_factored = True
+            return
+
+        ##### Setup Geometry
+        ### Calculate AIC matrix
+        if self.verbose:
+            print("Calculating the collocation influence matrix...")
+
+        def unit_induced_velocities(field_points):
+            return calculate_induced_velocity_horseshoe(
+                x_field=tall(field_points[:, 0]),
+                y_field=tall(field_points[:, 1]),
+                z_field=tall(field_points[:, 2]),
+                x_left=wide(self.left_vortex_vertices[:, 0]),
+                y_left=wide(self.left_vortex_vertices[:, 1]),
+                z_left=wide(self.left_vortex_vertices[:, 2]),
+                x_right=wide(self.right_vortex_vertices[:, 0]),
+                y_right=wide(self.right_vortex_vertices[:, 1]),
+                z_right=wide(self.right_vortex_vertices[:, 2]),
+                trailing_vortex_direction=np.array([1, 0, 0]),
+                gamma=1.0,
+                vortex_core_radius=self.vortex_core_radius,
+            )
+
+        u_collocations_unit, v_collocations_unit, w_collocations_unit = (
+            unit_induced_velocities(self.collocation_points[rows])
+        )
+
+        AIC = (
+            u_collocations_unit * tall(self.normal_directions[rows, 0])
+            + v_collocations_unit * tall(self.normal_directions[rows, 1])
+            + w_collocations_unit * tall(self.normal_directions[rows, 2])
+        )
+
+        if self.symmetry is not None:
+            # Fold each mirror image's column onto its pair's (with the image's strength being `sign` times the
+            # pair's); fins on the centerline have no strength, so their columns drop out
+            images, signs = self.symmetry
+            AIC = AIC[:, rows] + AIC[:, images[rows]] * np.where(
+                images[rows] != rows, signs[rows], 0
+            )
+
+        if self.verbose:
+            print("Factoring the influence matrix...")
+
+        self.AIC_lu = linalg.lu_factor(AIC)
+
+        # Influence of panel j's (unit) vortex strength on the velocity at the vortex center of each unknown's panel
+        self.center_influences = np.stack(
+            unit_induced_velocities(self.vortex_centers[rows]), axis=0
+        )  # 3 x (unknowns) x N
+
+        get_session_store().set(session_key, (self.AIC_lu, self.center_influences))
+        self.is_factored = True
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Computes the aerodynamic forces at `self.op_point`. Returns the same dictionary as VortexLatticeMethod.run(),
+        and leaves the same attributes on the instance (so that `draw()` works as usual).
+        """
+        sweep = self.run_sweep([self.op_point])
+
+        ### Save things to the instance for later access
+        for name in [
+            "steady_freestream_velocity",
+            "steady_freestream_direction",
+            "freestream_velocities",
+            "vortex_strengths",
+            "forces_geometry",
+            "moments_geometry",
+        ]:
+            setattr(self, name, sweep.pop(name)[0])
+
+        output = {key: value[0] for key, value in sweep.items()}
+
+        self.force_geometry = output["F_g"]
+        self.force_body = output["F_b"]
+        self.force_wind = output["F_w"]
+        self.moment_geometry = output["M_g"]
+        self.moment_body = output["M_b"]
+        self.moment_wind = output["M_w"]
+
+        return output
+
+    def run_sweep(self, op_points: List[asb.OperatingPoint]) -> Dict[str, Any]:
+        """
+        Computes the aerodynamic forces at many operating points of the same geometry at once: one multi-right-hand-
+        side back-substitution and one batched matrix product, rather than one full solve per point.
+
+        Returns a dictionary with the same keys as run(), where each value is a length-M array (or list) holding
+        one entry per operating point. Per-panel quantities (vortex strengths, panel forces) are included too.
+        """
+        if not self.is_factored:
+            self.factor()
+        if self.symmetry is not None and not all(map(is_symmetric, op_points)):
+            self.symmetry = None
+            self._assemble()
+
+        if self.verbose:
+            print("Calculating the freestream influence...")
+
+        steady_freestream_velocities = np.stack(
+            [op_point.compute_freestream_velocity_geometry_axes() for op_point in op_points]
+        )  # M x 3
+        steady_freestream_directions = steady_freestream_velocities / tall(
+            np.linalg.norm(steady_freestream_velocities, axis=1)
+        )
+        freestream_velocities = np.stack(
+            [
+                np.add(
+                    wide(steady_freestream_velocity),
+                    op_point.compute_rotation_velocity_geometry_axes(
+                        self.collocation_points
+                    ),
+                )
+                for op_point, steady_freestream_velocity in zip(
+                    op_points, steady_freestream_velocities
+                )
+            ]
+        )  # M x N x 3
+
+        freestream_influences = np.einsum(
+            "mnk,nk->nm", freestream_velocities, self.normal_directions
+        )  # N x M
+
+        ##### Calculate Vortex Strengths
+        if self.verbose:
+            print("Calculating vortex strengths...")
+
+        rows = self.unknowns
+        solved_strengths = linalg.lu_solve(
+            self.AIC_lu, -freestream_influences[rows]
+        ).T  # M x (unknowns)
+        vortex_strengths = np.zeros((len(op_points), len(self.vortex_centers)))  # M x N
+        if self.symmetry is not None:
+            images, signs = self.symmetry
+            vortex_strengths[:, images[rows]] = solved_strengths * signs[rows]
+        vortex_strengths[:, rows] = solved_strengths
+
+        ##### Calculate forces
+        if self.verbose:
+            print("Calculating forces on each panel...")
+        # Velocity at the center of each bound leg: induced + freestream (+ rotation)
+        V_induced = np.zeros((len(op_points), len(self.vortex_centers), 3))  # M x N x 3
+        solved_V_induced = np.einsum(
+            "kij,mj->mik", self.center_influences, vortex_strengths
+        )
+        if self.symmetry is not None:
+            # The flow is symmetric too: the velocity at a panel's image is its mirror image
+            V_induced[:, images[rows]] = solved_V_induced * np.array([1, -1, 1])
+        V_induced[:, rows] = solved_V_induced
+        V_centers = V_induced + np.stack(
+            [
+                np.add(
+                    wide(steady_freestream_velocity),
+                    op_point.compute_rotation_velocity_geometry_axes(
+                        self.vortex_centers
+                    ),
+                )
+                for op_point, steady_freestream_velocity in zip(
+                    op_points, steady_freestream_velocities
+                )
+            ]
+        )
+
+        Vi_cross_li = np.cross(V_centers, self.vortex_bound_leg[None, :, :], axis=2)
+
+        densities = np.array(
+            [op_point.atmosphere.density() for op_point in op_points]
+        )
+        forces_geometry = (
+            densities[:, None, None] * Vi_cross_li * vortex_strengths[:, :, None]
+        )  # M x N x 3
+        moments_geometry = np.cross(
+            (self.vortex_centers - wide(np.array(self.xyz_ref)))[None, :, :],
+            forces_geometry,
+            axis=2,
+        )
+
+        # Calculate total forces and moments
+        force_geometry = np.sum(forces_geometry, axis=1)  # M x 3
+        moment_geometry = np.sum(moments_geometry, axis=1)
+
+        output = {
+            key: []
+            for key in [
+                "F_g", "F_b", "F_w", "M_g", "M_b", "M_w",
+                "L", "D", "Y", "l_b", "m_b", "n_b",
+                "CL", "CD", "CY", "Cl", "Cm", "Cn",
+            ]
+        }  # fmt: skip
+
+        for op_point, F_g, M_g in zip(op_points, force_geometry, moment_geometry):
+            F_b = op_point.convert_axes(*F_g, from_axes="geometry", to_axes="body")
+            F_w = op_point.convert_axes(*F_b, from_axes="body", to_axes="wind")
+            M_b = op_point.convert_axes(*M_g, from_axes="geometry", to_axes="body")
+            M_w = op_point.convert_axes(*M_b, from_axes="body", to_axes="wind")
+
+            # Calculate dimensional forces
+            L = -F_w[2]
+            D = -F_w[0]
+            Y = F_w[1]
+            l_b = M_b[0]
+            m_b = M_b[1]
+            n_b = M_b[2]
+
+            # Calculate nondimensional forces
+            q = op_point.dynamic_pressure()
+            s_ref = self.airplane.s_ref
+            b_ref = self.airplane.b_ref
+            c_ref = self.airplane.c_ref
+
+            for key, value in {
+                "F_g": F_g,
+                "F_b": F_b,
+                "F_w": F_w,
+                "M_g": M_g,
+                "M_b": M_b,
+                "M_w": M_w,
+                "L": L,
+                "D": D,
+                "Y": Y,
+                "l_b": l_b,
+                "m_b": m_b,
+                "n_b": n_b,
+                "CL": L / q / s_ref,
+                "CD": D / q / s_ref,
+                "CY": Y / q / s_ref,
+                "Cl": l_b / q / s_ref / b_ref,
+                "Cm": m_b / q / s_ref / c_ref,
+                "Cn": n_b / q / s_ref / b_ref,
+            }.items():
+                output[key].append(value)
+
+        for key in ["L", "D", "Y", "l_b", "m_b", "n_b", "CL", "CD", "CY", "Cl", "Cm", "Cn"]:
+            output[key] = np.array(output[key])
+
+        output["steady_freestream_velocity"] = steady_freestream_velocities
+        output["steady_freestream_direction"] = steady_freestream_directions
+        output["freestream_velocities"] = freestream_velocities
+        output["vortex_strengths"] = vortex_strengths
+        output["forces_geometry"] = forces_geometry
+        output["moments_geometry"] = moments_geometry
+
+        return output